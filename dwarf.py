@@ -21,10 +21,887 @@
 
 import os
 import sys
+import struct
+import bisect
+import marshal
+import gc
+from concurrent.futures import ProcessPoolExecutor
+
+from elf import ElfReader
+from elfstats import stats
+from dwarfconst import *
 
 class DwarfError(Exception):
 	pass
 
+# ==============================================================================
+#
+# LEB128 decoding
+# Both functions return a tuple  value, pos  where pos is the position after the encoded number
+#
+def ReadULEB128(buf, pos):
+	result = 0
+	shift = 0
+	while True:
+		b = buf[pos]
+		pos = pos + 1
+		result = result | ((b & 0x7f) << shift)
+		if b < 0x80:
+			return result, pos
+		shift = shift + 7
+
+def ReadSLEB128(buf, pos):
+	result = 0
+	shift = 0
+	while True:
+		b = buf[pos]
+		pos = pos + 1
+		result = result | ((b & 0x7f) << shift)
+		shift = shift + 7
+		if b < 0x80:
+			if b & 0x40:
+				result = result - (1 << shift)
+			return result, pos
+
+# Attributes that DwarfReader.DecodeSpecial() has to look at
+specialAttrs = ('DW_AT_name', 'DW_AT_const_value', 'DW_AT_location', 'DW_AT_data_member_location')
+
+# ==============================================================================
+#
+# Attribute layouts
+# A DwarfObject stores its attribute values in a tuple. The names are in a layout: a dictionary
+# name --> position in the tuple, which also holds the tuple of names. There is one layout per distinct
+# list of names, shared by all the objects that have the same attributes (typically all the DIEs made
+# from one abbreviation), so an object costs a tuple of values instead of a dictionary of its own.
+#
+class DwarfAttrLayout(dict):
+	__slots__ = ('names',)
+
+attrLayouts = {}		# Tuple of names --> DwarfAttrLayout
+
+# Return the shared layout for a tuple of attribute names
+#
+def GetAttrLayout(names):
+	try:
+		return attrLayouts[names]
+	except KeyError:
+		pass
+	names = tuple([sys.intern(n) for n in names])
+	layout = DwarfAttrLayout()
+	layout.names = names
+	for i in range(len(names)):
+		layout[names[i]] = i
+	attrLayouts[names] = layout
+	return layout
+
+emptyLayout = GetAttrLayout(())
+
+# ==============================================================================
+#
+# Type descriptors
+# The kinds of type that end a walk along the DW_AT_type chain, and the qualifiers on the way
+#
+typeKinds = {
+	'DW_TAG_pointer_type': 'pointer', 'DW_TAG_reference_type': 'pointer',
+	'DW_TAG_rvalue_reference_type': 'pointer', 'DW_TAG_ptr_to_member_type': 'pointer',
+	'DW_TAG_structure_type': 'struct', 'DW_TAG_class_type': 'struct', 'DW_TAG_union_type': 'union',
+	'DW_TAG_enumeration_type': 'enum', 'DW_TAG_array_type': 'array', 'DW_TAG_base_type': 'base',
+	'DW_TAG_unspecified_type': 'base', 'DW_TAG_subroutine_type': 'function', 'DW_TAG_subprogram': 'function'
+}
+typeQualifiers = {
+	'DW_TAG_const_type': 'const', 'DW_TAG_volatile_type': 'volatile', 'DW_TAG_restrict_type': 'restrict',
+	'DW_TAG_atomic_type': 'atomic', 'DW_TAG_immutable_type': 'immutable', 'DW_TAG_packed_type': 'packed',
+	'DW_TAG_shared_type': 'shared'
+}
+
+# DwarfTypeInfo - what the DW_AT_type chain of an object resolves to
+# Made by DwarfObject.GetTypeInfo() from the object and the descriptor of its DW_AT_type target, and kept
+# in the object, so each chain is walked once however often it is asked about.
+#
+class DwarfTypeInfo:
+	__slots__ = ('kind', 'qualifiers', 'bytesize', 'count', 'base', 'target',
+					'ispointer', 'iscomposite', 'isenum', 'arrayelements', 'enummap')
+
+	def __init__(self):
+		self.kind = 'void'			# pointer, struct, union, enum, array, base, function; void if none
+		self.qualifiers = ()		# const, volatile, ... between the object and the base
+		self.bytesize = None		# Size of the type in bytes, if known
+		self.count = None			# No. of elements for an array (first dimension)
+		self.base = None			# The object that determines the kind
+		self.target = None			# The object that DW_AT_type refers to
+		self.ispointer = False		# The results of the DwarfObject predicates
+		self.iscomposite = False
+		self.isenum = False
+		self.arrayelements = -1
+		self.enummap = None			# DwarfEnumMap of an enumeration type, made on first use
+
+voidTypeInfo = DwarfTypeInfo()
+
+# DwarfEnumMap - the enumerators of an enumeration type, with maps in both directions
+# If two enumerators have the same value, the first one names the value.
+#
+class DwarfEnumMap:
+	__slots__ = ('enumerators', 'names', 'values')
+
+	def __init__(self, enumtype):
+		self.enumerators = []		# The enumerator objects, in order
+		self.names = {}				# Value --> name
+		self.values = {}			# Name --> value
+		for c in enumtype.children:
+			if c.GetTag() == 'DW_TAG_enumerator':
+				self.enumerators.append(c)
+				self.names.setdefault(c.GetValue(), c.name)
+				self.values.setdefault(c.name, c.GetValue())
+
+# ==============================================================================
+#
+# Structural signatures of types, for DwarfFile.UnifyTypes()
+#
+unifyTags = set(typeQualifiers.keys()) | set(typeKinds.keys()) | set(['DW_TAG_typedef'])
+unifyTags.discard('DW_TAG_subprogram')
+
+# Attributes that refer to other objects; the signature uses the signature of the target instead
+refAttrs = ('DW_AT_type', 'DW_AT_containing_type', 'DW_AT_specification', 'DW_AT_abstract_origin')
+
+# Attributes that differ between units for the same type: the file number is an index into the unit's
+# own file table, and the sibling is an offset
+ignoredAttrs = ('DW_AT_decl_file', 'DW_AT_sibling')
+
+# DwarfTypeSignatures - numbers types by structure
+# Two objects get the same number if they have the same tag and attributes, their children have the
+# same numbers and their references lead to objects with the same numbers. A reference back to an object
+# whose signature is still being worked out (a struct that contains a pointer to itself) is recorded as
+# the distance up the stack, so cycles get the same signature in every unit.
+#
+class DwarfTypeSignatures:
+	def __init__(self):
+		self.numbers = {}			# Signature tuple --> number
+		self.done = {}				# id(object) --> number, for the objects whose number is final
+		self.active = {}			# id(object) --> depth, for the objects being worked on
+
+	# Return the signature number of an object
+	#
+	def Get(self, o):
+		return self.Visit(o)[0]
+
+	# Return a tuple  number, low  where low is the lowest depth of the objects on the stack that the
+	# signature refers back to; None if there are no such references. The number is only final, and
+	# remembered, if the signature doesn't refer to anything above the object.
+	#
+	def Visit(self, o):
+		n = self.done.get(id(o))
+		if n != None:
+			return (n, None)
+		depth = self.active.get(id(o))
+		if depth != None:
+			return (('back', len(self.active) - depth), depth)
+		mydepth = len(self.active)
+		self.active[id(o)] = mydepth
+		low = None
+		items = [o.tag]
+		for (attr, value) in zip(o.attrkeys.names, o.attrvals):
+			if attr in ignoredAttrs:
+				continue
+			if attr in refAttrs:
+				t = o.GetRefTarget(attr)
+				if t == None:
+					value = None
+				else:
+					(value, l) = self.Visit(t)
+					if l != None and (low == None or l < low):
+						low = l
+			items.append((attr, value))
+		for c in o.children:
+			(value, l) = self.Visit(c)
+			if l != None and (low == None or l < low):
+				low = l
+			items.append(value)
+		del self.active[id(o)]
+		sig = tuple(items)
+		n = self.numbers.get(sig)
+		if n == None:
+			n = len(self.numbers)
+			self.numbers[sig] = n
+		if low != None and low >= mydepth:
+			low = None
+		if low == None:
+			self.done[id(o)] = n
+		return (n, low)
+
+# ==============================================================================
+#
+# DwarfUnit - the header of one unit in .debug_info
+# All offsets are relative to the start of .debug_info
+#
+class DwarfUnit:
+	def __init__(self, offset):
+		self.offset = offset		# Offset of the unit header
+		self.end = offset			# Offset of the first byte after the unit
+		self.dieoffset = offset		# Offset of the first DIE
+		self.offsize = 4			# 4 for 32-bit DWARF, 8 for 64-bit DWARF
+		self.version = 0
+		self.unittype = DW_UT_compile
+		self.addrsize = 0
+		self.abbrevoffset = 0
+		self.stroffsetsbase = None	# From DW_AT_str_offsets_base in the unit DIE
+		self.addrbase = None		# From DW_AT_addr_base in the unit DIE
+
+# ==============================================================================
+#
+# DwarfReader - decode .debug_info directly from the ELF file
+#
+# Handles DWARF versions 2 to 5. The sections are used in place in the mapped file.
+# Each section is held as a tuple  buf, start, size  (see ElfReader.GetSectionData)
+#
+class DwarfReader:
+	def __init__(self, elffilename):
+		er = ElfReader(elffilename)
+		self.elffilename = elffilename
+		self.byteorder = er.endian
+		self.info = er.GetSectionData('.debug_info')
+		self.abbrev = er.GetSectionData('.debug_abbrev')
+		self.str = er.GetSectionData('.debug_str')
+		self.linestr = er.GetSectionData('.debug_line_str')
+		self.stroffsets = er.GetSectionData('.debug_str_offsets')
+		self.addr = er.GetSectionData('.debug_addr')
+		self.aranges = er.GetSectionData('.debug_aranges')
+		self.names = er.GetSectionData('.debug_names')
+		self.pubs = []			# (section, gnu) for each of the pubnames/pubtypes sections that exist
+		for (name, gnu) in [ ('.debug_pubnames', False), ('.debug_pubtypes', False),
+							 ('.debug_gnu_pubnames', True), ('.debug_gnu_pubtypes', True) ]:
+			sect = er.GetSectionData(name)
+			if sect != None:
+				self.pubs.append((sect, gnu))
+		self.abbrevs = {}		# Abbreviation tables, by offset in .debug_abbrev
+		self.compiled = {}		# Compiled abbreviation tables, by (offset, offsize, addrsize)
+		self.strcache = {}		# Strings from .debug_str, by offset. Shares each string between all its uses
+		if self.byteorder == 'little':
+			self.bo = '<'
+		else:
+			self.bo = '>'
+
+	# Read an unsigned integer of n bytes from a section
+	#
+	def ReadInt(self, sect, offset, n):
+		(buf, start, size) = sect
+		return int.from_bytes(buf[start+offset:start+offset+n], self.byteorder)
+
+	# Read a 0-terminated string from a section
+	#
+	def ReadString(self, sect, offset):
+		if sect is None:
+			raise DwarfError(self.elffilename + ': string refers to a missing section')
+		(buf, start, size) = sect
+		pos = start + offset
+		end = buf.find(b'\0', pos, start + size)
+		if end < 0:
+			end = start + size
+		return buf[pos:end].decode('utf-8', 'replace')
+
+	# Return a string from .debug_str
+	#
+	def ReadStrp(self, offset):
+		try:
+			return self.strcache[offset]
+		except KeyError:
+			s = self.ReadString(self.str, offset)
+			self.strcache[offset] = s
+			return s
+
+	# Return a string from .debug_str via the unit's string offsets table
+	#
+	def ReadIndexedString(self, unit, idx):
+		base = unit.stroffsetsbase
+		if base == None:
+			base = 2 * unit.offsize			# Just after the table header
+		return self.ReadStrp(self.ReadInt(self.stroffsets, base + idx * unit.offsize, unit.offsize))
+
+	# Return an address from .debug_addr via the unit's address table
+	#
+	def ReadIndexedAddress(self, unit, idx):
+		base = unit.addrbase
+		if base == None:
+			base = 8						# Just after the table header
+		return self.ReadInt(self.addr, base + idx * unit.addrsize, unit.addrsize)
+
+	# Return a list of the unit headers in .debug_info
+	#
+	def ReadUnitHeaders(self):
+		units = []
+		if self.info is None:
+			return units
+		(buf, start, size) = self.info
+		pos = 0
+		while pos + 11 <= size:
+			u = DwarfUnit(pos)
+			length = self.ReadInt(self.info, pos, 4)
+			p = pos + 4
+			if length == 0xffffffff:
+				length = self.ReadInt(self.info, p, 8)
+				p = p + 8
+				u.offsize = 8
+			u.end = p + length
+			u.version = self.ReadInt(self.info, p, 2)
+			p = p + 2
+			if u.version >= 5:
+				u.unittype = buf[start+p]
+				u.addrsize = buf[start+p+1]
+				u.abbrevoffset = self.ReadInt(self.info, p+2, u.offsize)
+				p = p + 2 + u.offsize
+				if u.unittype == DW_UT_skeleton or u.unittype == DW_UT_split_compile:
+					p = p + 8					# dwo_id
+				elif u.unittype == DW_UT_type or u.unittype == DW_UT_split_type:
+					p = p + 8 + u.offsize		# type_signature, type_offset
+			elif u.version >= 2:
+				u.abbrevoffset = self.ReadInt(self.info, p, u.offsize)
+				u.addrsize = buf[start+p+u.offsize]
+				p = p + u.offsize + 1
+			else:
+				raise DwarfError(self.elffilename + ': unsupported DWARF version ' + str(u.version) +
+									' at .debug_info offset ' + hex(pos))
+			u.dieoffset = p
+			units.append(u)
+			pos = u.end
+		return units
+
+	# Read the initial length of a unit in an index section
+	# Returns a tuple  length, offsize, pos  where pos is the offset after the length
+	#
+	def ReadUnitLength(self, sect, pos):
+		length = self.ReadInt(sect, pos, 4)
+		if length == 0xffffffff:
+			return self.ReadInt(sect, pos + 4, 8), 8, pos + 12
+		return length, 4, pos + 4
+
+	# Read .debug_aranges
+	# Returns a list of tuples  low, high, unitoffset  sorted by low address. high is exclusive.
+	#
+	def ReadAranges(self):
+		ranges = []
+		if self.aranges is None:
+			return ranges
+		(buf, start, size) = self.aranges
+		pos = 0
+		while pos + 16 <= size:
+			length, offsize, p = self.ReadUnitLength(self.aranges, pos)
+			end = p + length
+			unitoffset = self.ReadInt(self.aranges, p + 2, offsize)
+			addrsize = buf[start + p + 2 + offsize]
+			segsize = buf[start + p + 3 + offsize]
+			p = p + 4 + offsize
+			tuplesize = segsize + 2 * addrsize
+			if addrsize == 0 or tuplesize == 0:
+				pos = end
+				continue
+			p = pos + ((p - pos + tuplesize - 1) // tuplesize) * tuplesize		# Tuples are aligned
+			while p + tuplesize <= end:
+				low = self.ReadInt(self.aranges, p + segsize, addrsize)
+				n = self.ReadInt(self.aranges, p + segsize + addrsize, addrsize)
+				p = p + tuplesize
+				if low == 0 and n == 0:
+					break
+				ranges.append((low, low + n, unitoffset))
+			pos = end
+		ranges.sort()
+		return ranges
+
+	# Read the .debug_pubnames, .debug_pubtypes and the GNU variants of them
+	# Returns a dictionary: name --> set of unit offsets
+	#
+	def ReadPubnames(self, index):
+		for (sect, gnu) in self.pubs:
+			(buf, start, size) = sect
+			pos = 0
+			while pos + 14 <= size:
+				length, offsize, p = self.ReadUnitLength(sect, pos)
+				end = p + length
+				unitoffset = self.ReadInt(sect, p + 2, offsize)
+				p = p + 2 + 2 * offsize
+				while p + offsize <= end:
+					dieoffset = self.ReadInt(sect, p, offsize)
+					p = p + offsize
+					if dieoffset == 0:
+						break
+					if gnu:
+						p = p + 1		# Flags byte
+					name = self.ReadString(sect, p)
+					p = buf.find(b'\0', start + p, start + end) + 1 - start
+					try:
+						index[name].add(unitoffset)
+					except KeyError:
+						index[name] = set([unitoffset])
+				pos = end
+		return index
+
+	# Read .debug_names (DWARF 5 name index)
+	# Adds the names to a dictionary: name --> set of unit offsets
+	#
+	def ReadDebugNames(self, index):
+		if self.names is None:
+			return index
+		sect = self.names
+		(buf, start, size) = sect
+		pos = 0
+		while pos + 36 <= size:
+			length, offsize, p = self.ReadUnitLength(sect, pos)
+			end = p + length
+			(cucount, ltucount, ftucount, bucketcount, namecount, abbrevsize, augsize) = \
+				[self.ReadInt(sect, p + 4 + 4*i, 4) for i in range(7)]
+			p = p + 32 + ((augsize + 3) & ~3)
+			cus = [self.ReadInt(sect, p + offsize*i, offsize) for i in range(cucount)]
+			p = p + offsize * (cucount + ltucount) + 8 * ftucount
+			p = p + 4 * bucketcount
+			if bucketcount > 0:
+				p = p + 4 * namecount
+			stroffs = p
+			entryoffs = p + offsize * namecount
+			abbrevstart = entryoffs + offsize * namecount
+			pool = abbrevstart + abbrevsize
+
+			# The abbreviation table: code --> [(index attribute, form), ...]
+			abbrevs = {}
+			q = start + abbrevstart
+			while True:
+				code, q = ReadULEB128(buf, q)
+				if code == 0:
+					break
+				tag, q = ReadULEB128(buf, q)
+				specs = []
+				while True:
+					idx, q = ReadULEB128(buf, q)
+					form, q = ReadULEB128(buf, q)
+					if idx == 0 and form == 0:
+						break
+					specs.append((idx, form))
+				abbrevs[code] = specs
+
+			for i in range(namecount):
+				name = self.ReadStrp(self.ReadInt(sect, stroffs + offsize*i, offsize))
+				q = start + pool + self.ReadInt(sect, entryoffs + offsize*i, offsize)
+				while True:
+					code, q = ReadULEB128(buf, q)
+					if code == 0 or code not in abbrevs:
+						break
+					cu = None
+					tu = None
+					for (idx, form) in abbrevs[code]:
+						if form == DW_FORM_flag_present:
+							v = 1
+						elif form == DW_FORM_udata or form == DW_FORM_ref_udata:
+							v, q = ReadULEB128(buf, q)
+						elif form == DW_FORM_data1 or form == DW_FORM_ref1 or form == DW_FORM_flag:
+							v = buf[q]
+							q = q + 1
+						elif form == DW_FORM_data2 or form == DW_FORM_ref2:
+							v = int.from_bytes(buf[q:q+2], self.byteorder)
+							q = q + 2
+						elif form == DW_FORM_data4 or form == DW_FORM_ref4:
+							v = int.from_bytes(buf[q:q+4], self.byteorder)
+							q = q + 4
+						elif form == DW_FORM_data8 or form == DW_FORM_ref8 or form == DW_FORM_ref_sig8:
+							v = int.from_bytes(buf[q:q+8], self.byteorder)
+							q = q + 8
+						else:
+							raise DwarfError(self.elffilename + ': unsupported form ' + hex(form) + ' in .debug_names')
+						if idx == DW_IDX_compile_unit:
+							cu = v
+						elif idx == DW_IDX_type_unit:
+							tu = v
+					if cu == None and tu == None and cucount == 1:
+						cu = 0
+					if cu != None and cu < cucount:
+						try:
+							index[name].add(cus[cu])
+						except KeyError:
+							index[name] = set([cus[cu]])
+			pos = end
+		return index
+
+	# Return the abbreviation table at the given offset in .debug_abbrev
+	# The table is a dictionary: code --> (tagname, haschildren, [(attrname, form, implicitconst, special), ...])
+	# special is True for the attributes that need more than storing in the attribute dictionary.
+	#
+	def GetAbbrevs(self, offset):
+		try:
+			return self.abbrevs[offset]
+		except KeyError:
+			pass
+		(buf, start, size) = self.abbrev
+		table = {}
+		pos = start + offset
+		while True:
+			code, pos = ReadULEB128(buf, pos)
+			if code == 0:
+				break
+			tag, pos = ReadULEB128(buf, pos)
+			haschildren = (buf[pos] != 0)
+			pos = pos + 1
+			specs = []
+			while True:
+				attr, pos = ReadULEB128(buf, pos)
+				form, pos = ReadULEB128(buf, pos)
+				implicit = None
+				if form == DW_FORM_implicit_const:
+					implicit, pos = ReadSLEB128(buf, pos)
+				if attr == 0 and form == 0:
+					break
+				try:
+					attrname = attrNames[attr]
+				except KeyError:
+					attrname = 'DW_AT_0x%x' % attr
+				specs.append((attrname, form, implicit, attrname in specialAttrs))
+			try:
+				tagname = tagNames[tag]
+			except KeyError:
+				tagname = 'DW_TAG_0x%x' % tag
+			table[code] = (tagname, haschildren, specs)
+		self.abbrevs[offset] = table
+		return table
+
+	# Return the abbreviation table for a unit, with a fixed-layout decoder added to each entry
+	# The table is a dictionary: code --> (tagname, haschildren, specs, layout, fixed)
+	# If every attribute of an entry has a fixed size, all of them can be decoded with a single
+	# struct.unpack_from(). fixed is then a tuple  struct, layout, strpidx, linestrpidx, refidx, consts
+	# where layout holds the attribute names for the unpacked values followed by the names of the values
+	# that are stored in the abbreviation itself (consts), and the idx lists say which of the values are
+	# string offsets or unit-relative references. Otherwise fixed is None.
+	# layout is the attribute layout for the entry either way.
+	#
+	def GetCompiledAbbrevs(self, unit):
+		key = (unit.abbrevoffset, unit.offsize, unit.addrsize)
+		try:
+			return self.compiled[key]
+		except KeyError:
+			pass
+		if unit.offsize == 8:
+			ofmt = 'Q'
+		else:
+			ofmt = 'I'
+		if unit.addrsize == 8:
+			afmt = 'Q'
+		elif unit.addrsize == 4:
+			afmt = 'I'
+		elif unit.addrsize == 2:
+			afmt = 'H'
+		else:
+			afmt = None
+		formats = {
+			DW_FORM_data1: 'B', DW_FORM_flag: 'B', DW_FORM_ref1: 'B', DW_FORM_data2: 'H', DW_FORM_ref2: 'H',
+			DW_FORM_data4: 'I', DW_FORM_ref4: 'I', DW_FORM_data8: 'Q', DW_FORM_ref8: 'Q',
+			DW_FORM_strp: ofmt, DW_FORM_line_strp: ofmt, DW_FORM_sec_offset: ofmt, DW_FORM_addr: afmt
+		}
+		table = {}
+		for (code, (tag, haschildren, specs)) in self.GetAbbrevs(unit.abbrevoffset).items():
+			layout = GetAttrLayout(tuple([s[0] for s in specs]))
+			fmt = ''
+			names = []
+			strpidx = []
+			linestrpidx = []
+			refidx = []
+			consts = {}
+			for (attr, form, implicit, special) in specs:
+				if form == DW_FORM_implicit_const:
+					consts[attr] = implicit
+					continue
+				if form == DW_FORM_flag_present:
+					consts[attr] = 1
+					continue
+				f = formats.get(form)
+				if f == None or attr in consts or attr in names:
+					fmt = None
+					break
+				if form == DW_FORM_strp:
+					strpidx.append(len(names))
+				elif form == DW_FORM_line_strp:
+					linestrpidx.append(len(names))
+				elif form in (DW_FORM_ref1, DW_FORM_ref2, DW_FORM_ref4, DW_FORM_ref8):
+					refidx.append(len(names))
+				names.append(attr)
+				fmt = fmt + f
+			fixed = None
+			if fmt != None:
+				fixed = (struct.Struct(self.bo + fmt), GetAttrLayout(tuple(names) + tuple(consts.keys())),
+							strpidx, linestrpidx, refidx, tuple(consts.values()))
+			table[code] = (tag, haschildren, specs, layout, fixed)
+		self.compiled[key] = table
+		return table
+
+	# Decode one attribute value of the given form at pos in .debug_info
+	# Returns a tuple  value, pos
+	# Strings and references are resolved. Indexed strings and addresses (strx, addrx) are returned as
+	# the index because the table bases might not be known yet; see ResolveIndexed().
+	#
+	def ReadForm(self, unit, form, implicit, buf, pos):
+		bo = self.byteorder
+		if form == DW_FORM_strp:
+			off = int.from_bytes(buf[pos:pos+unit.offsize], bo)
+			return self.ReadStrp(off), pos + unit.offsize
+		if form == DW_FORM_line_strp:
+			off = int.from_bytes(buf[pos:pos+unit.offsize], bo)
+			return self.ReadString(self.linestr, off), pos + unit.offsize
+		if form == DW_FORM_data1 or form == DW_FORM_flag:
+			return buf[pos], pos + 1
+		if form == DW_FORM_ref4:
+			return unit.offset + int.from_bytes(buf[pos:pos+4], bo), pos + 4
+		if form == DW_FORM_data2:
+			return int.from_bytes(buf[pos:pos+2], bo), pos + 2
+		if form == DW_FORM_data4:
+			return int.from_bytes(buf[pos:pos+4], bo), pos + 4
+		if form == DW_FORM_implicit_const:
+			return implicit, pos
+		if form == DW_FORM_flag_present:
+			return 1, pos
+		if form == DW_FORM_exprloc or form == DW_FORM_block:
+			n, pos = ReadULEB128(buf, pos)
+			return bytes(buf[pos:pos+n]), pos + n
+		if form == DW_FORM_addr:
+			return int.from_bytes(buf[pos:pos+unit.addrsize], bo), pos + unit.addrsize
+		if form == DW_FORM_sec_offset:
+			return int.from_bytes(buf[pos:pos+unit.offsize], bo), pos + unit.offsize
+		if form == DW_FORM_data8:
+			return int.from_bytes(buf[pos:pos+8], bo), pos + 8
+		if form == DW_FORM_data16:
+			return int.from_bytes(buf[pos:pos+16], bo), pos + 16
+		if form == DW_FORM_string:
+			end = buf.find(b'\0', pos)
+			return buf[pos:end].decode('utf-8', 'replace'), end + 1
+		if form == DW_FORM_udata:
+			return ReadULEB128(buf, pos)
+		if form == DW_FORM_sdata:
+			return ReadSLEB128(buf, pos)
+		if form == DW_FORM_ref1:
+			return unit.offset + buf[pos], pos + 1
+		if form == DW_FORM_ref2:
+			return unit.offset + int.from_bytes(buf[pos:pos+2], bo), pos + 2
+		if form == DW_FORM_ref8:
+			return unit.offset + int.from_bytes(buf[pos:pos+8], bo), pos + 8
+		if form == DW_FORM_ref_udata:
+			v, pos = ReadULEB128(buf, pos)
+			return unit.offset + v, pos
+		if form == DW_FORM_ref_addr:
+			if unit.version <= 2:
+				n = unit.addrsize
+			else:
+				n = unit.offsize
+			return int.from_bytes(buf[pos:pos+n], bo), pos + n
+		if form == DW_FORM_block1:
+			n = buf[pos]
+			return bytes(buf[pos+1:pos+1+n]), pos + 1 + n
+		if form == DW_FORM_block2:
+			n = int.from_bytes(buf[pos:pos+2], bo)
+			return bytes(buf[pos+2:pos+2+n]), pos + 2 + n
+		if form == DW_FORM_block4:
+			n = int.from_bytes(buf[pos:pos+4], bo)
+			return bytes(buf[pos+4:pos+4+n]), pos + 4 + n
+		if form == DW_FORM_strx or form == DW_FORM_addrx or form == DW_FORM_GNU_str_index or \
+				form == DW_FORM_GNU_addr_index or form == DW_FORM_loclistx or form == DW_FORM_rnglistx:
+			return ReadULEB128(buf, pos)
+		if form == DW_FORM_strx1 or form == DW_FORM_addrx1:
+			return buf[pos], pos + 1
+		if form == DW_FORM_strx2 or form == DW_FORM_addrx2:
+			return int.from_bytes(buf[pos:pos+2], bo), pos + 2
+		if form == DW_FORM_strx3 or form == DW_FORM_addrx3:
+			return int.from_bytes(buf[pos:pos+3], bo), pos + 3
+		if form == DW_FORM_strx4 or form == DW_FORM_addrx4:
+			return int.from_bytes(buf[pos:pos+4], bo), pos + 4
+		if form == DW_FORM_ref_sig8:
+			return int.from_bytes(buf[pos:pos+8], bo), pos + 8
+		if form == DW_FORM_strp_sup or form == DW_FORM_ref_sup4 or form == DW_FORM_GNU_ref_alt or \
+				form == DW_FORM_GNU_strp_alt:
+			# Refers to a supplementary file that we don't read; keep the offset
+			return int.from_bytes(buf[pos:pos+unit.offsize], bo), pos + unit.offsize
+		if form == DW_FORM_ref_sup8:
+			return int.from_bytes(buf[pos:pos+8], bo), pos + 8
+		if form == DW_FORM_indirect:
+			form, pos = ReadULEB128(buf, pos)
+			return self.ReadForm(unit, form, implicit, buf, pos)
+		raise DwarfError(self.elffilename + ': unknown attribute form ' + hex(form) +
+							' at .debug_info offset ' + hex(pos - self.info[1]))
+
+	# Resolve an indexed string or address; other values are returned unchanged
+	#
+	def ResolveIndexed(self, unit, form, value):
+		if form == DW_FORM_strx or form == DW_FORM_GNU_str_index or DW_FORM_strx1 <= form <= DW_FORM_strx4:
+			return self.ReadIndexedString(unit, value)
+		if form == DW_FORM_addrx or form == DW_FORM_GNU_addr_index or DW_FORM_addrx1 <= form <= DW_FORM_addrx4:
+			return self.ReadIndexedAddress(unit, value)
+		return value
+
+	# Return the address that a location expression evaluates to, if it is just DW_OP_addr or DW_OP_addrx
+	# Returns None for anything more complicated.
+	#
+	def ExprAddress(self, unit, expr):
+		if len(expr) == 0:
+			return None
+		op = expr[0]
+		if op == DW_OP_addr and len(expr) == 1 + unit.addrsize:
+			return int.from_bytes(expr[1:], self.byteorder)
+		if op == DW_OP_addrx or op == DW_OP_GNU_addr_index:
+			idx, pos = ReadULEB128(expr, 1)
+			if pos == len(expr):
+				return self.ReadIndexedAddress(unit, idx)
+		return None
+
+	# Finish decoding an attribute value and return it
+	# A location that is a plain address becomes the address, which is also the object's value.
+	# A member location that is DW_OP_plus_uconst becomes the offset.
+	# The name and constant value are copied to the object.
+	#
+	def DecodeSpecial(self, unit, o, attr, value):
+		if type(value) is bytes:
+			if attr == 'DW_AT_location':
+				addr = self.ExprAddress(unit, value)
+				if addr != None:
+					value = addr
+					o.value = addr
+			elif attr == 'DW_AT_data_member_location':
+				if len(value) > 0 and value[0] == DW_OP_plus_uconst:
+					v, p = ReadULEB128(value, 1)
+					if p == len(value):
+						value = v
+		o.NoteAttr(attr, value)
+		return value
+
+	# Read a unit and return the tree of DwarfObjects. The top-level object is the unit DIE.
+	#
+	def ReadUnit(self, unit):
+		(buf, start, size) = self.info
+		abbrevs = self.GetCompiledAbbrevs(unit)
+		bo = self.byteorder
+		offsize = unit.offsize
+		pos = start + unit.dieoffset
+		end = start + unit.end
+		top = None
+		parent = None
+		level = 0
+		ndies = 0
+		while pos < end:
+			ident = pos - start
+			code = buf[pos]
+			if code < 0x80:
+				pos = pos + 1
+			else:
+				code, pos = ReadULEB128(buf, pos)
+
+			if code == 0:
+				# End of a list of children (or padding)
+				if parent != None:
+					parent.LinkSpecifications()
+					parent = parent.parent
+					level = level - 1
+				continue
+
+			try:
+				(tag, haschildren, specs, layout, fixed) = abbrevs[code]
+			except KeyError:
+				raise DwarfError(self.elffilename + ': unknown abbreviation code ' + str(code) +
+									' at .debug_info offset ' + hex(ident))
+			o = DwarfObject(parent)
+			o.tag = tag
+			o.level = level
+			o.ident = ident
+			ndies = ndies + 1
+			if fixed != None:
+				# All the attributes in one go
+				(st, layout, strpidx, linestrpidx, refidx, consts) = fixed
+				values = st.unpack_from(buf, pos)
+				pos = pos + st.size
+				if strpidx or linestrpidx or refidx:
+					values = list(values)
+					for i in strpidx:
+						values[i] = self.ReadStrp(values[i])
+					for i in linestrpidx:
+						values[i] = self.ReadString(self.linestr, values[i])
+					for i in refidx:
+						values[i] = values[i] + unit.offset
+					values = tuple(values)
+				if consts:
+					values = values + consts
+				o.attrkeys = layout
+				o.attrvals = values
+				i = layout.get('DW_AT_name')
+				if i != None:
+					o.NoteAttr('DW_AT_name', values[i])
+				i = layout.get('DW_AT_const_value')
+				if i != None:
+					o.value = values[i]
+				indexed = None
+			else:
+				values = []
+				indexed = None
+				for (attr, form, implicit, special) in specs:
+					# The commonest forms are decoded here rather than in ReadForm()
+					if form == DW_FORM_data1:
+						value = buf[pos]
+						pos = pos + 1
+					elif form == DW_FORM_ref4:
+						value = unit.offset + int.from_bytes(buf[pos:pos+4], bo)
+						pos = pos + 4
+					elif form == DW_FORM_implicit_const:
+						value = implicit
+					elif form == DW_FORM_strp or form == DW_FORM_line_strp:
+						off = int.from_bytes(buf[pos:pos+offsize], bo)
+						pos = pos + offsize
+						if form == DW_FORM_strp:
+							value = self.ReadStrp(off)
+						else:
+							value = self.ReadString(self.linestr, off)
+					elif form == DW_FORM_flag_present:
+						value = 1
+					elif form == DW_FORM_data2:
+						value = int.from_bytes(buf[pos:pos+2], bo)
+						pos = pos + 2
+					else:
+						value, pos = self.ReadForm(unit, form, implicit, buf, pos)
+						if (DW_FORM_strx <= form <= DW_FORM_addrx) or form >= DW_FORM_strx1:
+							# Resolved below, when the table bases are known
+							if indexed == None:
+								indexed = []
+							indexed.append((len(values), attr, form, value))
+							values.append(value)
+							continue
+					if special:
+						value = self.DecodeSpecial(unit, o, attr, value)
+					values.append(value)
+				o.attrkeys = layout
+				o.attrvals = values
+
+			if top == None:
+				top = o
+				unit.stroffsetsbase = o.GetAttr('DW_AT_str_offsets_base')
+				unit.addrbase = o.GetAttr('DW_AT_addr_base')
+				if unit.addrbase == None:
+					unit.addrbase = o.GetAttr('DW_AT_GNU_addr_base')
+			if indexed != None:
+				for (i, attr, form, value) in indexed:
+					values[i] = self.DecodeSpecial(unit, o, attr, self.ResolveIndexed(unit, form, value))
+			if fixed == None:
+				o.attrvals = tuple(values)
+
+			if parent != None:
+				parent.AddChild(o)
+			if haschildren:
+				parent = o
+				level = level + 1
+
+		while parent != None:
+			parent.LinkSpecifications()
+			parent = parent.parent
+		if stats.enabled:
+			stats.Count('units parsed')
+			stats.Count('DIEs parsed', ndies)
+		return top
+
+# Parse some units of a file and return them as marshalled DwarfObject.Flatten() lists
+# This is the work that DwarfFile.ReadParallel() gives to each process in the pool.
+#
+def ReadUnitsFlat(elffilename, offsets):
+	dr = DwarfReader(elffilename)
+	units = {}
+	for u in dr.ReadUnitHeaders():
+		units[u.offset] = u
+	return [marshal.dumps(dr.ReadUnit(units[off]).Flatten()) for off in offsets]
+
 # ==============================================================================
 #
 # A class to read and parse the dwarf.info output from readelf
@@ -51,6 +928,8 @@ class DwarfInfo:
 
 			line = line.rstrip()
 			fields = line.split()
+			if len(fields) < 2 or fields[0][0] != '<':
+				continue		# Not a DIE or an attribute, e.g. the unit header
 
 			# There might be no space between the attribute name and the colon.
 			if fields[1][-1] == ':':
@@ -63,6 +942,8 @@ class DwarfInfo:
 					# ':' is a field by itself. Value starts at field 3
 					if fields[3] == '(indirect' and fields[4] == 'string,' and fields[5] == 'offset:':
 						self.value = ' '.join(fields[7:])
+					elif fields[3] == '(indirect' and fields[4] == 'line' and fields[5] == 'string,':
+						self.value = ' '.join(fields[8:])
 					else:
 						self.value = ' '.join(fields[3:])
 					self.type = 'attr'
@@ -96,6 +977,9 @@ class DwarfInfo:
 # Levels 3..9 ... also exist
 #
 class DwarfObject:
+	__slots__ = ('parent', 'tag', 'level', 'ident', 'name', 'basename', 'value', 'specref',
+					'attrkeys', 'attrvals', 'children', 'refs', 'typeinfo')
+
 	def __init__(self, parent):
 		self.parent = parent
 		self.tag = ''
@@ -105,9 +989,11 @@ class DwarfObject:
 		self.basename = ''		# Base filename (for compile units)
 		self.value = None		# Address (for variables), enumeration (for enums)
 		self.specref = None		# The 'definition' DW_TAG_variable object, if any
-		self.attr = {}
-		self.children = []
-		self.refs = {}
+		self.attrkeys = emptyLayout		# Shared DwarfAttrLayout: attribute name --> index in attrvals
+		self.attrvals = ()
+		self.children = ()		# Becomes a list when the first child is added
+		self.refs = None		# Child ident --> index in children. Built on first use
+		self.typeinfo = None	# DwarfTypeInfo. Built on first use
 
 	def GetName(self):
 		return self.name
@@ -142,28 +1028,169 @@ class DwarfObject:
 	# Get an attribute
 	#
 	def GetAttr(self, attrname):
-		try:
-			return self.attr[attrname]
-		except:
+		i = self.attrkeys.get(attrname)
+		if i == None:
 			return None
+		return self.attrvals[i]
+
+	# Return all the attributes as a dictionary
+	#
+	def GetAttrs(self):
+		return dict(zip(self.attrkeys.names, self.attrvals))
+
+	# Set an attribute, adding it if the object doesn't have it yet
+	#
+	def SetAttr(self, attrname, value):
+		i = self.attrkeys.get(attrname)
+		if i == None:
+			self.attrkeys = GetAttrLayout(self.attrkeys.names + (attrname,))
+			self.attrvals = tuple(self.attrvals) + (value,)
+		else:
+			v = list(self.attrvals)
+			v[i] = value
+			self.attrvals = tuple(v)
 
 	# Get a child element, given its reference ID
 	#
 	def GetChildByRef(self, ref):
+		refs = self.refs
+		if refs == None:
+			refs = {}
+			for i in range(len(self.children)):
+				c = self.children[i]
+				if c.ident > 0:
+					refs[c.ident] = i		# Index of the child, starting at 0
+			self.refs = refs
 		try:
-			idx = self.refs[ref]
-			return self.children[idx]
-		except:
+			return self.children[refs[ref]]
+		except (KeyError, TypeError):
 			return None
 
 	# Get number of elements from an 'array_type' object
+	# Returns None if the first dimension has no bound, e.g. for a flexible array member
 	#
 	def GetNElements(self):
 		if self.tag != 'DW_TAG_array_type':
 			return None
 		if len(self.children) <= 0:
 			return None
-		return self.children[0].GetAttr('DW_AT_upper_bound')+1
+		s = self.children[0]
+		n = s.GetAttr('DW_AT_count')
+		if n != None:
+			return n
+		n = s.GetAttr('DW_AT_upper_bound')
+		if type(n) is not int:
+			return None
+		return n+1
+
+	# Return the top-level object of the tree that this object is in
+	#
+	def GetTop(self):
+		o = self
+		while o.parent != None:
+			o = o.parent
+		return o
+
+	# Return the object that DW_AT_type refers to; None if there isn't one
+	#
+	def GetTypeTarget(self):
+		return self.GetRefTarget('DW_AT_type')
+
+	# Return the object that a reference attribute refers to; None if there isn't one
+	# The reference is looked up among the siblings first, then in the top-level object.
+	#
+	def GetRefTarget(self, attrname):
+		ref = self.GetAttr(attrname)
+		if ref == None or self.parent == None:
+			return None
+		t = self.parent.GetChildByRef(ref)
+		if t == None and self.parent.parent != None:
+			t = self.GetTop().GetChildByRef(ref)
+		return t
+
+	# Return the descriptor of the type that this object resolves to
+	# The descriptor is built from the object itself and the descriptor of its DW_AT_type target, so
+	# each object along a chain is only looked at once. The chain is followed to the first object that
+	# already has a descriptor, then the descriptors are built from there back to this object. Each one
+	# is stored only when it is complete, so threads that share the tree never see a partial one; if two
+	# threads build the same descriptor, both results are the same. A loop in a broken chain ends as void.
+	#
+	def GetTypeInfo(self):
+		ti = self.typeinfo
+		if ti != None:
+			return ti
+		chain = []
+		seen = set()
+		o = self
+		while o != None and o.typeinfo == None and id(o) not in seen:
+			seen.add(id(o))
+			t = o.GetTypeTarget()
+			chain.append((o, t))
+			o = t
+		if o == None or o.typeinfo == None:
+			nt = voidTypeInfo
+		else:
+			nt = o.typeinfo
+		for (o, t) in reversed(chain):
+			nt = o.MakeTypeInfo(t, nt)
+			o.typeinfo = nt
+		return nt
+
+	# Build the descriptor of this object's type from its DW_AT_type target t and the target's descriptor nt
+	#
+	def MakeTypeInfo(self, t, nt):
+		tag = self.tag
+		ti = DwarfTypeInfo()
+		ti.target = t
+		ti.bytesize = self.GetAttr('DW_AT_byte_size')
+		kind = typeKinds.get(tag)
+		if kind == None:
+			ti.kind = nt.kind
+			ti.base = nt.base
+			ti.count = nt.count
+			if ti.bytesize == None:
+				ti.bytesize = nt.bytesize
+			q = typeQualifiers.get(tag)
+			if q == None:
+				ti.qualifiers = nt.qualifiers
+			else:
+				ti.qualifiers = (q,) + nt.qualifiers
+		else:
+			ti.kind = kind
+			ti.base = self
+			if kind == 'array':
+				ti.count = self.GetNElements()
+				if ti.bytesize == None and nt.bytesize != None:
+					n = 1
+					for s in self.children:
+						c = s.GetAttr('DW_AT_count')
+						if c == None:
+							c = s.GetAttr('DW_AT_upper_bound')
+							if type(c) is int:
+								c = c + 1
+						if type(c) is not int:
+							n = None
+							break
+						n = n * c
+					if n != None:
+						ti.bytesize = n * nt.bytesize
+
+		# The predicates look along the chain for the first object that decides them
+		ti.ispointer = (tag == 'DW_TAG_pointer_type') or nt.ispointer
+		if tag == 'DW_TAG_pointer_type':
+			ti.iscomposite = False
+			ti.isenum = False
+		else:
+			ti.iscomposite = (tag == 'DW_TAG_structure_type' or tag == 'DW_TAG_union_type') or nt.iscomposite
+			ti.isenum = (tag == 'DW_TAG_enumeration_type') or nt.isenum
+		if tag == 'DW_TAG_array_type':
+			n = self.GetNElements()
+			if n == None:
+				n = 0
+			ti.arrayelements = n
+		else:
+			ti.arrayelements = nt.arrayelements
+		return ti
 
 	# Read all the information (attributes) about an object, then read its children
 	#
@@ -181,20 +1208,49 @@ class DwarfObject:
 					return
 				c = DwarfObject(self)
 				c.Read(dwp)
-				if c.ident > 0:
-					self.refs[c.ident] = len(self.children)		# Index of the child, starting at 0
-				self.children.append(c)
-			# Now go through the list and link up the DW_AT_specification objects with their declarations.
-			for c in self.children:
-				sr = c.GetAttr('DW_AT_specification')
-				if sr != None:
-					c1 = self.GetChildByRef(sr)
-					if c1 != None:
-						c1.SetSpecref(c)
+				self.AddChild(c)
+			self.LinkSpecifications()
 			return
 		else:
 			raise DwarfError('Not a tag')
 
+	# Append a child object
+	#
+	def AddChild(self, c):
+		if len(self.children) == 0:
+			self.children = [c]
+		else:
+			self.children.append(c)
+		self.refs = None
+
+	# Go through the list of children and link up the DW_AT_specification objects with their declarations.
+	#
+	def LinkSpecifications(self):
+		for c in self.children:
+			sr = c.GetAttr('DW_AT_specification')
+			if sr != None:
+				c1 = self.GetChildByRef(sr)
+				if c1 != None:
+					c1.SetSpecref(c)
+
+	# Add an attribute whose value has already been decoded by DwarfReader
+	#
+	def AddDecodedAttr(self, attr, value):
+		self.NoteAttr(attr, value)
+		self.SetAttr(attr, value)
+
+	# Copy the attributes that have fields of their own (name, value) to the fields
+	#
+	def NoteAttr(self, attr, value):
+		if attr == 'DW_AT_name':
+			if self.tag == 'DW_TAG_compile_unit':			# Name is the filename
+				self.name = value.replace('\\', '/')		# Convert filename to unix form
+				self.basename = self.name.split('/')[-1]	# Remove the path
+			else:
+				self.name = value
+		elif attr == 'DW_AT_const_value':
+			self.value = value
+
 	# Add an attribute to the attribute dictionary.
 	# Some attributes are treated specially.
 	#
@@ -218,6 +1274,7 @@ class DwarfObject:
 			if f[-2] == '(DW_OP_addr:':
 				#print('DEBUG', self.name, '|'+f[-1][0:-1]+'|')
 				value = int(f[-1][0:-1], 16)
+				self.value = value
 		elif attr == 'DW_AT_data_member_location':
 			# Value might be just a number, or a DW_OP_plus_uconst string
 			#print('DEBUG: DW_AT_data_member_location value = ', value)
@@ -227,7 +1284,7 @@ class DwarfObject:
 			elif f[-2] == '(DW_OP_plus_uconst:':
 				#print('DEBUG |'+f[-1][0:-1]+'|')
 				value = int(f[-1][0:-1], 10)
-		self.attr[attr] = value
+		self.SetAttr(attr, value)
 
 	# Find a child object; return None if not found
 	#
@@ -241,107 +1298,81 @@ class DwarfObject:
 	# Returns None if not a data type (no parent)
 	#
 	def IsPointer(self):
-		p = self.parent
-		if p == None:
+		if self.parent == None:
 			return False
-		o = self
-		while True:
-			if o.GetTag() == 'DW_TAG_pointer_type':
-				return True
-			ref = o.GetAttr('DW_AT_type')
-			if ref == None:
-				return False
-			o = p.GetChildByRef(ref)
-			if o == None:
-				return False
+		return self.GetTypeInfo().ispointer
 
 	# Returns True if object is a composite type (struct or union)
 	# Returns None if not a data type (no parent)
 	#
 	def IsComposite(self):
-		p = self.parent
-		if p == None:
+		if self.parent == None:
 			return None
-		o = self
-		while True:
-			t = o.GetTag()
-			if t == 'DW_TAG_pointer_type':
-				return False
-			if t == 'DW_TAG_structure_type':
-				return True
-			if t == 'DW_TAG_union_type':
-				return True
-			ref = o.GetAttr('DW_AT_type')
-			if ref == None:
-				return False
-			o = p.GetChildByRef(ref)
-			if o == None:
-				return False
+		return self.GetTypeInfo().iscomposite
 
 	# Returns True if object is an enumeration type
 	# Returns None if not a data type (no parent)
 	#
 	def IsEnum(self):
-		p = self.parent
-		if p == None:
+		if self.parent == None:
 			return None
-		o = self
-		while True:
-			t = o.GetTag()
-			if t == 'DW_TAG_pointer_type':
-				return False
-			if t == 'DW_TAG_enumeration_type':
-				return True
-			ref = o.GetAttr('DW_AT_type')
-			if ref == None:
-				return False
-			o = p.GetChildByRef(ref)
-			if o == None:
-				return False
+		return self.GetTypeInfo().isenum
 
 	# Returns no. of elements if object is an array; 0 if array type has no subrange; -1 otherwise
 	#
 	def GetArrayElements(self):
-		p = self.parent
-		if p == None:
+		if self.parent == None:
 			return -1
-		o = self
-		while True:
-			if o.GetTag() == 'DW_TAG_array_type':
-				n = o.GetNElements()
-				if n == None:
-					return 0
-				return n
-			ref = o.GetAttr('DW_AT_type')
-			if ref == None:
-				return -1
-			o = p.GetChildByRef(ref)
-			if o == None:
-				return -1
+		return self.GetTypeInfo().arrayelements
+
+	# Returns the DwarfEnumMap of an enumerated type; None if the object is not an enumerated type
+	# The map is made the first time it is needed and kept in the type descriptor.
+	#
+	def GetEnumMap(self):
+		if self.tag != 'DW_TAG_enumeration_type':
+			return None
+		ti = self.GetTypeInfo()
+		if ti.enummap == None:
+			ti.enummap = DwarfEnumMap(self)
+		return ti.enummap
 
 	# Returns a list of enumerators if the object is an enumerated type; None otherwise
+	# The list belongs to the object; don't modify it.
 	#
 	def GetEnumerators(self):
-		if self.tag == 'DW_TAG_enumeration_type':
-			e = []
-			for c in self.children:
-				if c.GetTag() == 'DW_TAG_enumerator':
-					e.append(c)
-			return e
-		else:
+		em = self.GetEnumMap()
+		if em == None:
 			return None
+		return em.enumerators
 
 	# Returns the enumerator name (symbol) for a given number
 	# If not found, or if the object is not an enumerated type, return None
 	#
 	def GetEnumeratorName(self, num):
-		if self.tag == 'DW_TAG_enumeration_type':
-			for c in self.children:
-				if c.GetTag() == 'DW_TAG_enumerator' and c.GetValue() == num:
-					return c.name
+		em = self.GetEnumMap()
+		if em == None:
 			return None
-		else:
+		return em.names.get(num)
+
+	# Returns the number for a given enumerator name
+	# If not found, or if the object is not an enumerated type, return None
+	#
+	def GetEnumeratorValue(self, name):
+		em = self.GetEnumMap()
+		if em == None:
 			return None
+		return em.values.get(name)
+
+	# Returns a list of the enumerator names for a sequence of numbers (for example, an array read with
+	# ElfSectionTable.LoadArray()). Numbers that are not in the enumeration are replaced by unknown.
+	# Returns None if the object is not an enumerated type.
+	#
+	def DecodeEnumArray(self, values, unknown=None):
+		em = self.GetEnumMap()
+		if em == None:
+			return None
+		get = em.names.get
+		return [get(v, unknown) for v in values]
 
 	# Returns a list of members if the object is a struct or union; None otherwise
 	#
@@ -350,11 +1381,66 @@ class DwarfObject:
 			m = []
 			for c in self.children:
 				if c.GetTag() == 'DW_TAG_member':
-					e.append(m)
-			return e
+					m.append(c)
+			return m
 		else:
 			return None
 
+	# Return the object and all its descendants as a flat list, in the order that they appear in the file
+	# Each entry is a tuple  level, ident, tag, name, basename, value, attrnames, attrvalues  of plain
+	# values, so the list can be stored with marshal or passed between processes. Unflatten() rebuilds
+	# the tree. The tuple of names is shared by all objects with the same layout.
+	#
+	def Flatten(self):
+		flat = []
+		stack = [self]
+		while len(stack) > 0:
+			o = stack.pop()
+			flat.append((o.level, o.ident, o.tag, o.name, o.basename, o.value, o.attrkeys.names, o.attrvals))
+			stack.extend(reversed(o.children))
+		return flat
+
+	# Rebuild a tree from a list made by Flatten() and return the top-level object
+	#
+	@staticmethod
+	def Unflatten(flat):
+		top = None
+		stack = []
+		for (level, ident, tag, name, basename, value, attrnames, attrvals) in flat:
+			while len(stack) > 0 and stack[-1].level >= level:
+				stack.pop()
+			if len(stack) > 0:
+				parent = stack[-1]
+			else:
+				parent = None
+			o = DwarfObject(parent)
+			o.level = level
+			o.ident = ident
+			o.tag = tag
+			o.name = name
+			o.basename = basename
+			o.value = value
+			o.attrkeys = GetAttrLayout(attrnames)
+			o.attrvals = attrvals
+			if parent == None:
+				top = o
+			else:
+				parent.AddChild(o)
+			stack.append(o)
+		if top != None:
+			top.LinkAll()
+		return top
+
+	# Link the specification objects in the whole tree below this object
+	#
+	def LinkAll(self):
+		stack = [self]
+		while len(stack) > 0:
+			o = stack.pop()
+			if len(o.children) > 0:
+				o.LinkSpecifications()
+				stack.extend(o.children)
+
 # ==============================================================================
 #
 # Class to store the top-level objects (compile_units) of the dwarf info tree and
@@ -363,38 +1449,284 @@ class DwarfObject:
 class DwarfFile:
 	def __init__(self):
 		self.objects = []
+		self.lazy = False
+		self.reader = None			# The DwarfReader, for lazy loading
+		self.units = []				# The unit headers (DwarfUnit), for lazy loading
+		self.unitsByOffset = {}
+		self.parsed = {}			# Parsed units, by unit offset: the top-level DwarfObject
+		self.nameIndex = {}			# name --> set of unit offsets, from the name index sections
+		self.aranges = None			# Address ranges of the units; read on first use
+		self.arangeStarts = None
+		self.names = {}				# name --> [DwarfObject], all named children of the top-level objects
+		self.definitions = {}		# name --> [DwarfObject], those with a location or a specification object
+		self.declarations = {}		# name --> [DwarfObject], those with DW_AT_declaration
 
 	# Read the file and construct the object tree
+	# The DWARF information is decoded directly from the file unless usereadelf is True.
+	# If lazy is True only the unit headers and the name indexes are read now. Units are parsed
+	# when a lookup needs them, and kept. self.objects is not filled until GetObjects() is called.
+	# If workers is more than 1 the units are parsed by that many processes (0 means one per CPU).
+	# The result is the same as for a serial read.
+	#
+	def Read(self, elffilename, usereadelf=False, lazy=False, workers=1):
+		with stats.Phase('DwarfFile.Read'):
+			if usereadelf:
+				self.ReadWithReadelf(elffilename)
+				return
+			dr = DwarfReader(elffilename)
+			nameindex = None
+			if lazy:
+				nameindex = {}
+				dr.ReadPubnames(nameindex)
+				dr.ReadDebugNames(nameindex)
+			elif workers == 0:
+				workers = os.cpu_count() or 1
+			units = dr.ReadUnitHeaders()
+			if not lazy and workers > 1 and len(units) > 1:
+				self.ReadParallel(elffilename, units, workers)
+			self.SetReader(dr, units, lazy, nameindex)
+
+	# Parse the units in a pool of processes
+	# The units are split into runs of roughly equal size, several per worker so that the load evens out.
+	# Each worker returns its units flattened; the trees are rebuilt here in unit order and stored as
+	# parsed units, so that SetReader() finds them all done.
+	#
+	def ReadParallel(self, elffilename, units, workers):
+		with stats.Phase('DwarfFile.ReadParallel'):
+			total = units[-1].end - units[0].offset
+			chunksize = max(1, total // (workers * 4))
+			chunks = []
+			chunk = []
+			size = 0
+			for u in units:
+				chunk.append(u.offset)
+				size = size + u.end - u.offset
+				if size >= chunksize:
+					chunks.append(chunk)
+					chunk = []
+					size = 0
+			if len(chunk) > 0:
+				chunks.append(chunk)
+			# The rebuild makes a lot of objects and nothing to collect; the cyclic garbage collector
+			# would otherwise take up about half of the time.
+			gcenabled = gc.isenabled()
+			gc.disable()
+			try:
+				with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+					results = pool.map(ReadUnitsFlat, [elffilename] * len(chunks), chunks)
+					for (chunk, blobs) in zip(chunks, results):
+						for (offset, blob) in zip(chunk, blobs):
+							o = DwarfObject.Unflatten(marshal.loads(blob))
+							self.parsed[offset] = o
+							self.IndexObject(o)
+			finally:
+				if gcenabled:
+					gc.enable()
+
+	# Take the units from a reader that has already been set up
+	# The reader provides ReadUnit(unit) and ReadAranges(); DwarfReader is one such reader.
+	# In lazy mode nameindex (name --> unit offsets) says which units to parse first when looking up a name.
 	#
-	def Read(self, elffilename):
-		dwp = DwarfInfo(elffilename)
-		dwp.Next()
-		while dwp.type == 'tag':
-			o = DwarfObject(None)
-			o.Read(dwp)
-			self.objects.append(o)
+	def SetReader(self, reader, units, lazy=False, nameindex=None):
+		self.reader = reader
+		self.units = units
+		for u in self.units:
+			self.unitsByOffset[u.offset] = u
+		if lazy:
+			self.lazy = True
+			if nameindex != None:
+				self.nameIndex = nameindex
+			return
+		for u in self.units:
+			self.objects.append(self.GetUnitObject(u))
+
+	# Read the file and construct the object tree from the output of readelf -wi
+	#
+	def ReadWithReadelf(self, elffilename):
+		with stats.Phase('readelf -wi'):
+			dwp = DwarfInfo(elffilename)
+			dwp.Next()
+			while dwp.type == 'tag':
+				o = DwarfObject(None)
+				o.Read(dwp)
+				self.objects.append(o)
+				self.IndexObject(o)
+
+	# Return the top-level object of a unit, parsing the unit if that hasn't been done yet
+	#
+	def GetUnitObject(self, u):
+		try:
+			return self.parsed[u.offset]
+		except KeyError:
+			with stats.Phase('ReadUnit'):
+				o = self.reader.ReadUnit(u)
+			self.parsed[u.offset] = o
+			self.IndexObject(o)
+			return o
+
+	# Add the named children of a top-level object to the name indexes
+	# The lists are kept in file order, so the first entry is the one that a search of the units in
+	# order would find, even when lazy loading parses the units out of order.
+	# Types that UnifyTypes() has replaced by the object of another unit are indexed under that unit.
+	#
+	def IndexObject(self, o):
+		for c in o.children:
+			n = c.name
+			if n == '' or c.parent is not o:
+				continue
+			DwarfFile.AddToIndex(self.names, n, c)
+			if c.specref != None or c.GetAttr('DW_AT_location') != None:
+				DwarfFile.AddToIndex(self.definitions, n, c)
+			if c.GetAttr('DW_AT_declaration') != None:
+				DwarfFile.AddToIndex(self.declarations, n, c)
+
+	# Collapse the types that are the same in different units into one object
+	# The first object with a given signature (in file order) becomes the canonical one. In the other
+	# units it takes the place of the duplicate in the list of children, and the duplicate's ident refers
+	# to it, so names and type references in every unit lead to the canonical object. The canonical
+	# object keeps its own parent. All the units are parsed first in lazy mode.
+	# Returns the number of objects that were replaced.
+	#
+	def UnifyTypes(self):
+		with stats.Phase('DwarfFile.UnifyTypes'):
+			sigs = DwarfTypeSignatures()
+			canonical = {}				# Signature number --> object
+			replaced = 0
+			for cu in self.GetObjects():
+				children = list(cu.children)
+				refs = {}
+				for i in range(len(children)):
+					c = children[i]
+					if c.ident > 0:
+						refs[c.ident] = i
+					if c.tag in unifyTags and c.parent is cu:
+						k = canonical.setdefault(sigs.Get(c), c)
+						if k is not c:
+							children[i] = k
+							replaced = replaced + 1
+				cu.children = children
+				cu.refs = refs			# Keeps the duplicates' idents
+			if replaced > 0:
+				self.names = {}
+				self.definitions = {}
+				self.declarations = {}
+				stack = list(self.objects)
+				while len(stack) > 0:
+					o = stack.pop()
+					o.typeinfo = None
+					for c in o.children:
+						if c.parent is o:
+							stack.append(c)
+				for cu in self.objects:
+					self.IndexObject(cu)
+			return replaced
+
+	@staticmethod
+	def AddToIndex(index, name, o):
+		l = index.setdefault(name, [])
+		l.append(o)
+		if len(l) > 1 and l[-2].ident > o.ident:
+			l.sort(key=DwarfObject.GetIdent)
+
+	# Return the list of all top-level objects. In lazy mode, this parses all the remaining units.
+	#
+	def GetObjects(self):
+		if self.lazy and len(self.objects) != len(self.units):
+			self.objects = [self.GetUnitObject(u) for u in self.units]
+		return self.objects
+
+	# In lazy mode, parse the units that might contain a name
+	# The units that the name indexes list for the name are parsed first. They only list definitions, so if
+	# the name turns up there the search stops. Otherwise the remaining units are parsed in order
+	# until the name appears in the given index.
+	#
+	def LoadUnitsFor(self, objname, index):
+		if not self.lazy or len(self.parsed) == len(self.units):
+			return
+		listed = sorted(self.nameIndex.get(objname, ()))
+		for off in listed:
+			try:
+				self.GetUnitObject(self.unitsByOffset[off])
+			except KeyError:
+				pass			# The index refers to a unit that doesn't exist
+		if objname in index or (len(listed) > 0 and objname in self.names):
+			return
+		for u in self.units:
+			if u.offset not in self.parsed:
+				self.GetUnitObject(u)
+				if objname in index:
+					return
+
+	# Return the top-level object of the unit that contains the given code address, using .debug_aranges
+	# Returns None if no unit claims the address.
+	#
+	def FindUnitByAddress(self, addr):
+		if stats.enabled:
+			stats.Count('unit address lookups')
+		if self.reader is None:
+			return None
+		if self.aranges is None:
+			self.aranges = self.reader.ReadAranges()
+			self.arangeStarts = [r[0] for r in self.aranges]
+		i = bisect.bisect_right(self.arangeStarts, addr) - 1
+		while i >= 0:
+			(low, high, off) = self.aranges[i]
+			if addr < high:
+				try:
+					return self.GetUnitObject(self.unitsByOffset[off])
+				except KeyError:
+					return None
+			if i > 0 and self.aranges[i-1][1] <= addr:
+				break
+			i = i - 1
+		return None
 
 	# Find a named object in the children of a top-level object
+	# The result is the first object with the name in file order. In lazy mode that only holds for the
+	# units parsed so far: the units that the name indexes list for the name are parsed first and the
+	# search stops if the name turns up there, so an object of that name in an earlier unit that the
+	# indexes don't list (a declaration, a type or a static object) is not seen unless its unit has
+	# already been parsed. FindObjectDefinition() and FindDeclaration() are the same. After GetObjects()
+	# the results are the same as in eager mode; FindAll() always is.
 	#
 	def FindObject(self, objname):
-		for o in self.objects:
-			obj = o.FindObject(objname)
-			if obj != None:
-				return obj
-		return None
+		if stats.enabled:
+			stats.Count('name lookups')
+		self.LoadUnitsFor(objname, self.names)
+		try:
+			return self.names[objname][0]
+		except KeyError:
+			return None
 
 	# Find a named variable with either a location or a reference to a specification object
 	# If there's no object with either, return the first match (same behavior as FindObject()
 	#
 	def FindObjectDefinition(self, objname):
-		match = None				# Matches name only
-		for o in self.objects:
-			obj = o.FindObject(objname)
-			if obj != None:
-				if match == None:
-					match = obj
-				if obj.GetSpecref() != None:
-					return obj
-				if obj.GetAttr('DW_AT_location') != None:
-					return obj
-		return match
+		if stats.enabled:
+			stats.Count('name lookups')
+		self.LoadUnitsFor(objname, self.definitions)
+		try:
+			return self.definitions[objname][0]
+		except KeyError:
+			return self.FindObject(objname)
+
+	# Find a named object that is only a declaration (DW_AT_declaration); return None if not found
+	#
+	def FindDeclaration(self, objname):
+		if stats.enabled:
+			stats.Count('name lookups')
+		self.LoadUnitsFor(objname, self.declarations)
+		try:
+			return self.declarations[objname][0]
+		except KeyError:
+			return None
+
+	# Return a list of all the objects with the given name, from all units
+	# In lazy mode this parses all the units.
+	#
+	def FindAll(self, objname):
+		if stats.enabled:
+			stats.Count('name lookups')
+		if self.lazy:
+			self.GetObjects()
+		return list(self.names.get(objname, ()))
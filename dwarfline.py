@@ -0,0 +1,407 @@
+#!/usr/bin/python3
+
+# dwarfline.py - address to source line lookup from the DWARF line number programs
+#
+# (c) David Haworth
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import bisect
+from array import array
+
+from elf import ElfReader, SHF_ALLOC, SHF_EXECINSTR
+from dwarf import DwarfError, ReadULEB128, ReadSLEB128
+from dwarfconst import *
+from elfstats import stats
+
+# ==============================================================================
+#
+# DwarfLineTable - the rows of the line number program of one unit
+# The rows are kept in arrays, one sequence after another; the rows of each sequence are sorted by
+# address. A row covers the addresses up to the next row. The row at the end of each sequence has line 0,
+# meaning no source line, as does any row that the compiler itself gives line 0.
+#
+class DwarfLineTable:
+	def __init__(self, offset):
+		self.offset = offset				# Offset of the program in .debug_line
+		self.version = 0
+		self.filenames = []					# File number --> path
+		self.addrs = array('Q')
+		self.files = array('I')
+		self.lines = array('I')
+		self.columns = array('I')
+		self.sequences = []					# List of  low, high, first row, end row  of each sequence
+
+	# Add the rows of one sequence; rows is a list of  address, file, line, column  ending with the
+	# row that ends the sequence
+	#
+	def AddSequence(self, rows):
+		first = len(self.addrs)
+		self.sequences.append((rows[0][0], rows[-1][0], first, first + len(rows)))
+		for (addr, f, line, col) in rows:
+			self.addrs.append(addr)
+			self.files.append(f)
+			self.lines.append(line)
+			self.columns.append(col)
+
+	# Return the file name for a file number; '?' if the number is out of range
+	#
+	def GetFileName(self, f):
+		if f < len(self.filenames):
+			return self.filenames[f]
+		return '?'
+
+	# Return the position of the address in a sequence as a tuple  file, line, column
+	# seq is the index of the sequence. Returns None if the address is not covered by a row of the
+	# sequence with a line number.
+	#
+	def Lookup(self, addr, seq):
+		(low, high, first, end) = self.sequences[seq]
+		i = bisect.bisect_right(self.addrs, addr, first, end) - 1
+		if i < first or self.lines[i] == 0:
+			return None
+		return (self.GetFileName(self.files[i]), self.lines[i], self.columns[i])
+
+# ==============================================================================
+#
+# DwarfLines - the line tables of all the units in a file, with an index of their sequences
+#
+class DwarfLines:
+	def __init__(self):
+		self.tables = []					# DwarfLineTable for each unit, in file order
+		self.seqstarts = array('Q')			# Start address of each sequence, sorted
+		self.seqends = array('Q')			# End address of each sequence
+		self.seqtables = array('I')			# Index of the table that has each sequence
+		self.seqindexes = array('I')		# Index of the sequence in its table
+
+	# Read the line number programs of all the units
+	#
+	def Read(self, elffilename):
+		with stats.Phase('DwarfLines.Read'):
+			er = ElfReader(elffilename)
+			reader = DwarfLineReader(er)
+			if reader.line != None:
+				(buf, start, size) = reader.line
+				pos = 0
+				while pos < size:
+					(table, pos) = reader.ReadProgram(pos)
+					self.tables.append(table)
+			code = []
+			for (name, stype, flags, addr, offset, size, link, info, align, entsize) in er.sections:
+				if (flags & SHF_ALLOC) and (flags & SHF_EXECINSTR) and size > 0:
+					code.append((addr, addr + size))
+			self.BuildIndex(code)
+
+	# Build the index of the sequences
+	# code is a list of  start, end  of the sections that hold code. If it isn't empty, sequences that don't
+	# start in one of them are left out: they belong to functions that the linker discarded.
+	# The indexed sequences don't overlap, so the only one that can contain an address is the last one
+	# that starts at or below it. Where sequences overlap, one of them is left out: the linker leaves the
+	# sequences of the functions that it discarded (e.g. with --gc-sections) at address 0, so one that
+	# starts at 0 gives way to one that doesn't. Otherwise the one that starts later (or, at the same
+	# address, is shorter) is left out.
+	#
+	def BuildIndex(self, code=()):
+		code = sorted(code)
+		codestarts = [c[0] for c in code]
+		seqs = []
+		for t in range(len(self.tables)):
+			sequences = self.tables[t].sequences
+			for i in range(len(sequences)):
+				(low, high, first, end) = sequences[i]
+				if high <= low:
+					continue
+				if len(code) > 0:
+					c = bisect.bisect_right(codestarts, low) - 1
+					if c < 0 or low >= code[c][1]:
+						if stats.enabled:
+							stats.Count('line sequences left out')
+						continue
+				seqs.append((low, -high, t, i))
+		seqs.sort()
+		kept = []
+		for s in seqs:
+			if len(kept) > 0 and s[0] < -kept[-1][1]:
+				if stats.enabled:
+					stats.Count('line sequences left out')
+				if kept[-1][0] == 0 and s[0] != 0:
+					kept[-1] = s
+				continue
+			kept.append(s)
+		self.seqstarts = array('Q', [s[0] for s in kept])
+		self.seqends = array('Q', [-s[1] for s in kept])
+		self.seqtables = array('I', [s[2] for s in kept])
+		self.seqindexes = array('I', [s[3] for s in kept])
+
+	# Return the source position of an address as a tuple  file, line, column
+	# Returns None if no line table covers the address.
+	#
+	def Lookup(self, addr):
+		if stats.enabled:
+			stats.Count('line lookups')
+		i = bisect.bisect_right(self.seqstarts, addr) - 1
+		if i < 0 or addr >= self.seqends[i]:
+			return None
+		return self.tables[self.seqtables[i]].Lookup(addr, self.seqindexes[i])
+
+	# Return the source positions of a sequence of addresses, as Lookup() does for each one
+	# Addresses that repeat are only looked up once.
+	#
+	def LookupAll(self, addrs):
+		found = {}
+		result = []
+		for a in addrs:
+			try:
+				r = found[a]
+			except KeyError:
+				r = self.Lookup(a)
+				found[a] = r
+			result.append(r)
+		return result
+
+# ==============================================================================
+#
+# DwarfLineReader - decodes the line number programs in .debug_line (DWARF 2 to 5)
+# VLIW operation indexes (maximum_operations_per_instruction > 1) are not supported; the address
+# advances as if there were one operation per instruction.
+#
+class DwarfLineReader:
+	def __init__(self, er):
+		self.elffilename = er.elffilename
+		self.byteorder = er.endian
+		self.line = er.GetSectionData('.debug_line')
+		self.str = er.GetSectionData('.debug_str')
+		self.linestr = er.GetSectionData('.debug_line_str')
+
+	# Read an unsigned integer of n bytes at an offset in .debug_line
+	#
+	def ReadInt(self, pos, n):
+		(buf, start, size) = self.line
+		return int.from_bytes(buf[start+pos:start+pos+n], self.byteorder)
+
+	# Read a 0-terminated string from a section; returns the string and the position after it
+	#
+	def ReadString(self, sect, pos):
+		if sect is None:
+			raise DwarfError(self.elffilename + ': line table refers to a missing string section')
+		(buf, start, size) = sect
+		end = buf.find(b'\0', start + pos, start + size)
+		if end < 0:
+			end = start + size
+		return (buf[start+pos:end].decode('utf-8', 'replace'), end + 1 - start)
+
+	# Read a value of a DWARF 5 directory or file entry; returns the value and the new position
+	#
+	def ReadForm(self, form, pos, offsize):
+		if form == DW_FORM_string:
+			return self.ReadString(self.line, pos)
+		if form == DW_FORM_line_strp or form == DW_FORM_strp:
+			if form == DW_FORM_line_strp:
+				sect = self.linestr
+			else:
+				sect = self.str
+			return (self.ReadString(sect, self.ReadInt(pos, offsize))[0], pos + offsize)
+		if form == DW_FORM_udata:
+			(buf, start, size) = self.line
+			(v, p) = ReadULEB128(buf, start + pos)
+			return (v, p - start)
+		if form == DW_FORM_sdata:
+			(buf, start, size) = self.line
+			(v, p) = ReadSLEB128(buf, start + pos)
+			return (v, p - start)
+		for (f, n) in ((DW_FORM_data1, 1), (DW_FORM_data2, 2), (DW_FORM_data4, 4), (DW_FORM_data8, 8)):
+			if form == f:
+				return (self.ReadInt(pos, n), pos + n)
+		if form == DW_FORM_data16:
+			return (None, pos + 16)
+		if form == DW_FORM_block:
+			(buf, start, size) = self.line
+			(n, p) = ReadULEB128(buf, start + pos)
+			return (None, p - start + n)
+		raise DwarfError(self.elffilename + ': unsupported form ' + hex(form) + ' in line table header')
+
+	# Read a DWARF 5 list of directory or file entries; returns a list of  {content type: value}  and
+	# the new position
+	#
+	def ReadEntries(self, pos, offsize):
+		(buf, start, size) = self.line
+		nformats = buf[start+pos]
+		pos = pos + 1
+		formats = []
+		for i in range(nformats):
+			(ct, p) = ReadULEB128(buf, start + pos)
+			(form, p) = ReadULEB128(buf, p)
+			formats.append((ct, form))
+			pos = p - start
+		(count, p) = ReadULEB128(buf, start + pos)
+		pos = p - start
+		entries = []
+		for i in range(count):
+			e = {}
+			for (ct, form) in formats:
+				(e[ct], pos) = self.ReadForm(form, pos, offsize)
+			entries.append(e)
+		return (entries, pos)
+
+	# Read the program at an offset in .debug_line; returns the DwarfLineTable and the offset of the
+	# next program
+	#
+	def ReadProgram(self, offset):
+		(buf, start, size) = self.line
+		table = DwarfLineTable(offset)
+		pos = offset
+		length = self.ReadInt(pos, 4)
+		offsize = 4
+		pos = pos + 4
+		if length == 0xffffffff:
+			length = self.ReadInt(pos, 8)
+			offsize = 8
+			pos = pos + 8
+		end = pos + length
+		version = self.ReadInt(pos, 2)
+		table.version = version
+		pos = pos + 2
+		if version < 2 or version > 5:
+			raise DwarfError(self.elffilename + ': unsupported line table version ' + str(version) +
+								' at .debug_line offset ' + hex(offset))
+		if version >= 5:
+			pos = pos + 2						# address_size, segment_selector_size
+		headerlength = self.ReadInt(pos, offsize)
+		pos = pos + offsize
+		progstart = pos + headerlength
+		mininst = buf[start+pos]
+		pos = pos + 1
+		if version >= 4:
+			pos = pos + 1						# maximum_operations_per_instruction
+		defaultstmt = buf[start+pos]
+		linebase = buf[start+pos+1]
+		if linebase >= 0x80:
+			linebase = linebase - 0x100
+		linerange = buf[start+pos+2]
+		opcodebase = buf[start+pos+3]
+		pos = pos + 4
+		oplengths = [0] + list(buf[start+pos:start+pos+opcodebase-1])
+		pos = pos + opcodebase - 1
+
+		if version >= 5:
+			(dirs, pos) = self.ReadEntries(pos, offsize)
+			dirs = [d.get(DW_LNCT_path, '') for d in dirs]
+			(files, pos) = self.ReadEntries(pos, offsize)
+			for f in files:
+				d = f.get(DW_LNCT_directory_index, 0)
+				if d < len(dirs):
+					d = dirs[d]
+				else:
+					d = ''
+				table.filenames.append(os.path.join(d, f.get(DW_LNCT_path, '?')))
+		else:
+			dirs = ['']							# 0 is the compilation directory; not known here
+			while buf[start+pos] != 0:
+				(d, pos) = self.ReadString(self.line, pos)
+				dirs.append(d)
+			pos = pos + 1
+			table.filenames.append('?')			# File numbers start at 1
+			while buf[start+pos] != 0:
+				pos = self.ReadFileEntry(table, dirs, pos)
+			pos = pos + 1
+
+		seqs = self.RunProgram(table, dirs, progstart, end, mininst, defaultstmt, linebase, linerange,
+								opcodebase, oplengths)
+		for s in seqs:
+			table.AddSequence(s)
+		return (table, end)
+
+	# Read a DWARF 2-4 file entry (in the header or DW_LNE_define_file) into the table's file names
+	# Returns the new position.
+	#
+	def ReadFileEntry(self, table, dirs, pos):
+		(buf, start, size) = self.line
+		(name, pos) = self.ReadString(self.line, pos)
+		(d, p) = ReadULEB128(buf, start + pos)
+		(mtime, p) = ReadULEB128(buf, p)
+		(length, p) = ReadULEB128(buf, p)
+		if d < len(dirs):
+			name = os.path.join(dirs[d], name)
+		table.filenames.append(name)
+		return p - start
+
+	# Run the line number program from pos to end; returns a list of sequences, each a list of rows
+	#  address, file, line, column
+	#
+	def RunProgram(self, table, dirs, pos, end, mininst, defaultstmt, linebase, linerange, opcodebase, oplengths):
+		(buf, start, size) = self.line
+		pos = start + pos
+		end = start + end
+		seqs = []
+		rows = []
+		address = 0
+		f = 1
+		line = 1
+		col = 0
+		nrows = 0
+		while pos < end:
+			op = buf[pos]
+			pos = pos + 1
+			if op >= opcodebase:
+				adj = op - opcodebase
+				address = address + (adj // linerange) * mininst
+				line = line + linebase + adj % linerange
+				rows.append((address, f, line, col))
+			elif op == DW_LNS_copy:
+				rows.append((address, f, line, col))
+			elif op == DW_LNS_advance_pc:
+				(v, pos) = ReadULEB128(buf, pos)
+				address = address + v * mininst
+			elif op == DW_LNS_advance_line:
+				(v, pos) = ReadSLEB128(buf, pos)
+				line = line + v
+			elif op == DW_LNS_set_file:
+				(f, pos) = ReadULEB128(buf, pos)
+			elif op == DW_LNS_set_column:
+				(col, pos) = ReadULEB128(buf, pos)
+			elif op == DW_LNS_const_add_pc:
+				address = address + ((255 - opcodebase) // linerange) * mininst
+			elif op == DW_LNS_fixed_advance_pc:
+				address = address + int.from_bytes(buf[pos:pos+2], self.byteorder)
+				pos = pos + 2
+			elif op == 0:
+				(n, pos) = ReadULEB128(buf, pos)
+				if n == 0:
+					continue
+				sub = buf[pos]
+				if sub == DW_LNE_end_sequence:
+					rows.append((address, 0, 0, 0))
+					seqs.append(rows)
+					nrows = nrows + len(rows)
+					rows = []
+					address = 0
+					f = 1
+					line = 1
+					col = 0
+				elif sub == DW_LNE_set_address:
+					address = int.from_bytes(buf[pos+1:pos+n], self.byteorder)
+				elif sub == DW_LNE_define_file:
+					self.ReadFileEntry(table, dirs, pos + 1 - start)
+				pos = pos + n
+			else:
+				# DW_LNS_negate_stmt etc.: nothing that the table keeps. Skip the operands.
+				for i in range(oplengths[op]):
+					(v, pos) = ReadULEB128(buf, pos)
+		if stats.enabled:
+			stats.Count('line rows', nrows)
+		return seqs
@@ -0,0 +1,289 @@
+#!/usr/bin/python3
+
+# dwarfpath.py - C-style paths to variables and their members, e.g. cfg.tasks[3].prio
+#
+# (c) David Haworth
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import re
+
+from dwarf import DwarfError
+from dwarfvalue import DwarfValueLayout
+from elfstats import stats
+
+# One step of a path:  ->  .  [index]  or a name, after any white space
+pathStep = re.compile(r'\s*(?:(->)|(\.)|\[([^\]]*)\]|([A-Za-z_][A-Za-z0-9_]*))')
+
+# ==============================================================================
+#
+# DwarfAccessor - where the value at the end of a path is and how to decode it
+# Reading the value is one read of size bytes at address. For a bitfield, bitoffset and bitsize give the
+# position of the field in those bytes, as DwarfValueLayout.DecodeBits() takes them.
+#
+class DwarfAccessor:
+	def __init__(self, path, address, size, t, layout):
+		self.path = path
+		self.address = address
+		self.size = size
+		self.type = t				# Type object; None for a part of a multi-dimensional array
+		self.layout = layout		# DwarfValueLayout
+		self.bitoffset = None
+		self.bitsize = None
+
+	# Read and decode the value from a section table (and the memory dumps laid over it)
+	# Returns None if the bytes are not in a section with contents or a dump.
+	#
+	def Read(self, sections):
+		buf = sections.LoadBytes(self.address, self.size)
+		if buf is None:
+			return None
+		if self.bitsize != None:
+			return DwarfValueLayout.DecodeBits(buf, 0, self.bitoffset, self.bitsize, sections.byteorder,
+												self.layout)
+		return self.layout.Decode(buf, 0)
+
+# ==============================================================================
+#
+# DwarfPathResolver - turns paths into accessors
+# A path is a variable name followed by any number of  .member  ->member  and  [index]  steps, as
+# in C. Anonymous structs and unions are looked through, as C does. [index] applies to arrays (one
+# dimension per step) and to pointers.
+# A path is resolved once; the accessor is kept, so evaluating the same path again costs a
+# dictionary lookup and one read. Pointers along the path are read from the ELF file when the path is
+# resolved, not from the memory dumps, so the pointers must be initialized in the image (e.g. const
+# configuration tables). ClearCache() forgets the accessors.
+# Paths that can't be resolved raise DwarfError.
+#
+class DwarfPathResolver:
+	def __init__(self, dwarffile, decoder):
+		self.df = dwarffile
+		self.dv = decoder
+		self.sections = decoder.sections
+		self.accessors = {}			# Path as given, and tuple of its steps --> DwarfAccessor
+
+	# Return the accessor for a path
+	# A path that has been seen before is found without parsing it. Otherwise it is parsed, and the
+	# steps find the accessor of the same path written with different white space.
+	#
+	def Compile(self, path):
+		try:
+			return self.accessors[path]
+		except KeyError:
+			pass
+		key = tuple(DwarfPathResolver.Parse(path))
+		a = self.accessors.get(key)
+		if a == None:
+			if stats.enabled:
+				stats.Count('paths resolved')
+			a = self.Resolve(path.strip())
+			self.accessors[key] = a
+		self.accessors[path] = a
+		return a
+
+	# Return the value at the end of a path; None if it can't be read
+	#
+	def Evaluate(self, path):
+		return self.Compile(path).Read(self.sections)
+
+	# Forget the accessors, e.g. after the pointers in the file have changed
+	#
+	def ClearCache(self):
+		self.accessors = {}
+
+	# Split a path into a list of steps  op, arg  where op is one of
+	#   name    - the variable (first step only)
+	#   .       - a member; arg is the name
+	#   ->      - a member of the object that a pointer points to; arg is the name
+	#   []      - an index; arg is the number
+	#
+	@staticmethod
+	def Parse(path):
+		steps = []
+		pos = 0
+		op = 'name'
+		path = path.rstrip()
+		while pos < len(path):
+			m = pathStep.match(path, pos)
+			if m == None:
+				raise DwarfError(path + ': syntax error at \'' + path[pos:].lstrip() + '\'')
+			pos = m.end()
+			(arrow, dot, index, name) = m.groups()
+			if name != None:
+				if op == None:
+					raise DwarfError(path + ': unexpected name ' + name)
+				steps.append((op, name))
+				op = None
+			elif op != None:
+				raise DwarfError(path + ': expected a name at \'' + m.group(0).lstrip() + '\'')
+			elif index != None:
+				try:
+					i = int(index.strip(), 0)
+				except ValueError:
+					raise DwarfError(path + ': bad index [' + index + ']')
+				if i < 0:
+					raise DwarfError(path + ': negative index [' + index + ']')
+				steps.append(('[]', i))
+			elif arrow != None:
+				op = '->'
+			else:
+				op = '.'
+		if op != None:
+			raise DwarfError(path + ': incomplete path')
+		return steps
+
+	# Work out the accessor for a path
+	# The state along the path is the address, the type and, inside a multi-dimensional array, the
+	# dimensions that haven't been indexed yet (the type is the element type then).
+	#
+	def Resolve(self, path):
+		steps = DwarfPathResolver.Parse(path)
+		(addr, t) = self.FindVariable(path, steps[0][1])
+		dims = None
+		bits = None
+		for (op, arg) in steps[1:]:
+			if bits != None:
+				raise DwarfError(path + ': nothing after a bitfield')
+			if op == '[]':
+				if dims == None:
+					ti = t.GetTypeInfo()
+					if ti.kind == 'pointer':
+						(addr, t) = self.Deref(path, addr, t)
+						el = self.GetLayout(path, t)
+						addr = addr + arg * el.size
+						continue
+					if ti.kind != 'array':
+						raise DwarfError(path + ': [' + str(arg) + '] of something that isn\'t an array or a pointer')
+					layout = self.GetLayout(path, t)
+					if layout.kind != 'array':
+						raise DwarfError(path + ': the elements of the array have no size')
+					dims = layout.dims
+					t = ti.base.GetTypeTarget()
+					el = layout.element
+				if dims[0] != 0 and arg >= dims[0]:
+					raise DwarfError(path + ': index ' + str(arg) + ' out of range 0..' + str(dims[0] - 1))
+				stride = el.size
+				for n in dims[1:]:
+					stride = stride * n
+				addr = addr + arg * stride
+				dims = dims[1:]
+				if len(dims) == 0:
+					dims = None
+				continue
+			if dims != None:
+				raise DwarfError(path + ': ' + op + arg + ' of an array')
+			if op == '->':
+				(addr, t) = self.Deref(path, addr, t)
+			ti = t.GetTypeInfo()
+			if ti.kind != 'struct' and ti.kind != 'union':
+				raise DwarfError(path + ': ' + op + arg + ' of something that isn\'t a struct or union')
+			found = self.FindMember(path, ti.base, arg, 0)
+			if found == None:
+				raise DwarfError(path + ': no member ' + arg)
+			(off, m) = found
+			t = m.GetTypeTarget()
+			if m.GetAttr('DW_AT_bit_size') != None:
+				bitoff = self.dv.GetBitOffset(m, self.GetLayout(path, t).size)
+				if bitoff == None:
+					raise DwarfError(path + ': the position of bitfield ' + arg + ' is not known')
+				bits = (off * 8 + bitoff, m.GetAttr('DW_AT_bit_size'))
+			else:
+				addr = addr + off
+
+		if dims != None:
+			layout = self.dv.ArrayOf(el, dims)
+			return DwarfAccessor(path, addr, layout.size, None, layout)
+		layout = self.GetLayout(path, t)
+		if bits != None:
+			(bitoff, bitsize) = bits
+			a = DwarfAccessor(path, addr + bitoff // 8, (bitoff % 8 + bitsize + 7) // 8, t, layout)
+			a.bitoffset = bitoff % 8
+			a.bitsize = bitsize
+			return a
+		return DwarfAccessor(path, addr, layout.size, t, layout)
+
+	# Return the address and type of a variable
+	#
+	def FindVariable(self, path, name):
+		v = self.df.FindObjectDefinition(name)
+		if v == None or v.GetTag() != 'DW_TAG_variable':
+			raise DwarfError(path + ': no variable ' + name)
+		addr = v.GetValue()
+		t = v.GetTypeTarget()
+		spec = v.GetSpecref()
+		if spec != None:
+			if addr == None:
+				addr = spec.GetValue()
+			if t == None:
+				t = spec.GetTypeTarget()
+		if type(addr) is not int or t == None:
+			raise DwarfError(path + ': ' + name + ' has no address or no type')
+		return (addr, t)
+
+	# Return the layout of a type; it must have a size
+	#
+	def GetLayout(self, path, t):
+		layout = None
+		if t != None:
+			layout = self.dv.GetLayout(t)
+		if layout == None or layout.size == None:
+			raise DwarfError(path + ': a type without a size')
+		return layout
+
+	# Return the pointer at an address of a pointer type and the type it points to
+	#
+	def Deref(self, path, addr, t):
+		ti = t.GetTypeInfo()
+		if ti.kind != 'pointer':
+			raise DwarfError(path + ': -> or [] of something that isn\'t a pointer')
+		size = self.GetLayout(path, t).size
+		buf = self.sections.LoadSectionBytes(addr, size)
+		if buf is None:
+			raise DwarfError(path + ': the pointer at ' + hex(addr) + ' is not initialized in the image')
+		p = int.from_bytes(buf, self.sections.byteorder)
+		if p == 0:
+			raise DwarfError(path + ': the pointer at ' + hex(addr) + ' is NULL')
+		pt = ti.base.GetTypeTarget()
+		if pt == None:
+			raise DwarfError(path + ': the pointer at ' + hex(addr) + ' is a void pointer')
+		return (p, pt)
+
+	# Find a member of a struct or union, looking inside anonymous members
+	# Returns  offset, member  where offset is the offset of the member from the start of the struct, or
+	# None if there is no such member.
+	#
+	def FindMember(self, path, base, name, off):
+		for m in base.GetMembers():
+			moff = m.GetAttr('DW_AT_data_member_location')
+			if moff == None or m.GetAttr('DW_AT_bit_size') != None:
+				moff = 0						# Union member, or a bitfield: the bit offset has the position
+			elif type(moff) is not int:
+				if m.GetName() == name:
+					raise DwarfError(path + ': the location of member ' + name + ' is not a constant')
+				continue
+			if m.GetName() == name:
+				return (off + moff, m)
+			if m.GetName() == '':
+				mt = m.GetTypeTarget()
+				if mt != None:
+					mti = mt.GetTypeInfo()
+					if mti.kind == 'struct' or mti.kind == 'union':
+						found = self.FindMember(path, mti.base, name, off + moff)
+						if found != None:
+							return found
+		return None
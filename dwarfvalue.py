@@ -0,0 +1,388 @@
+#!/usr/bin/python3
+
+# dwarfvalue.py - decode the contents of variables using their DWARF types
+#
+# (c) David Haworth
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import struct
+
+from dwarfconst import *
+from elfstats import stats
+
+# struct format characters for scalars, by size
+unsignedFormats = { 1: 'B', 2: 'H', 4: 'I', 8: 'Q' }
+signedFormats = { 1: 'b', 2: 'h', 4: 'i', 8: 'q' }
+floatFormats = { 2: 'e', 4: 'f', 8: 'd' }
+
+# ==============================================================================
+#
+# DwarfValueLayout - how to decode a value of one type from a buffer
+# kind is one of
+#   scalar  - an integer, float or pointer; st decodes it
+#   enum    - an integer that is turned into the enumerator name if there is one
+#   bool    - an integer that is turned into True or False
+#   struct  - a dictionary of the members. st decodes all the scalar members in one go
+#   union   - a dictionary of all the members, each decoded from the start of the union
+#   array   - (nested) lists of the elements. st decodes all the elements if they are scalars
+#   raw     - anything else; the bytes
+#
+class DwarfValueLayout:
+	def __init__(self, kind, size):
+		self.kind = kind
+		self.size = size			# Size in bytes
+		self.st = None				# struct.Struct; see above
+		self.enumnames = None		# Value --> enumerator name (enum); see DwarfEnumMap
+		self.members = None			# List of member decoders (struct, union); see DwarfValueDecoder
+		self.element = None			# Layout of the elements (array)
+		self.dims = None			# No. of elements in each dimension (array)
+		self.count = 0				# Total no. of elements (array)
+
+	# Returns True if the value is decoded by a single struct format character
+	#
+	def IsScalar(self):
+		return self.kind == 'scalar' or self.kind == 'enum' or self.kind == 'bool'
+
+	# Convert a decoded scalar
+	#
+	def Convert(self, v):
+		if self.kind == 'enum':
+			return self.enumnames.get(v, v)		# A number that isn't in the enumeration stays a number
+		elif self.kind == 'bool':
+			return v != 0
+		return v
+
+	# Decode a value from buf, starting at off
+	#
+	def Decode(self, buf, off):
+		kind = self.kind
+		if kind == 'scalar':
+			return self.st.unpack_from(buf, off)[0]
+		if kind == 'enum' or kind == 'bool':
+			return self.Convert(self.st.unpack_from(buf, off)[0])
+		if kind == 'struct':
+			values = self.st.unpack_from(buf, off)
+			d = {}
+			for (name, how, a, b, c, layout) in self.members:
+				if how == 'flat':
+					v = values[a]
+					if layout.kind != 'scalar':
+						v = layout.Convert(v)
+				elif how == 'nested':
+					v = layout.Decode(buf, off + a)
+				elif how == 'bits':
+					v = DwarfValueLayout.DecodeBits(buf, off, a, b, c, layout)
+				else:
+					v = None				# The member's location isn't known
+				if name == '' and type(v) is dict:
+					d.update(v)				# Anonymous struct or union
+				else:
+					d[name] = v
+			return d
+		if kind == 'union':
+			d = {}
+			for (name, how, a, b, c, layout) in self.members:
+				if how == 'bits':
+					v = DwarfValueLayout.DecodeBits(buf, off, a, b, c, layout)
+				elif how == None:
+					v = None
+				else:
+					v = layout.Decode(buf, off + a)
+				if name == '' and type(v) is dict:
+					d.update(v)
+				else:
+					d[name] = v
+			return d
+		if kind == 'array':
+			e = self.element
+			if self.st != None:
+				values = self.st.unpack_from(buf, off)
+				if e.kind == 'enum':
+					get = e.enumnames.get
+					values = [get(v, v) for v in values]
+				elif e.kind != 'scalar':
+					values = [e.Convert(v) for v in values]
+				else:
+					values = list(values)
+			else:
+				values = [e.Decode(buf, off + i * e.size) for i in range(self.count)]
+			return DwarfValueLayout.Reshape(values, self.dims)
+		return bytes(buf[off:off+self.size])
+
+	# Decode a bitfield
+	# bitoff is the number of bits from the start of the containing object to the first bit of the field,
+	# counted as DW_AT_data_bit_offset counts them: from the least significant bit of the first byte on a
+	# little-endian target, from the most significant bit on a big-endian target.
+	# layout is the layout of the field's type; its struct format says whether the field is signed.
+	#
+	@staticmethod
+	def DecodeBits(buf, off, bitoff, bitsize, byteorder, layout):
+		start = off + bitoff // 8
+		shift = bitoff % 8
+		nbytes = (shift + bitsize + 7) // 8
+		v = int.from_bytes(buf[start:start+nbytes], byteorder)
+		if byteorder == 'big':
+			shift = nbytes * 8 - shift - bitsize
+		v = (v >> shift) & ((1 << bitsize) - 1)
+		if layout.st != None and layout.st.format[-1] in 'bhiq' and (v >> (bitsize - 1)):
+			v = v - (1 << bitsize)
+		return layout.Convert(v)
+
+	# Split a flat list of elements into nested lists, one level per dimension
+	#
+	@staticmethod
+	def Reshape(values, dims):
+		for n in reversed(dims[1:]):
+			if n == 0:
+				return []
+			values = [values[i:i+n] for i in range(0, len(values), n)]
+		return values
+
+# ==============================================================================
+#
+# DwarfValueDecoder - decodes variables from the contents of an ELF file
+# The layout of each type is worked out once and kept, so decoding a variable costs one read of its
+# bytes from the section table and one struct.unpack_from() per struct or array of scalars in it.
+# addresssize is the size of a pointer in bytes (4 for ELFCLASS32, 8 for ELFCLASS64). It is used for
+# pointer types that have no DW_AT_byte_size.
+#
+class DwarfValueDecoder:
+	def __init__(self, sectiontable, addresssize=8):
+		self.sections = sectiontable
+		self.addresssize = addresssize
+		self.byteorder = sectiontable.byteorder
+		if self.byteorder == 'little':
+			self.bo = '<'
+		else:
+			self.bo = '>'
+		self.layouts = {}			# Base type object (see DwarfTypeInfo) --> DwarfValueLayout
+
+	# Decode the value of a variable
+	# Returns None if the variable has no address or its bytes are not in a section with contents.
+	#
+	def DecodeVariable(self, v):
+		addr = v.GetValue()
+		t = v.GetTypeTarget()
+		spec = v.GetSpecref()
+		if spec != None:
+			if addr == None:
+				addr = spec.GetValue()
+			if t == None:
+				t = spec.GetTypeTarget()
+		if addr == None or t == None:
+			return None
+		return self.DecodeAt(t, addr)
+
+	# Decode a value of the given type at the given address
+	# Returns None if the bytes are not in a section with contents.
+	#
+	def DecodeAt(self, t, addr):
+		layout = self.GetLayout(t)
+		if layout == None or layout.size == None:
+			return None
+		buf = self.sections.LoadBytes(addr, layout.size)
+		if buf == None:
+			return None
+		if stats.enabled:
+			stats.Count('values decoded')
+		return layout.Decode(buf, 0)
+
+	# Return the layout for a type object; None if the type has no size (void)
+	#
+	def GetLayout(self, t):
+		ti = t.GetTypeInfo()
+		base = ti.base
+		if base == None:
+			return None
+		try:
+			return self.layouts[base]
+		except KeyError:
+			pass
+		if stats.enabled:
+			stats.Count('layouts made')
+		layout = self.MakeLayout(ti)
+		self.layouts[base] = layout
+		return layout
+
+	# Work out the layout of a type from its descriptor
+	#
+	def MakeLayout(self, ti):
+		base = ti.base
+		size = ti.bytesize
+		kind = ti.kind
+		if kind == 'pointer':
+			if size == None:
+				size = self.addresssize
+			return self.MakeScalar('scalar', unsignedFormats.get(size), size)
+		if kind == 'base':
+			enc = base.GetAttr('DW_AT_encoding')
+			if enc == DW_ATE_float:
+				f = floatFormats.get(size)
+			elif enc == DW_ATE_signed or enc == DW_ATE_signed_char:
+				f = signedFormats.get(size)
+			else:
+				f = unsignedFormats.get(size)
+			if enc == DW_ATE_boolean:
+				return self.MakeScalar('bool', f, size)
+			return self.MakeScalar('scalar', f, size)
+		if kind == 'enum':
+			signed = False
+			under = base.GetTypeTarget()
+			if under != None:
+				ub = under.GetTypeInfo().base
+				if ub != None and ub.GetAttr('DW_AT_encoding') in (DW_ATE_signed, DW_ATE_signed_char):
+					signed = True
+			em = base.GetEnumMap()
+			for n in em.names:
+				if type(n) is int and n < 0:
+					signed = True
+			if signed:
+				f = signedFormats.get(size)
+			else:
+				f = unsignedFormats.get(size)
+			layout = self.MakeScalar('enum', f, size)
+			layout.enumnames = em.names
+			return layout
+		if kind == 'struct' or kind == 'union':
+			return self.MakeComposite(kind, base, size)
+		if kind == 'array':
+			return self.MakeArray(base, ti)
+		return DwarfValueLayout('raw', size)
+
+	# Make the layout of a scalar; a raw layout if there is no struct format for it
+	#
+	def MakeScalar(self, kind, f, size):
+		if f == None:
+			return DwarfValueLayout('raw', size)
+		layout = DwarfValueLayout(kind, size)
+		layout.st = struct.Struct(self.bo + f)
+		return layout
+
+	# Make the layout of a struct or union
+	# Each member becomes a tuple  name, how, a, b, c, layout  where how is
+	#   flat    - a scalar member of a struct, decoded by the struct's format; a is the index in the result
+	#   nested  - any other member at offset a
+	#   bits    - a bitfield: a is the bit offset, b the no. of bits and c the byte order
+	#   None    - a member whose location is not known
+	#
+	def MakeComposite(self, kind, base, size):
+		layout = DwarfValueLayout(kind, size)
+		members = []
+		fmt = ''
+		pos = 0
+		nflat = 0
+		for m in base.children:
+			if m.GetTag() != 'DW_TAG_member':
+				continue
+			t = m.GetTypeTarget()
+			if t == None:
+				continue
+			ml = self.GetLayout(t)
+			if ml == None:
+				continue
+			name = m.GetName()
+			off = m.GetAttr('DW_AT_data_member_location')
+			bitsize = m.GetAttr('DW_AT_bit_size')
+			if bitsize != None:
+				bitoff = self.GetBitOffset(m, ml.size)
+				if bitoff == None:
+					members.append((name, None, 0, 0, 0, ml))
+				else:
+					members.append((name, 'bits', bitoff, bitsize, self.byteorder, ml))
+				continue
+			if off == None:
+				off = 0
+			elif type(off) is not int:
+				members.append((name, None, 0, 0, 0, ml))
+				continue
+			if kind == 'struct' and ml.IsScalar() and off >= pos:
+				fmt = fmt + 'x' * (off - pos) + ml.st.format[-1]
+				pos = off + ml.size
+				members.append((name, 'flat', nflat, 0, 0, ml))
+				nflat = nflat + 1
+			else:
+				members.append((name, 'nested', off, 0, 0, ml))
+		layout.st = struct.Struct(self.bo + fmt)
+		layout.members = members
+		if layout.size == None:
+			layout.size = max([layout.st.size] + [a + l.size for (n, h, a, b, c, l) in members
+															if h == 'nested' and l.size != None])
+		return layout
+
+	# Return the offset of a bitfield as DW_AT_data_bit_offset gives it
+	# DWARF 2 and 3 give the offset of the storage unit (DW_AT_data_member_location) and the position of
+	# the field in it, counted from the most significant bit (DW_AT_bit_offset). Returns None if neither
+	# form is there. unitsize is the size of the field's type, for when the member has no DW_AT_byte_size.
+	#
+	def GetBitOffset(self, m, unitsize):
+		dbo = m.GetAttr('DW_AT_data_bit_offset')
+		if type(dbo) is int:
+			return dbo
+		bo = m.GetAttr('DW_AT_bit_offset')
+		if type(bo) is not int:
+			return None
+		bitsize = m.GetAttr('DW_AT_bit_size')
+		off = m.GetAttr('DW_AT_data_member_location')
+		if type(off) is not int:
+			off = 0
+		if self.byteorder == 'big':
+			return off * 8 + bo
+		unit = m.GetAttr('DW_AT_byte_size')
+		if unit == None:
+			unit = unitsize
+		return off * 8 + unit * 8 - bo - bitsize
+
+	# Make the layout of an array
+	#
+	def MakeArray(self, base, ti):
+		e = base.GetTypeTarget()
+		if e == None:
+			return DwarfValueLayout('raw', ti.bytesize)
+		el = self.GetLayout(e)
+		if el == None or el.size == None:
+			return DwarfValueLayout('raw', ti.bytesize)
+		dims = []
+		for s in base.children:
+			if s.GetTag() != 'DW_TAG_subrange_type':
+				continue
+			n = s.GetAttr('DW_AT_count')
+			if n == None:
+				n = s.GetAttr('DW_AT_upper_bound')
+				if type(n) is int:
+					n = n + 1
+			if type(n) is not int:
+				n = 0				# No bound: a flexible array member
+			dims.append(n)
+		if len(dims) == 0:
+			dims = [0]
+		return self.ArrayOf(el, dims)
+
+	# Make the layout of an array of elements with layout el and the given dimensions
+	#
+	def ArrayOf(self, el, dims):
+		count = 1
+		for n in dims:
+			count = count * n
+		layout = DwarfValueLayout('array', count * el.size)
+		layout.element = el
+		layout.dims = dims
+		layout.count = count
+		if el.IsScalar():
+			layout.st = struct.Struct(self.bo + str(count) + el.st.format[-1])
+		return layout
@@ -21,10 +21,276 @@
 
 import os
 import sys
+import mmap
+import struct
+import bisect
+import zlib
+from array import array
+
+from elfstats import stats
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 class ElfError(Exception):
 	pass
 
+# ==============================================================================
+#
+# ELF constants, and the names that readelf uses for them
+#
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+SHN_UNDEF = 0
+SHN_LORESERVE = 0xff00
+SHN_ABS = 0xfff1
+SHN_COMMON = 0xfff2
+SHN_XINDEX = 0xffff
+
+SHT_NULL = 0
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_NOBITS = 8
+SHT_DYNSYM = 11
+SHT_GNU_verdef = 0x6ffffffd
+SHT_GNU_verneed = 0x6ffffffe
+SHT_GNU_versym = 0x6fffffff
+
+VERSYM_HIDDEN = 0x8000
+
+shtNames = {
+	0: 'NULL', 1: 'PROGBITS', 2: 'SYMTAB', 3: 'STRTAB', 4: 'RELA', 5: 'HASH', 6: 'DYNAMIC',
+	7: 'NOTE', 8: 'NOBITS', 9: 'REL', 10: 'SHLIB', 11: 'DYNSYM', 14: 'INIT_ARRAY',
+	15: 'FINI_ARRAY', 16: 'PREINIT_ARRAY', 17: 'GROUP', 18: 'SYMTAB SECTION INDICES', 19: 'RELR',
+	0x6ffffff5: 'GNU_ATTRIBUTES', 0x6ffffff6: 'GNU_HASH', 0x6ffffff7: 'GNU_LIBLIST',
+	0x6ffffffd: 'VERDEF', 0x6ffffffe: 'VERNEED', 0x6fffffff: 'VERSYM',
+	0x70000001: 'ARM_EXIDX', 0x70000003: 'ARM_ATTRIBUTES'
+}
+
+NT_GNU_BUILD_ID = 3
+
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+SHF_TLS = 0x400
+SHF_COMPRESSED = 0x800
+
+# Symbol types, bindings and visibilities as readelf prints them
+sttNames = {
+	0: 'NOTYPE', 1: 'OBJECT', 2: 'FUNC', 3: 'SECTION', 4: 'FILE', 5: 'COMMON', 6: 'TLS', 10: 'IFUNC'
+}
+stbNames = {
+	0: 'LOCAL', 1: 'GLOBAL', 2: 'WEAK', 10: 'UNIQUE'
+}
+stvNames = {
+	0: 'DEFAULT', 1: 'INTERNAL', 2: 'HIDDEN', 3: 'PROTECTED'
+}
+shnNames = {
+	SHN_UNDEF: 'UND', SHN_ABS: 'ABS', SHN_COMMON: 'COM'
+}
+
+# Section flags in the order that readelf prints them
+shfLetters = [
+	('W', 0x1), ('A', 0x2), ('X', 0x4), ('M', 0x10), ('S', 0x20), ('I', 0x40), ('L', 0x80),
+	('O', 0x100), ('G', 0x200), ('T', 0x400), ('C', 0x800), ('R', 0x200000), ('E', 0x80000000)
+]
+
+# The last word of readelf's description of the machine, which is what ElfHeader has always stored
+emNames = {
+	2: 'Sparc', 3: '80386', 4: 'MC68000', 8: 'R3000', 20: 'PowerPC', 21: 'PowerPC64',
+	40: 'ARM', 42: 'SH', 43: 'Sparc', 44: 'Tricore', 62: 'X86-64', 83: 'microcontroller',
+	87: 'V850', 88: 'M32R', 92: 'OpenRISC', 94: 'Xtensa', 183: 'AArch64', 243: 'RISC-V'
+}
+
+# ==============================================================================
+#
+# ElfReader - map the ELF file into memory and decode the file header and section header table
+#
+class ElfReader:
+	def __init__(self, elffilename, parse=True):
+		self.elffilename = elffilename
+		self.elfclass = ''
+		self.endian = ''
+		self.bits = 0
+		self.bo = '<'				# Byte order character for the struct module
+		self.header = None
+		self.sections = []			# Tuples: name, type, flags, addr, offset, size, link, info, align, entsize
+		self.image = None			# Read-only mmap of the whole file
+		self.Map()
+		if parse:
+			self.Read()
+
+	# Map the file into memory
+	#
+	def Map(self):
+		try:
+			f = open(self.elffilename, 'rb')
+		except OSError as e:
+			raise ElfError(self.elffilename + ': ' + e.strerror)
+		try:
+			self.image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			raise ElfError(self.elffilename + ' doesn\'t appear to be an ELF binary file')
+		finally:
+			f.close()				# The mapping remains valid after the file is closed
+
+	# Decode the identification, the file header and the section header table
+	#
+	def Read(self):
+		image = self.image
+		ident = image[0:16]
+		if len(ident) < 16 or ident[0:4] != b'\x7fELF':
+			raise ElfError(self.elffilename + ' doesn\'t appear to be an ELF binary file')
+		if ident[4] == ELFCLASS32:
+			self.elfclass = 'ELF32'
+			self.bits = 32
+			hfmt = 'HHIIIIIHHHHHH'
+			sfmt = 'IIIIIIIIII'
+		elif ident[4] == ELFCLASS64:
+			self.elfclass = 'ELF64'
+			self.bits = 64
+			hfmt = 'HHIQQQIHHHHHH'
+			sfmt = 'IIQQQQIIQQ'
+		else:
+			raise ElfError(self.elffilename + ': unknown ELF class ' + str(ident[4]))
+		if ident[5] == ELFDATA2LSB:
+			self.endian = 'little'
+			self.bo = '<'
+		elif ident[5] == ELFDATA2MSB:
+			self.endian = 'big'
+			self.bo = '>'
+		else:
+			raise ElfError(self.elffilename + ': unknown ELF data encoding ' + str(ident[5]))
+
+		hstruct = struct.Struct(self.bo + hfmt)
+		if len(image) < 16 + hstruct.size:
+			raise ElfError(self.elffilename + ': truncated ELF header')
+		self.header = hstruct.unpack_from(image, 16)
+		(etype, machine, version, entry, phoff, shoff, flags,
+			ehsize, phentsize, phnum, shentsize, shnum, shstrndx) = self.header
+		self.machine = machine
+
+		if shoff == 0:
+			return						# No section header table
+		sstruct = struct.Struct(self.bo + sfmt)
+		if shentsize < sstruct.size:
+			raise ElfError(self.elffilename + ': section header entries are too small')
+		if shoff + sstruct.size > len(image):
+			raise ElfError(self.elffilename + ': truncated section header table')
+
+		# The real number of sections and the string table index might be in section 0
+		s0 = sstruct.unpack_from(image, shoff)
+		if shnum == 0:
+			shnum = s0[5]
+		if shstrndx == SHN_XINDEX:
+			shstrndx = s0[6]
+
+		if shoff + shnum * shentsize > len(image):
+			raise ElfError(self.elffilename + ': truncated section header table')
+		raw = [sstruct.unpack_from(image, shoff + i * shentsize) for i in range(shnum)]
+
+		stroff = 0
+		strend = 0
+		if 0 < shstrndx < shnum:
+			stroff = raw[shstrndx][4]
+			strend = min(stroff + raw[shstrndx][5], len(image))
+		for s in raw:
+			name = ''
+			if stroff + s[0] < strend:
+				end = image.find(b'\0', stroff + s[0], strend)
+				if end < 0:
+					end = strend
+				name = image[stroff + s[0]:end].decode('utf-8', 'replace')
+			self.sections.append((name,) + s[1:])
+
+	# Return the index of the named section; -1 if there is no such section
+	#
+	def FindSection(self, name):
+		for idx in range(len(self.sections)):
+			if self.sections[idx][0] == name:
+				return idx
+		return -1
+
+	# Return the contents of the named section as a tuple  buf, start, size  where buf is the mapped file
+	# and the contents occupy buf[start:start+size]. Returns None if the section doesn't exist or has no
+	# contents in the file.
+	# Compressed sections (SHF_COMPRESSED, or the older .zdebug_ naming) are decompressed; buf is then a
+	# bytes object and start is 0.
+	#
+	def GetSectionData(self, name):
+		idx = self.FindSection(name)
+		zname = False
+		if idx < 0 and name.startswith('.debug_'):
+			idx = self.FindSection('.z' + name[1:])
+			zname = True
+		if idx < 0:
+			return None
+		(n, stype, flags, addr, offset, size, link, info, align, entsize) = self.sections[idx]
+		if stype == SHT_NOBITS or stype == SHT_NULL or offset + size > len(self.image):
+			return None
+		if flags & SHF_COMPRESSED:
+			if self.bits == 64:
+				chdr = struct.Struct(self.bo + 'IIQQ')
+				(ctype, reserved, csize, calign) = chdr.unpack_from(self.image, offset)
+			else:
+				chdr = struct.Struct(self.bo + 'III')
+				(ctype, csize, calign) = chdr.unpack_from(self.image, offset)
+			if ctype != 1:
+				raise ElfError(self.elffilename + ': section ' + n + ' uses unsupported compression ' + str(ctype))
+			data = zlib.decompress(self.image[offset + chdr.size:offset + size])
+			return (data, 0, len(data))
+		if zname:
+			if self.image[offset:offset+4] != b'ZLIB':
+				return (self.image, offset, size)
+			data = zlib.decompress(self.image[offset + 12:offset + size])
+			return (data, 0, len(data))
+		return (self.image, offset, size)
+
+	# Return the GNU build ID (the contents of the NT_GNU_BUILD_ID note) as a hex string
+	# Returns '' if the file doesn't have one.
+	#
+	def GetBuildId(self):
+		d = self.GetSectionData('.note.gnu.build-id')
+		if d == None:
+			return ''
+		(buf, pos, size) = d
+		end = pos + size
+		while pos + 12 <= end:
+			(namesz, descsz, ntype) = struct.unpack_from(self.bo + 'III', buf, pos)
+			name = pos + 12
+			desc = name + ((namesz + 3) & ~3)
+			if desc + descsz > end:
+				break
+			if ntype == NT_GNU_BUILD_ID and buf[name:name+namesz] == b'GNU\0':
+				return buf[desc:desc+descsz].hex()
+			pos = desc + ((descsz + 3) & ~3)
+		return ''
+
+	# Return the section header fields in the form that readelf -SW prints them
+	#
+	def GetSectionFields(self, idx):
+		(name, stype, flags, addr, offset, size, link, info, align, entsize) = self.sections[idx]
+		try:
+			tname = shtNames[stype]
+		except KeyError:
+			tname = hex(stype)
+		flg = ''
+		for (letter, bit) in shfLetters:
+			if flags & bit:
+				flg = flg + letter
+		if self.bits == 64:
+			a = '%016x' % addr
+		else:
+			a = '%08x' % addr
+		return [name, tname, a, '%06x' % offset, '%06x' % size, '%02x' % entsize,
+				flg, str(link), str(info), str(align)]
+
 # ==============================================================================
 #
 # Elf - standalone functions and other useful odds'n'ends
@@ -79,30 +345,47 @@ class ElfHeader:
 		return self.bits
 
 	# Read the header and extract useful information from it
+	# The header is decoded directly from the file unless usereadelf is True.
 	#
-	def Read(self, elffilename):
-		cmd = 'readelf -h ' + elffilename
-		elfpipe = os.popen(cmd)
-		for line in elfpipe:
-			line = line.rstrip()
-			fields = line.split()
+	def Read(self, elffilename, usereadelf=False):
+		with stats.Phase('ElfHeader.Read'):
+			if usereadelf:
+				self.ReadWithReadelf(elffilename)
+				return
+			er = ElfReader(elffilename)
+			self.elfclass = er.elfclass
+			self.endian = er.endian
+			self.bits = er.bits
 			try:
-				if fields[0] == 'Class:':
-					self.elfclass = fields[1]
-				elif fields[0] == 'Data:':
-					self.endian = fields[-2]
-				elif fields[0] == 'Machine:':
-					self.machine = fields[-1]
-			except:
-				pass
-		elfpipe.close()
-		if self.elfclass == 'ELF64':
-			self.bits = 64
-		elif self.elfclass == 'ELF32':
-			self.bits = 32
-		else:
-			raise ElfError(elffilename + ' doesn\'t appear to be an ELF binary file')
-		return
+				self.machine = emNames[er.machine]
+			except KeyError:
+				self.machine = hex(er.machine)
+
+	# Read the header using the output of readelf -h
+	#
+	def ReadWithReadelf(self, elffilename):
+		with stats.Phase('readelf -h'):
+			cmd = 'readelf -h ' + elffilename
+			elfpipe = os.popen(cmd)
+			for line in elfpipe:
+				line = line.rstrip()
+				fields = line.split()
+				try:
+					if fields[0] == 'Class:':
+						self.elfclass = fields[1]
+					elif fields[0] == 'Data:':
+						self.endian = fields[-2]
+					elif fields[0] == 'Machine:':
+						self.machine = fields[-1]
+				except:
+					pass
+			elfpipe.close()
+			if self.elfclass == 'ELF64':
+				self.bits = 64
+			elif self.elfclass == 'ELF32':
+				self.bits = 32
+			else:
+				raise ElfError(elffilename + ' doesn\'t appear to be an ELF binary file')
 
 # ==============================================================================
 #
@@ -123,16 +406,111 @@ class ElfSymbol:
 			self.name = None
 
 
+# ==============================================================================
+#
+# ElfAddressIndex - the symbols of an ElfSymbolTable sorted by address
+#
+# Symbols without a name are not indexed. If symtypes is given (e.g. ['OBJECT']) only symbols of those
+# types are indexed. Symbols at the same address stay in symbol table order.
+#
+# A symbol contains the addresses from its value up to value+size-1. A symbol with size 0 contains
+# only its own address. For the search for the symbols that contain an address the symbols are also
+# put into classes by size: class c holds the symbols that cover fewer than 2**c addresses, so only
+# the ones that start less than 2**c below the address need to be looked at. A single huge symbol
+# therefore does not make the search go through all the symbols after it.
+#
+class ElfAddressIndex:
+	def __init__(self, symtab, symtypes=None):
+		with stats.Phase('ElfAddressIndex'):
+			values = symtab.values
+			sizes = symtab.sizes
+			nameoffs = symtab.nameoffs
+			idxs = [i for i in range(len(values)) if nameoffs[i] != 0]
+			if symtypes != None:
+				idxs = [i for i in idxs if symtab.GetTypeByIndex(i) in symtypes]
+			idxs.sort(key=values.__getitem__)		# Stable, so ties stay in symbol table order
+			self.order = array('Q', idxs)
+			self.starts = array('Q', [values[i] for i in idxs])
+			self.sizes = array('Q', [sizes[i] for i in idxs])
+			self.ends = array('Q', [values[i] + max(sizes[i], 1) for i in idxs])
+			byclass = {}
+			for i in range(len(idxs)):
+				byclass.setdefault((self.ends[i] - self.starts[i]).bit_length(), []).append(i)
+			self.classes = []			# List of  limit, starts, positions  with limit = 2**c
+			for c in sorted(byclass):
+				positions = byclass[c]
+				self.classes.append((1 << c, array('Q', [self.starts[i] for i in positions]), array('Q', positions)))
+
+	# Returns the indexes of the symbols that start at the given address
+	#
+	def FindAtAddress(self, addr):
+		lo = bisect.bisect_left(self.starts, addr)
+		hi = bisect.bisect_right(self.starts, addr, lo)
+		return self.order[lo:hi].tolist()
+
+	# Returns the highest symbol address that is less than or equal to the given address; None if there is none
+	#
+	def FindLower(self, addr):
+		i = bisect.bisect_right(self.starts, addr) - 1
+		if i < 0:
+			return None
+		return self.starts[i]
+
+	# Returns the indexes of all the symbols that contain the given address, innermost first
+	# Symbols with a size come before zero-size symbols, then smaller before larger. Ties stay in
+	# symbol table order.
+	#
+	def FindAllContaining(self, addr):
+		found = self.Candidates(addr)
+		found.sort(key=self.ContainingRank)
+		return [self.order[i] for i in found]
+
+	# Returns the index of the innermost symbol that contains the given address; -1 if there is none
+	#
+	def FindContaining(self, addr):
+		found = self.Candidates(addr)
+		if len(found) == 0:
+			return -1
+		return self.order[min(found, key=self.ContainingRank)]
+
+	# Returns the positions of all the symbols that contain the given address, in no particular order
+	#
+	def Candidates(self, addr):
+		found = []
+		for (limit, starts, positions) in self.classes:
+			lo = bisect.bisect_right(starts, addr - limit)
+			hi = bisect.bisect_right(starts, addr, lo)
+			if stats.enabled:
+				stats.Count('containing symbol candidates', hi - lo)
+			for i in positions[lo:hi]:
+				if self.ends[i] > addr:
+					found.append(i)
+		return found
+
+	# Sort key for symbols that contain the same address
+	#
+	def ContainingRank(self, i):
+		size = self.sizes[i]
+		return (size == 0, size, self.order[i])
+
 # ==============================================================================
 #
 # ElfSymbolTable - read and store the ELF symbol table
 #
 class ElfSymbolTable:
 	def __init__(self):
-		self.symtab = []
-		self.byName = {}
-		self.byAddress = {}
-		self.sortedAddress = []
+		# The symbols are stored column by column. Index n in each array belongs to symbol n.
+		self.values = array('Q')
+		self.sizes = array('Q')
+		self.infos = array('B')		# Type (low 4 bits) and binding (high 4 bits)
+		self.others = array('B')	# Visibility
+		self.shndxs = array('H')
+		self.nameoffs = array('Q')	# Offset of the name in self.strings; 0 if the symbol has no name
+		self.strings = b''			# The string tables (the mapped file, for the native reader)
+		self.tablestarts = [0]		# Index of the first symbol of each symbol table section
+		self.versions = {}			# Symbol index --> version suffix of a .dynsym name, e.g. '@GLIBC_2.34'
+		self.byName = None			# Built on first use
+		self.addressIndexes = {}	# ElfAddressIndex objects, by symbol type filter. Built on first use
 		self.sectiontable = None
 
 	# Set the section table
@@ -142,47 +520,237 @@ class ElfSymbolTable:
 		self.sectiontable = st
 
 	# Reads the symbol table from the specified file
+	# The .dynsym and .symtab sections are decoded directly from the file unless usereadelf is True.
 	#
-	def Read(self, elffilename):
-		cmd = 'readelf -sW ' + elffilename
-		idx = 0
-		elfpipe = os.popen(cmd)
-		for line in elfpipe:
-			line = line.rstrip()
-			fields = line.split()
-			if len(fields) == 0 or fields[0] == 'Symbol' or fields[0] == 'Num:':
-				# Ignore headers and blank lines
-				pass
-			else:
-				# Add the fields to the symbol table
-				s = ElfSymbol(fields)
-				self.symtab.append(s)
-				# The symbol name is in field 7 so we need at least 8 fields
-				if s.name != None:
-					# Add the symbol name to the byName dictionary.
-					# The names should be unique, so we overwrite anything that's already there
-					self.byName[s.name] = idx
-
-					# Add the symbol to the byAddress dictionary.
-					# There could be several symbols at any address, so we append to the list.
-					# If there's no symbol at the address we create an empty list first.
-					addr = s.value
+	def Read(self, elffilename, usereadelf=False):
+		with stats.Phase('ElfSymbolTable.Read'):
+			if usereadelf:
+				self.ReadWithReadelf(elffilename)
+				return
+			er = ElfReader(elffilename)
+			self.strings = er.image
+			for (idx, s) in enumerate(er.sections):
+				if s[1] == SHT_SYMTAB or s[1] == SHT_DYNSYM:
+					first = len(self.values)
+					self.ReadTable(er, s)
+					if s[1] == SHT_DYNSYM:
+						self.ReadVersions(er, idx, first)
+
+	# Decode one symbol table section into the column arrays
+	# The fields are picked out of the section with strided array slices, so there is no loop per symbol
+	# except for relocating the name offsets.
+	#
+	def ReadTable(self, er, s):
+		(name, stype, flags, addr, offset, size, link, info, align, entsize) = s
+		if er.bits == 64:
+			symsize = 24
+			atype = 'Q'
+		else:
+			symsize = 16
+			atype = 'I'
+		if entsize != symsize or link >= len(er.sections):
+			raise ElfError(er.elffilename + ': cannot decode symbol table ' + name)
+		n = size // symsize
+		if offset + n * symsize > len(er.image):
+			raise ElfError(er.elffilename + ': symbol table ' + name + ' extends beyond the end of the file')
+		buf = er.image[offset:offset + n * symsize]
+		if len(self.values) > 0:
+			self.tablestarts.append(len(self.values))
+		swap = (er.endian != sys.byteorder)
+
+		words = array('I', buf)
+		halves = array('H', buf)
+		wide = array(atype, buf)
+		if swap:
+			words.byteswap()
+			halves.byteswap()
+			wide.byteswap()
+		if er.bits == 64:
+			# Elf64_Sym: name(4) info(1) other(1) shndx(2) value(8) size(8)
+			names = words[0::6]
+			self.values.extend(wide[1::3])
+			self.sizes.extend(wide[2::3])
+			self.infos.frombytes(buf[4::24])
+			self.others.frombytes(buf[5::24])
+			self.shndxs.extend(halves[3::12])
+		else:
+			# Elf32_Sym: name(4) value(4) size(4) info(1) other(1) shndx(2)
+			names = words[0::4]
+			self.values.extend(wide[1::4])
+			self.sizes.extend(wide[2::4])
+			self.infos.frombytes(buf[12::16])
+			self.others.frombytes(buf[13::16])
+			self.shndxs.extend(halves[7::8])
+
+		stroff = er.sections[link][4]
+		self.nameoffs.extend([nm + stroff if nm != 0 else 0 for nm in names])
+
+	# Decode the symbol versions of the .dynsym section with index dynidx, whose first symbol is at index
+	# first, into self.versions
+	# The suffixes are the ones that readelf appends: @@VERSION for the default version of a defined
+	# symbol, @VERSION for a hidden version or a version that an undefined symbol needs.
+	#
+	def ReadVersions(self, er, dynidx, first):
+		versym = None
+		verdefs = {}				# Version index --> name, from .gnu.version_d
+		verneeds = {}				# Version index --> name, from .gnu.version_r
+		image = er.image
+		for s in er.sections:
+			(name, stype, flags, addr, offset, size, link, info, align, entsize) = s
+			if stype == SHT_GNU_versym and link == dynidx:
+				versym = array('H', image[offset:offset + size - size % 2])
+				if er.endian != sys.byteorder:
+					versym.byteswap()
+			elif stype == SHT_GNU_verdef and link < len(er.sections):
+				stroff = er.sections[link][4]
+				pos = offset
+				for i in range(info):
+					(ndx, cnt, aux, nxt) = struct.unpack_from(er.bo + '4xHH4xII', image, pos)
+					if cnt > 0:
+						verdefs[ndx] = self.ReadVersionName(image, stroff, struct.unpack_from(er.bo + 'I', image, pos + aux)[0])
+					if nxt == 0:
+						break
+					pos = pos + nxt
+			elif stype == SHT_GNU_verneed and link < len(er.sections):
+				stroff = er.sections[link][4]
+				pos = offset
+				for i in range(info):
+					(cnt, aux, nxt) = struct.unpack_from(er.bo + '2xH4xII', image, pos)
+					apos = pos + aux
+					for j in range(cnt):
+						(other, vname, anxt) = struct.unpack_from(er.bo + '6xHII', image, apos)
+						verneeds[other] = self.ReadVersionName(image, stroff, vname)
+						if anxt == 0:
+							break
+						apos = apos + anxt
+					if nxt == 0:
+						break
+					pos = pos + nxt
+		if versym == None:
+			return
+		n = min(len(versym), len(self.values) - first)
+		for i in range(n):
+			v = versym[i]
+			ndx = v & 0x7fff
+			if ndx < 2 or self.nameoffs[first + i] == 0:
+				continue						# Local or global: no version
+			if self.shndxs[first + i] != SHN_UNDEF and ndx in verdefs:
+				if self.shndxs[first + i] == SHN_ABS and self.GetNameByIndex(first + i) == verdefs[ndx]:
+					continue					# The symbol that names a version definition
+				if v & VERSYM_HIDDEN:
+					self.versions[first + i] = '@' + verdefs[ndx]
+				else:
+					self.versions[first + i] = '@@' + verdefs[ndx]
+			elif ndx in verneeds:
+				self.versions[first + i] = '@' + verneeds[ndx]
+
+	# Return a version name from a string table
+	#
+	def ReadVersionName(self, image, stroff, off):
+		start = stroff + off
+		end = image.find(b'\0', start)
+		if end < 0:
+			end = len(image)
+		return image[start:end].decode('utf-8', 'replace')
+
+	# Reads the symbol table from the output of readelf -sW
+	# The names are collected into a string table of our own so that the storage is the same as for the
+	# native reader.
+	#
+	def ReadWithReadelf(self, elffilename):
+		with stats.Phase('readelf -s'):
+			sttCodes = dict([(v, k) for (k, v) in sttNames.items()])
+			stbCodes = dict([(v, k) for (k, v) in stbNames.items()])
+			stvCodes = dict([(v, k) for (k, v) in stvNames.items()])
+			shnCodes = dict([(v, k) for (k, v) in shnNames.items()])
+			strings = bytearray(b'\0')
+			cmd = 'readelf -sW ' + elffilename
+			elfpipe = os.popen(cmd)
+			for line in elfpipe:
+				line = line.rstrip()
+				fields = line.split()
+				if len(fields) == 0 or fields[0] == 'Symbol' or fields[0] == 'Num:':
+					# Ignore headers and blank lines
+					pass
+				else:
+					if fields[0] == '0:' and len(self.values) > 0:
+						self.tablestarts.append(len(self.values))
+					self.values.append(int(fields[1], 16))
+					self.sizes.append(int(fields[2], 0))
+					self.infos.append((stbCodes.get(fields[4], 0) << 4) | sttCodes.get(fields[3], 0))
+					self.others.append(stvCodes.get(fields[5], 0))
 					try:
-						x = self.byAddress[addr]
-					except:
-						self.byAddress[addr] = []
-					self.byAddress[addr].append(idx)
-				idx = idx + 1
-		elfpipe.close()
+						self.shndxs.append(shnCodes[fields[6]])
+					except KeyError:
+						self.shndxs.append(int(fields[6]))
+					# The symbol name is in field 7 so we need at least 8 fields
+					if len(fields) >= 8:
+						self.nameoffs.append(len(strings))
+						strings.extend(fields[7].encode('utf-8') + b'\0')
+					else:
+						self.nameoffs.append(0)
+			elfpipe.close()
+			self.strings = bytes(strings)
 
-		# Store the symbol addresses in a sorted list for looking up arrays
-		self.sortAddress = sorted(list(self.byAddress.keys()))
+	# Returns the number of symbols
+	#
+	def GetSymbolCount(self):
+		return len(self.values)
 
-		return
+	# Returns the name of the symbol at the given index, or None if the symbol has no name
+	# Only this symbol's name is decoded.
+	#
+	def GetNameByIndex(self, idx):
+		off = self.nameoffs[idx]
+		if off == 0:
+			return None
+		end = self.strings.find(b'\0', off)
+		if end < 0:
+			end = len(self.strings)
+		name = self.strings[off:end].decode('utf-8', 'replace')
+		if self.versions:
+			name = name + self.versions.get(idx, '')
+		return name
+
+	# Returns the type of the symbol at the given index as readelf names it, e.g. 'OBJECT'
+	#
+	def GetTypeByIndex(self, idx):
+		t = self.infos[idx] & 0xf
+		try:
+			return sttNames[t]
+		except KeyError:
+			return '<' + str(t) + '>'
+
+	# Build the name index
+	# The names should be unique, so a later symbol overwrites anything that's already there
+	#
+	def BuildNameIndex(self):
+		with stats.Phase('ElfSymbolTable.BuildNameIndex'):
+			byName = {}
+			for idx in range(len(self.nameoffs)):
+				if self.nameoffs[idx] != 0:
+					byName[self.GetNameByIndex(idx)] = idx
+			self.byName = byName
+
+	# Returns the address index for the given symbol types (all types if None), building it if necessary
+	#
+	def GetAddressIndex(self, symtypes=None):
+		if symtypes != None:
+			symtypes = tuple(sorted(symtypes))
+		try:
+			return self.addressIndexes[symtypes]
+		except KeyError:
+			ai = ElfAddressIndex(self, symtypes)
+			self.addressIndexes[symtypes] = ai
+			return ai
 
 	# Returns the index of the symbol whose name is passed
 	#
 	def FindByName(self, sym):
+		if stats.enabled:
+			stats.Count('symbol lookups')
+		if self.byName is None:
+			self.BuildNameIndex()
 		try:
 			x = self.byName[sym]
 		except KeyError:
@@ -192,22 +760,41 @@ class ElfSymbolTable:
 	# Returns the indexes of the symbols whose address is passed
 	#
 	def FindByAddress(self, addr):
-		try:
-			x = self.byAddress[addr]
-		except KeyError:
-			x = []				# No symbols at this address
-		return x
+		return self.GetAddressIndex().FindAtAddress(addr)
+
+	# Returns the index of the innermost symbol that contains the address, using the symbol sizes
+	# If symtypes is given (e.g. ['OBJECT', 'FUNC']), only symbols of those types are considered.
+	# Returns -1 if no symbol contains the address.
+	#
+	def FindContaining(self, addr, symtypes=None):
+		return self.GetAddressIndex(symtypes).FindContaining(addr)
 
 	# Returns the entire symbol information for the given index
+	# The ElfSymbol object is constructed on demand from the column arrays.
 	#
 	def GetSymbol(self, idx):
-		if idx < 0:
+		if idx < 0 or idx >= len(self.values):
 			return None
+		info = self.infos[idx]
 		try:
-			s = self.symtab[idx]
+			bind = stbNames[info >> 4]
 		except KeyError:
-			s = None
-		return s
+			bind = '<' + str(info >> 4) + '>'
+		try:
+			vis = stvNames[self.others[idx] & 0x3]
+		except KeyError:
+			vis = str(self.others[idx])
+		try:
+			ndx = shnNames[self.shndxs[idx]]
+		except KeyError:
+			ndx = str(self.shndxs[idx])
+		num = idx - self.tablestarts[bisect.bisect_right(self.tablestarts, idx) - 1]
+		fields = [str(num) + ':', '%x' % self.values[idx], str(self.sizes[idx]),
+					self.GetTypeByIndex(idx), bind, vis, ndx]
+		name = self.GetNameByIndex(idx)
+		if name != None:
+			fields.append(name)
+		return ElfSymbol(fields)
 
 	# Returns the name field of a symbol
 	#
@@ -255,7 +842,8 @@ class ElfSymbolTable:
 
 	# Returns the name of the first symbol at a given address that starts with a given pattern
 	# If the address is 0, returns 'NULL'
-	# If there are no symbols at the address, looks for the symbol with the next lower address
+	# If there are no symbols at the address, looks for the innermost symbol that contains the address,
+	# and failing that for the symbol with the next lower address
 	# If there is no match, returns the first symbol
 	#
 	def BestMatch(self, addr, pattern):
@@ -263,12 +851,15 @@ class ElfSymbolTable:
 		if addr == 0:
 			return 'NULL'
 
-		sym = self.BestMatchSym(addr, pattern)
-		return self.GetSymbolName(sym)
+		idx = self.BestMatchIndex(addr, pattern)
+		if idx < 0:
+			return None
+		return self.GetNameByIndex(idx)
 
 	# Returns the first symbol at a given address that starts with a given pattern
 	# If the address is 0, returns 'NULL'
-	# If there are no symbols at the address, looks for the symbol with the next lower address
+	# If there are no symbols at the address, looks for the innermost symbol that contains the address,
+	# and failing that for the symbol with the next lower address
 	# If there is no match, returns the first symbol
 	#
 	def BestMatchSym(self, addr, pattern):
@@ -276,33 +867,34 @@ class ElfSymbolTable:
 		if addr == 0:
 			return None
 
-		syms = self.FindByAddress(addr)
+		return self.GetSymbol(self.BestMatchIndex(addr, pattern))
+
+	# Returns the index of the symbol that BestMatchSym() returns; -1 if there is none
+	#
+	def BestMatchIndex(self, addr, pattern):
+		if stats.enabled:
+			stats.Count('address lookups')
+		ai = self.GetAddressIndex()
+		syms = ai.FindAtAddress(addr)
 		if len(syms) == 0:
-			addrl = self.FindLowerSymbol(addr)
-			if addrl == 0:
-				return None		# No symbol found
-			syms = self.FindByAddress(addrl)
-			if len(syms) == 0:
-				return None		# No symbol found (shouldn't happen)
-		first = self.GetSymbol(syms[0])
+			syms = ai.FindAllContaining(addr)
+		if len(syms) == 0:
+			addrl = ai.FindLower(addr)
+			if addrl == None:
+				return -1		# No symbol found
+			syms = ai.FindAtAddress(addrl)
 		for s in syms:
-			sym = self.GetSymbol(s)
-			name = self.GetSymbolName(sym)
-			if name.startswith(pattern):
-				return sym
-		return first
+			if self.GetNameByIndex(s).startswith(pattern):
+				return s
+		return syms[0]
 
 	# Returns the next lower address that holds a symbol
-	# Note: linear search. Is a binary search possible?
 	#
 	def FindLowerSymbol(self, addr):
-		n = len(self.sortAddress)
-		if self.sortAddress[0] > addr:
+		addrl = self.GetAddressIndex().FindLower(addr)
+		if addrl == None:
 			return 0					# Address is below the lowest symbol
-		for i in range(1,n):
-			if self.sortAddress[i] > addr:
-				return self.sortAddress[i-1]
-		return self.sortAddress[n-1]	# Address is above the highest symbol
+		return addrl
 
 	# Returns the name and the index for an array member
 	# Return value is a tuple  name, index, ok  where ok is true only if the address is an EXACT index
@@ -312,12 +904,12 @@ class ElfSymbolTable:
 		# NULL pointer: assume no symbol
 		if addr == 0:
 			return 'NULL',0,False
-		sym = self.BestMatchSym(addr, pattern)
-		name = self.GetSymbolName(sym)
-		if name == '':
-			return name,0,False
-		
-		baseaddr = self.GetSymbolAddress(sym)
+		s = self.BestMatchIndex(addr, pattern)
+		if s < 0:
+			return '',0,False
+		name = self.GetNameByIndex(s)
+
+		baseaddr = self.values[s]
 		idx = int( (addr - baseaddr) / msize )
 		ok = ( (addr - baseaddr) % msize ) == 0
 		if not ok:
@@ -329,7 +921,7 @@ class ElfSymbolTable:
 # ElfSection - representation of an ELF section including the contents if needed
 #
 class ElfSection:
-	def __init__(self, fn, idx, fields):
+	def __init__(self, fn, idx, fields, image=None):
 		self.elffilename = fn
 		self.Nr = idx
 
@@ -352,48 +944,45 @@ class ElfSection:
 
 		self.baseaddr = int(self.Addr, 16)
 		self.size = int(self.Size, 16)
+		self.offset = int(self.Offset, 16)
+		self.flags = 0
+		for (letter, bit) in shfLetters:
+			if letter in self.Flg:
+				self.flags = self.flags | bit
+		self.nobits = (self.Type == 'NOBITS')	# Occupies no space in the file; contents are all zero
+		self.image = image		# mmap of the whole file
 		self.loaded = False		# Tried loading
-		self.hasdata = False	# There is data in the data array
-		self.data = []
+		self.hasdata = False	# The section has contents (possibly zero-filled)
+		self.data = None		# memoryview of the section contents in the mapped file
 		#print('DEBUG: section', self.Nr, self.Name, self.Type, self.Addr, self.Size)
 
-	# Read the section into the self.data list
-	# The hex dump prints the bytes in byte-address order in groups of up to 4 bytes, regardless of endianness
+	# Make the section contents available as a slice of the mapped file.
+	# Nothing is copied. A NOBITS section (e.g. .bss) has no file contents and reads as zeros.
+	# loaded is set last, so a thread that sees it set also sees the contents.
 	#
 	def Read(self):
 		#print('DEBUG: reading section', self.Name, 'from', self.elffilename)
-		offset = 0
-		cmd = 'readelf -x' + self.Name + ' ' + self.elffilename
-		hexdump = os.popen(cmd)
-		for line in hexdump:
-			line = line.rstrip()
-			#print('DEBUG hexdump = |'+line+'|')
-
-			# This is tricky now. line.split() doesn't work because there could be spaces in the character
-			# representation at the end. However, the data block (including leading and trailing space)
-			# should b 37 characters long. Let's assume that, for now.
-			pos = line.find('0x')
-			if pos < 0:
-				continue		# '0x' not found; ignore line
-			line = line[pos:]	# Trim off everything before the '0x'
-			pos = line.find(' ')
-			if pos < 0:
-				continue		# ' ' not found; ignore line
-			addr = int(line[0:pos], 16)
-			if offset != addr - self.baseaddr:
-				# A gap. Does this ever happen? If it does we'll have to insert padding
-				raise ElfError('Gap found in hex dump of section ' + self.Name + ' at ' + hex(self.baseaddr + offset))
-			block = line[pos:pos+37]			# The data part, including spaces
-			block = block.replace(' ', '')		# Remove all the spaces
-			for i in range(0, len(block), 2):	# length should be even. If not, ignore the last half-byte.
-				byte = block[i:i+2]
-				self.data.append(int(byte, 16))
-				offset = offset + 1
-		hexdump.close()
+		if stats.enabled:
+			stats.Count('sections loaded')
+		if self.size == 0:
+			pass
+		elif self.nobits:
+			self.hasdata = True
+		elif self.image is not None:
+			if self.offset + self.size > len(self.image):
+				self.loaded = True
+				raise ElfError('section ' + self.Name + ' extends beyond the end of ' + self.elffilename)
+			self.data = memoryview(self.image)[self.offset:self.offset+self.size]
+			self.hasdata = True
 		self.loaded = True
-		self.hasdata = (offset != 0)
-		if self.hasdata and offset != self.size:
-			print('Warning: section ' + self.name + ': length of hexdump differs from section size')
+
+	# Return n bytes of the section contents, starting at an offset from the start of the section
+	# The caller must check that the range lies within the section.
+	#
+	def GetBytes(self, offset, n):
+		if self.nobits:
+			return bytes(n)
+		return self.data[offset:offset+n]
 
 	# Load n bytes of data from a given address
 	#
@@ -408,14 +997,9 @@ class ElfSection:
 				self.Read()
 			if not self.hasdata:
 				return None				# Section has no data
-		tval = 0
 		if littleendian:
-			order = range(n-1, -1, -1)
-		else:
-			order = range(n)
-		for i in order:
-			tval = tval * 256 + self.data[offset+i]
-		return tval
+			return int.from_bytes(self.GetBytes(offset, n), 'little')
+		return int.from_bytes(self.GetBytes(offset, n), 'big')
 
 	# Load a 0-terminated string from a given address
 	#
@@ -429,53 +1013,234 @@ class ElfSection:
 				self.Read()
 			if not self.hasdata:
 				return None				# Section has no data
+		if self.nobits:
+			return ''					# Zero-filled: the string is empty
 		i = addr - self.baseaddr
 		if max > self.size - i:
 			max = self.size - i				# Don't allow load to extend beyond section
-		count = 0
-		str = ''
-		while self.data[i] != 0 and count < max:
-			str = str + chr(self.data[i])
-			i = i + 1
-			count = count + 1
-		return str
+		start = self.offset + i
+		end = self.image.find(b'\0', start, start + max)
+		if end < 0:
+			end = start + max
+		return self.image[start:end].decode('latin-1')
+
 
+# ==============================================================================
+#
+# ElfMemoryDump - a raw image of target memory, e.g. a RAM dump, mapped to the address it was taken from
+# The file is mapped, not read, so a dump of any size costs only address space.
+#
+class ElfMemoryDump:
+	def __init__(self, filename, baseaddr, offset=0, size=None):
+		self.filename = filename
+		self.baseaddr = baseaddr	# Target address of the first byte that is used
+		try:
+			f = open(filename, 'rb')
+		except OSError as e:
+			raise ElfError(filename + ': ' + e.strerror)
+		try:
+			self.image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			raise ElfError(filename + ' is empty')
+		finally:
+			f.close()
+		avail = len(self.image) - offset
+		if offset < 0 or avail <= 0:
+			raise ElfError(filename + ': offset ' + hex(offset) + ' is beyond the end of the file')
+		if size == None or size > avail:
+			size = avail
+		self.offset = offset		# File offset of the first byte that is used
+		self.size = size
+		self.end = baseaddr + size
+		self.data = memoryview(self.image)[offset:offset+size]
+
+	# Return n bytes starting at an offset from baseaddr; the caller checks the range
+	#
+	def GetBytes(self, offset, n):
+		return self.data[offset:offset+n]
+
+	# Load a 0-terminated string from a given address; the string ends at the end of the dump if
+	# there is no terminator
+	#
+	def LoadString(self, addr, max):
+		start = self.offset + addr - self.baseaddr
+		end = min(start + max, self.offset + self.size)
+		e = self.image.find(b'\0', start, end)
+		if e < 0:
+			e = end
+		return self.image[start:e].decode('latin-1')
 
 # ==============================================================================
 #
 # ElfSectionTable - read and store the content of a section
+# Memory dumps (ElfMemoryDump) can be laid over the sections with AddDump(). All the Load functions
+# then read the dumped addresses from the dumps and everything else from the sections.
 #
 class ElfSectionTable:
 	def __init__(self, e):
 		self.sections = []
 		self.littleendian = e
+		if e:
+			self.byteorder = 'little'
+		else:
+			self.byteorder = 'big'
+		self.allocated = None		# The allocated sections, sorted by address. Built on first use
+		self.starts = None			# The start address of each section in self.allocated
+		self.dumps = []				# ElfMemoryDump overlays, sorted by address
+		self.dumpStarts = []		# The start address of each dump in self.dumps
 		return
 
+	# Lay a memory dump over the sections
+	# baseaddr is the target address of the byte at the given offset in the file. size limits the part of
+	# the file that is used. Dumps may not overlap each other.
+	#
+	def AddDump(self, filename, baseaddr, offset=0, size=None):
+		d = ElfMemoryDump(filename, baseaddr, offset, size)
+		i = bisect.bisect_right(self.dumpStarts, baseaddr)
+		if (i > 0 and self.dumps[i-1].end > baseaddr) or (i < len(self.dumps) and self.dumps[i].baseaddr < d.end):
+			raise ElfError(filename + ': dump overlaps another dump')
+		self.dumps.insert(i, d)
+		self.dumpStarts.insert(i, baseaddr)
+		return d
+
+	# Returns the dump that contains the given address; None if there isn't one
+	#
+	def FindDump(self, addr):
+		i = bisect.bisect_right(self.dumpStarts, addr) - 1
+		if i >= 0 and addr < self.dumps[i].end:
+			return self.dumps[i]
+		return None
+
 	# Read and store the section table
+	# The section headers are decoded directly from the file unless usereadelf is True.
 	#
-	def Read(self, elffilename):
-		cmd = 'readelf -SW ' + elffilename
-		sects = os.popen(cmd)
-		for line in sects:
-			line = line.rstrip()
-			m = line.find('[')
-			if m >= 0:
-				n = line.find(']')
-				if n > m and line[m+1:n] != 'Nr':
-					idx = int(line[m+1:n])
-					fields = line[n+1:].split()
-					self.sections.append(ElfSection(elffilename, idx, fields))
-		sects.close()
-		return
+	def Read(self, elffilename, usereadelf=False):
+		with stats.Phase('ElfSectionTable.Read'):
+			self.allocated = None
+			if usereadelf:
+				self.ReadWithReadelf(elffilename)
+				return
+			er = ElfReader(elffilename)
+			for idx in range(len(er.sections)):
+				self.sections.append(ElfSection(elffilename, idx, er.GetSectionFields(idx), er.image))
+
+	# Read and store the section table using the output of readelf -SW
+	#
+	def ReadWithReadelf(self, elffilename):
+		with stats.Phase('readelf -SW'):
+			er = ElfReader(elffilename, False)		# Map the file for the section contents
+			cmd = 'readelf -SW ' + elffilename
+			sects = os.popen(cmd)
+			for line in sects:
+				line = line.rstrip()
+				m = line.find('[')
+				if m >= 0:
+					n = line.find(']')
+					if n > m and line[m+1:n] != 'Nr':
+						idx = int(line[m+1:n])
+						fields = line[n+1:].split()
+						self.sections.append(ElfSection(elffilename, idx, fields, er.image))
+			sects.close()
+
+	# Build the address index of the sections that occupy memory (SHF_ALLOC)
+	# Empty sections are left out, and so is .tbss: it is only a template for the thread-local
+	# storage and overlaps whatever follows it in the address space.
+	#
+	def BuildIndex(self):
+		with stats.Phase('ElfSectionTable.BuildIndex'):
+			alloc = []
+			for s in self.sections:
+				if (s.flags & SHF_ALLOC) and s.size > 0 and not (s.nobits and (s.flags & SHF_TLS)):
+					alloc.append(s)
+			alloc.sort(key=lambda s: s.baseaddr)
+			self.starts = [s.baseaddr for s in alloc]
+			self.allocated = alloc		# Last: the lookups only use starts once allocated is set
+
+	# Returns the allocated section that contains the given address; None if there isn't one
+	#
+	def FindSection(self, addr):
+		if self.allocated is None:
+			self.BuildIndex()
+		i = bisect.bisect_right(self.starts, addr) - 1
+		if i >= 0:
+			s = self.allocated[i]
+			if addr < s.baseaddr + s.size:
+				return s
+		return None
+
+	# Load n bytes from a given address, without conversion
+	# The parts of the range that are in a dump come from the dump, the rest from the sections. A range
+	# that lies in one dump or one section is returned as a memoryview of the mapped file; otherwise the
+	# pieces are joined. Returns None if any part of the range can't be loaded.
+	#
+	def LoadBytes(self, addr, n):
+		if stats.enabled:
+			stats.Count('loads')
+			stats.Count('bytes loaded', n)
+		if len(self.dumps) == 0:
+			return self.LoadSectionBytes(addr, n)
+		pieces = []
+		while n > 0:
+			i = bisect.bisect_right(self.dumpStarts, addr) - 1
+			if i >= 0 and addr < self.dumps[i].end:
+				d = self.dumps[i]
+				k = min(n, d.end - addr)
+				pieces.append(d.GetBytes(addr - d.baseaddr, k))
+			else:
+				k = n
+				if i + 1 < len(self.dumps):
+					k = min(n, self.dumps[i+1].baseaddr - addr)
+				b = self.LoadSectionBytes(addr, k)
+				if b is None:
+					return None
+				pieces.append(b)
+			addr = addr + k
+			n = n - k
+		if len(pieces) == 1:
+			return pieces[0]
+		return b''.join(pieces)
+
+	# Load n bytes from the sections at a given address, without conversion
+	# Returns a memoryview into the mapped file if the range lies in one section. A range that runs from
+	# one section into the next is allowed if the sections are contiguous in memory; the bytes are then
+	# joined. Returns None if any part of the range is outside the allocated sections or has no contents.
+	#
+	def LoadSectionBytes(self, addr, n):
+		if self.allocated is None:
+			self.BuildIndex()
+		i = bisect.bisect_right(self.starts, addr) - 1
+		if i < 0:
+			return None
+		pieces = []
+		while True:
+			s = self.allocated[i]
+			offset = addr - s.baseaddr
+			if offset >= s.size:
+				return None
+			if not s.loaded:
+				s.Read()
+			if not s.hasdata:
+				return None
+			k = min(n, s.size - offset)
+			pieces.append(s.GetBytes(offset, k))
+			n = n - k
+			if n <= 0:
+				break
+			addr = addr + k
+			i = i + 1
+			if i >= len(self.allocated) or self.allocated[i].baseaddr != addr:
+				return None			# The next section doesn't follow on directly
+		if len(pieces) == 1:
+			return pieces[0]
+		return b''.join(pieces)
 
 	# Load n bytes of data from a given address
 	#
 	def Load(self, addr, n):
-		for s in self.sections:
-			v = s.Load(addr, n, self.littleendian)
-			if v != None:
-				return v
-		return None
+		b = self.LoadBytes(addr, n)
+		if b is None:
+			return None
+		return int.from_bytes(b, self.byteorder)
 
 	# Load n bytes of data from a given address, converted to a signed number
 	#
@@ -485,11 +1250,73 @@ class ElfSectionTable:
 			return Elf.ConvertToSigned(v, n)
 		return None
 
+	# Load an array of count elements of elemsize bytes each from a given address
+	# Returns a NumPy array if NumPy is installed, otherwise an array.array. The elements are decoded with
+	# the byte order of the ELF file. dtype overrides the element type (e.g. 'f4'); without NumPy it can be
+	# an array typecode. Element sizes that neither can represent give a list of ints.
+	# Returns None if the range can't be loaded. Raises ElfError if the size of dtype is not elemsize.
+	#
+	def LoadArray(self, addr, count, elemsize, signed=False, dtype=None):
+		if dtype != None:
+			if numpy != None:
+				itemsize = numpy.dtype(dtype).itemsize
+			else:
+				itemsize = array(dtype).itemsize
+			if itemsize != elemsize:
+				raise ElfError('element type ' + str(dtype) + ' has ' + str(itemsize) + ' bytes, not ' + str(elemsize))
+		b = self.LoadBytes(addr, count * elemsize)
+		if b is None:
+			return None
+		if numpy != None:
+			if dtype != None:
+				dt = numpy.dtype(dtype)
+			elif elemsize in (1, 2, 4, 8):
+				if signed:
+					dt = numpy.dtype('i' + str(elemsize))
+				else:
+					dt = numpy.dtype('u' + str(elemsize))
+			else:
+				dt = None
+			if dt != None:
+				if self.littleendian:
+					dt = dt.newbyteorder('<')
+				else:
+					dt = dt.newbyteorder('>')
+				return numpy.frombuffer(b, dt, count)
+		else:
+			tc = None
+			if dtype != None:
+				tc = dtype
+			else:
+				if signed:
+					codes = 'bhilq'
+				else:
+					codes = 'BHILQ'
+				for c in codes:
+					if array(c).itemsize == elemsize:
+						tc = c
+						break
+			if tc != None:
+				a = array(tc)
+				a.frombytes(b)
+				if self.byteorder != sys.byteorder:
+					a.byteswap()
+				return a
+		return [int.from_bytes(b[i:i+elemsize], self.byteorder, signed=signed)
+					for i in range(0, count * elemsize, elemsize)]
+
 	# Load a 0-terminated string from a given address
+	# The string ends at the end of the dump or section if there is no terminator. A string in a section
+	# also ends where a dump starts, so that no part of it comes from under the dump.
 	#
 	def LoadString(self, addr, max):
-		for s in self.sections:
-			str = s.LoadString(addr, max)
-			if str != None:
-				return str
-		return None
+		d = self.FindDump(addr)
+		if d != None:
+			return d.LoadString(addr, max)
+		i = bisect.bisect_right(self.dumpStarts, addr)
+		if i < len(self.dumps):
+			max = min(max, self.dumps[i].baseaddr - addr)
+		s = self.FindSection(addr)
+		if s is None:
+			return None
+		return s.LoadString(addr, max)
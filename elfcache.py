@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+
+# elfcache.py - on-disk cache of the parsed ELF/DWARF model
+#
+# (c) David Haworth
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import marshal
+import zlib
+import hashlib
+
+from elf import ElfHeader, ElfSymbolTable, ElfSection, ElfSectionTable
+from dwarf import DwarfUnit, DwarfObject, DwarfFile
+
+# The cache file starts with a header tuple; the rest of the file is only read if the header matches.
+# Change CACHE_VERSION whenever the contents of the cache change.
+CACHE_MAGIC = 'certhas-cache'
+CACHE_VERSION = 3
+
+# ==============================================================================
+#
+# ElfCacheReader - provides the units of a DwarfFile from a cache file
+# Each unit is stored as a compressed, marshalled DwarfObject.Flatten() list, which is only rebuilt
+# when the DwarfFile asks for the unit.
+#
+class ElfCacheReader:
+	def __init__(self, blobs, aranges):
+		self.blobs = blobs			# Unit offset --> compressed, marshalled list of objects
+		self.aranges = aranges
+
+	# Rebuild the tree of one unit
+	#
+	def ReadUnit(self, unit):
+		return DwarfObject.Unflatten(marshal.loads(zlib.decompress(self.blobs[unit.offset])))
+
+	# Return the address ranges of the units, as DwarfReader.ReadAranges() does
+	#
+	def ReadAranges(self):
+		return self.aranges
+
+# ==============================================================================
+#
+# ElfCache - saves and loads an ElfModel
+# A cache file is used only if the size, modification time and GNU build ID of the ELF file are the
+# same as when the cache file was written; otherwise the caller parses the file and saves it again.
+#
+class ElfCache:
+	def __init__(self, cachedir=None):
+		if cachedir == None:
+			cachedir = ElfCache.GetDefaultDirectory()
+		self.cachedir = cachedir
+
+	# Return the default cache directory
+	# CERTHAS_CACHE_DIR overrides the default; setting it to an empty string disables the cache.
+	#
+	@staticmethod
+	def GetDefaultDirectory():
+		d = os.environ.get('CERTHAS_CACHE_DIR')
+		if d != None:
+			return d
+		d = os.environ.get('XDG_CACHE_HOME')
+		if not d:
+			d = os.path.join(os.path.expanduser('~'), '.cache')
+		return os.path.join(d, 'certhas')
+
+	# Returns True if the cache is in use
+	#
+	def IsEnabled(self):
+		return self.cachedir != ''
+
+	# Return the key that identifies the contents of an ELF file
+	# er is an ElfReader for the file
+	#
+	@staticmethod
+	def GetKey(elffilename, er):
+		st = os.stat(elffilename)
+		return (st.st_size, st.st_mtime_ns, er.GetBuildId())
+
+	# Return the name of the cache file for an ELF file
+	#
+	def GetCacheFileName(self, elffilename):
+		path = os.path.abspath(elffilename)
+		h = hashlib.sha1(path.encode('utf-8', 'surrogateescape')).hexdigest()
+		return os.path.join(self.cachedir, h + '.cache')
+
+	# Return the header of a cache file
+	#
+	@staticmethod
+	def MakeHeader(elffilename, key):
+		return (CACHE_MAGIC, CACHE_VERSION, marshal.version, sys.byteorder, os.path.abspath(elffilename), key)
+
+	# Load a model from the cache
+	# er is an ElfReader for the file; its mapping supplies the section contents and the symbol names.
+	# Returns False if there is no usable cache file.
+	#
+	def Load(self, model, elffilename, er, key):
+		if not self.IsEnabled():
+			return False
+		try:
+			f = open(self.GetCacheFileName(elffilename), 'rb')
+		except OSError:
+			return False
+		try:
+			if marshal.load(f) != ElfCache.MakeHeader(elffilename, key):
+				return False
+			body = marshal.load(f)
+		except (EOFError, ValueError, TypeError):
+			return False
+		finally:
+			f.close()
+
+		eh = ElfHeader()
+		(eh.elfclass, eh.endian, eh.machine, eh.bits) = body['header']
+
+		esym = ElfSymbolTable()
+		(values, sizes, infos, others, shndxs, nameoffs, tablestarts, versions) = body['symbols']
+		esym.values.frombytes(values)
+		esym.sizes.frombytes(sizes)
+		esym.infos.frombytes(infos)
+		esym.others.frombytes(others)
+		esym.shndxs.frombytes(shndxs)
+		esym.nameoffs.frombytes(nameoffs)
+		esym.tablestarts = list(tablestarts)
+		esym.versions = versions
+		esym.strings = er.image
+
+		esect = ElfSectionTable(eh.GetEndian() == 'little')
+		for (idx, fields) in body['sections']:
+			esect.sections.append(ElfSection(elffilename, idx, list(fields), er.image))
+		esym.SetSectionTable(esect)
+
+		units = []
+		blobs = {}
+		for (offset, blob) in body['units']:
+			units.append(DwarfUnit(offset))
+			blobs[offset] = blob
+		df = DwarfFile()
+		df.SetReader(ElfCacheReader(blobs, body['aranges']), units, True, body['names'])
+
+		model.header = eh
+		model.symbols = esym
+		model.sections = esect
+		model.dwarf = df
+		return True
+
+	# Save a model in the cache
+	# The model must have been read from the file without lazy loading or readelf. Failure to write the
+	# cache file is not an error; the next run just parses the file again.
+	#
+	def Save(self, model, elffilename, key):
+		if not self.IsEnabled():
+			return
+		eh = model.header
+		esym = model.symbols
+		df = model.dwarf
+
+		units = []
+		unitof = {}
+		for (u, o) in zip(df.units, df.objects):
+			units.append((u.offset, zlib.compress(marshal.dumps(o.Flatten()), 1)))
+			unitof[id(o)] = u.offset
+		names = {}
+		for (n, objs) in df.names.items():
+			names[n] = sorted(set([unitof[id(c.parent)] for c in objs]))
+
+		body = {
+			'header':	(eh.elfclass, eh.endian, eh.machine, eh.bits),
+			'symbols':	(esym.values.tobytes(), esym.sizes.tobytes(), esym.infos.tobytes(),
+						 esym.others.tobytes(), esym.shndxs.tobytes(), esym.nameoffs.tobytes(),
+						 list(esym.tablestarts), esym.versions),
+			'sections':	[(s.Nr, [s.Name, s.Type, s.Addr, s.Offset, s.Size, s.ES, s.Flg, s.Lk, s.Inf, s.Al])
+							for s in model.sections.sections],
+			'units':	units,
+			'names':	names,
+			'aranges':	df.reader.ReadAranges()
+		}
+
+		fn = self.GetCacheFileName(elffilename)
+		tmp = fn + '.' + str(os.getpid())
+		try:
+			os.makedirs(self.cachedir, exist_ok=True)
+			f = open(tmp, 'wb')
+			try:
+				marshal.dump(ElfCache.MakeHeader(elffilename, key), f)
+				marshal.dump(body, f)
+			finally:
+				f.close()
+			os.replace(tmp, fn)			# Readers never see a partly-written file
+		except OSError:
+			try:
+				os.remove(tmp)
+			except OSError:
+				pass
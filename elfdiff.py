@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+
+# elfdiff.py - compare the symbols and data layouts of two builds
+#
+# (c) David Haworth
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Usage: elfdiff.py OLD-ELF-file NEW-ELF-file
+# Prints the differences as a JSON document; see ElfDiff.Diff()
+
+import os
+import sys
+import zlib
+import json
+
+from elf import sttNames
+from elfmodel import ElfModel
+from dwarfvalue import DwarfValueDecoder
+
+STT_FILE = 4
+STB_LOCAL = 0
+
+# Symbol types that are compared; section and file symbols are left out
+diffSymbolTypes = ('NOTYPE', 'OBJECT', 'FUNC', 'COMMON', 'TLS', 'IFUNC')
+
+# Tags of the types whose layouts are compared
+layoutTags = { 'DW_TAG_structure_type': 'struct', 'DW_TAG_class_type': 'class', 'DW_TAG_union_type': 'union' }
+
+# ==============================================================================
+#
+# ElfDiff - the differences between two ElfModels
+#
+class ElfDiff:
+	def __init__(self, old, new):
+		self.old = old
+		self.new = new
+
+	# Return the differences as a dictionary of plain values:
+	#   symbols:  added, removed    - lists of names
+	#             moved             - name, old address, new address
+	#             resized           - name, old size, new size
+	#             changed           - name, old hash, new hash  (initial contents, same size)
+	#   layouts:  added, removed    - lists of type names
+	#             changed           - name, old members, new members
+	#
+	def Diff(self):
+		return { 'symbols': self.DiffSymbols(), 'layouts': self.DiffLayouts() }
+
+	# Compare the symbol tables
+	# The symbols are joined by the keys that GetSymbols() gives them. The contents of symbols that have
+	# the same size in both files are compared by a CRC-32 of their bytes in the sections. Sections
+	# without contents (.bss) read as zeros, so their symbols get the same hash in both files and are
+	# never reported as changed.
+	#
+	def DiffSymbols(self):
+		old = ElfDiff.GetSymbols(self.old)
+		new = ElfDiff.GetSymbols(self.new)
+		d = { 'added': [], 'removed': [], 'moved': [], 'resized': [], 'changed': [] }
+		for (name, syms) in old.items():
+			nsyms = new.get(name, [])
+			d['removed'].extend([name] * (len(syms) - len(nsyms)))
+			for ((addr, size), (naddr, nsize)) in zip(syms, nsyms):
+				if naddr != addr:
+					d['moved'].append([name, addr, naddr])
+				if nsize != size:
+					d['resized'].append([name, size, nsize])
+				elif size > 0:
+					h = ElfDiff.GetContentHash(self.old, addr, size)
+					nh = ElfDiff.GetContentHash(self.new, naddr, nsize)
+					if h != nh:
+						d['changed'].append([name, h, nh])
+		for (name, nsyms) in new.items():
+			d['added'].extend([name] * (len(nsyms) - len(old.get(name, []))))
+		for k in d:
+			d[k].sort()
+		return d
+
+	# Return a dictionary  key --> list of  address, size  of the symbols to compare
+	# A global symbol's key is its name; a global that is in both .symtab and .dynsym is taken once. A
+	# local symbol's key is  file:name  where file is the name of the STT_FILE symbol before it, so static
+	# symbols with the same name in different files are kept apart. If a file has several local symbols
+	# with the same name, they are listed in table order and compared in pairs.
+	#
+	@staticmethod
+	def GetSymbols(model):
+		esym = model.symbols
+		types = set([t for (t, n) in sttNames.items() if n in diffSymbolTypes])
+		starts = set(esym.tablestarts)
+		infos = esym.infos
+		values = esym.values
+		sizes = esym.sizes
+		syms = {}
+		fn = ''
+		for idx in range(esym.GetSymbolCount()):
+			if idx in starts:
+				fn = ''
+			info = infos[idx]
+			if (info & 0xf) == STT_FILE:
+				fn = esym.GetNameByIndex(idx) or ''
+				continue
+			if esym.nameoffs[idx] == 0 or (info & 0xf) not in types:
+				continue
+			name = esym.GetNameByIndex(idx)
+			if (info >> 4) == STB_LOCAL:
+				name = fn + ':' + name
+			elif name in syms:
+				continue
+			syms.setdefault(name, []).append((values[idx], sizes[idx]))
+		return syms
+
+	# Return the CRC-32 of the bytes of a symbol; None if they are not in any section
+	#
+	@staticmethod
+	def GetContentHash(model, addr, size):
+		b = model.sections.LoadBytes(addr, size)
+		if b is None:
+			return None
+		return zlib.crc32(b)
+
+	# Compare the layouts of the structs and unions
+	#
+	def DiffLayouts(self):
+		old = ElfDiff.GetLayouts(self.old)
+		new = ElfDiff.GetLayouts(self.new)
+		d = { 'added': [], 'removed': [], 'changed': [] }
+		for (name, members) in old.items():
+			try:
+				nmembers = new[name]
+			except KeyError:
+				d['removed'].append(name)
+				continue
+			if nmembers != members:
+				d['changed'].append([name, members, nmembers])
+		d['added'] = [name for name in new if name not in old]
+		for k in d:
+			d[k].sort()
+		return d
+
+	# Return a dictionary  type name --> layout  of the structs and unions in a model
+	# A named type is called e.g. 'struct s1'; an anonymous one gets the name of a typedef that refers to
+	# it. The first definition of each name is used.
+	#
+	@staticmethod
+	def GetLayouts(model):
+		dv = DwarfValueDecoder(model.sections, model.header.GetBits() // 8)
+		df = model.dwarf
+		df.GetObjects()					# Parses all the units in lazy mode
+		layouts = {}
+		for (name, objs) in df.names.items():
+			for o in objs:
+				if o.tag == 'DW_TAG_typedef':
+					t = o.GetTypeInfo().base
+					if t == None or t.tag not in layoutTags or t.GetName() != '':
+						continue
+					key = name
+				elif o.tag in layoutTags and o.GetAttr('DW_AT_declaration') == None:
+					t = o
+					key = layoutTags[o.tag] + ' ' + name
+				else:
+					continue
+				if key not in layouts:
+					layouts[key] = ElfDiff.GetLayout(t, dv)
+		return layouts
+
+	# Return the layout of a struct or union: its size and a list of  name, offset, size  of its members
+	# The offset and size of a bitfield are in bits, as strings like '12b'; the offset is worked out by
+	# DwarfValueDecoder.GetBitOffset(), so a layout looks the same whichever DWARF version described it.
+	#
+	@staticmethod
+	def GetLayout(t, dv):
+		members = []
+		for m in t.children:
+			if m.GetTag() != 'DW_TAG_member':
+				continue
+			off = m.GetAttr('DW_AT_data_member_location')
+			if type(off) is not int:
+				off = None
+			mt = m.GetTypeTarget()
+			if mt == None:
+				size = None
+			else:
+				size = mt.GetTypeInfo().bytesize
+			bits = m.GetAttr('DW_AT_bit_size')
+			if bits != None:
+				off = str(dv.GetBitOffset(m, size)) + 'b'
+				size = str(bits) + 'b'
+			members.append([m.GetName(), off, size])
+		return [t.GetAttr('DW_AT_byte_size'), members]
+
+if __name__ == '__main__':
+	if len(sys.argv) != 3:
+		print('Usage: '+sys.argv[0]+' OLD-ELF-file NEW-ELF-file')
+		exit(1)
+	models = []
+	for fn in sys.argv[1:]:
+		m = ElfModel()
+		m.Read(fn, lazy=True)
+		models.append(m)
+	json.dump(ElfDiff(models[0], models[1]).Diff(), sys.stdout)
+	print()
+	exit(0)
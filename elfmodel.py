@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+
+# elfmodel.py - the complete parsed model of an ELF file
+#
+# (c) David Haworth
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+from elf import ElfReader, ElfHeader, ElfSymbolTable, ElfSectionTable
+from dwarf import DwarfFile
+from elfcache import ElfCache
+from elfstats import stats
+
+# ==============================================================================
+#
+# ElfModel - the header, symbol table, section table and DWARF information of an ELF file
+#
+class ElfModel:
+	def __init__(self):
+		self.elffilename = None
+		self.header = None			# ElfHeader
+		self.symbols = None			# ElfSymbolTable
+		self.sections = None		# ElfSectionTable
+		self.dwarf = None			# DwarfFile
+		self.cached = False			# True if the model was loaded from the cache
+
+	# Read the model of an ELF file
+	# If usecache is True the model is loaded from the cache when the cache is up to date. Otherwise
+	# the file is parsed and the cache is written for next time; lazy is ignored in that case because
+	# the cache needs all the units. The cache is not used with readelf.
+	# workers is passed on to DwarfFile.Read() for a parallel parse.
+	# If unifytypes is True, identical types in different units are collapsed (DwarfFile.UnifyTypes())
+	# once the model has been read.
+	#
+	def Read(self, elffilename, usereadelf=False, lazy=False, usecache=True, workers=1, unifytypes=False):
+		self.elffilename = elffilename
+		self.cached = False
+		self.ReadModel(elffilename, usereadelf, lazy, usecache, workers)
+		if unifytypes:
+			self.dwarf.UnifyTypes()
+
+	# Read the model from the cache or the file
+	#
+	def ReadModel(self, elffilename, usereadelf, lazy, usecache, workers):
+		cache = None
+		if usecache and not usereadelf:
+			cache = ElfCache()
+			if not cache.IsEnabled():
+				cache = None
+		if cache == None:
+			self.Parse(elffilename, usereadelf, lazy, workers)
+			return
+		er = ElfReader(elffilename)
+		key = ElfCache.GetKey(elffilename, er)
+		with stats.Phase('ElfCache.Load'):
+			hit = cache.Load(self, elffilename, er, key)
+		if hit:
+			stats.Count('cache hits')
+			self.cached = True
+			return
+		stats.Count('cache misses')
+		self.Parse(elffilename, False, False, workers)
+		with stats.Phase('ElfCache.Save'):
+			cache.Save(self, elffilename, key)
+
+	# Parse the ELF file
+	#
+	def Parse(self, elffilename, usereadelf=False, lazy=False, workers=1):
+		self.header = ElfHeader()
+		self.header.Read(elffilename, usereadelf)
+
+		self.symbols = ElfSymbolTable()
+		self.symbols.Read(elffilename, usereadelf)
+
+		self.sections = ElfSectionTable(self.header.GetEndian() == 'little')
+		self.sections.Read(elffilename, usereadelf)
+		self.symbols.SetSectionTable(self.sections)
+
+		self.dwarf = DwarfFile()
+		self.dwarf.Read(elffilename, usereadelf, lazy, workers)
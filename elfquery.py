@@ -0,0 +1,407 @@
+#!/usr/bin/python3
+
+# elfquery.py - answers questions about the names and addresses in a loaded ElfModel
+#
+# (c) David Haworth
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import threading
+
+from dwarf import DwarfError
+from dwarfvalue import DwarfValueDecoder
+from dwarfpath import DwarfPathResolver
+from dwarfline import DwarfLines
+from elfsymbolize import ElfSymbolizer
+
+# ==============================================================================
+#
+# ElfQuery - the lookups of explore.py, over one ElfModel
+# Used by explore.py directly and by the query server (elfserver.py).
+# The lookups that might parse more units of a lazily-loaded model are serialized by a lock. Call
+# Prepare() before sharing one ElfQuery between several threads. The lock is reentrant, so a caller
+# can hold it around whole lookups (as the query server does).
+#
+class ElfQuery:
+	def __init__(self, model):
+		self.model = model
+		self.esym = model.symbols
+		self.esect = model.sections
+		self.df = model.dwarf
+		self.dv = DwarfValueDecoder(model.sections, model.header.GetBits() // 8)
+		self.paths = DwarfPathResolver(model.dwarf, self.dv)
+		self.lines = None			# DwarfLines, read when first needed
+		self.lock = threading.RLock()
+
+	# Format a value from DwarfValueDecoder for printing
+	#
+	@staticmethod
+	def FormatValue(val):
+		if val == None:
+			return '?'
+		if type(val) is dict:
+			return '{' + ', '.join([n+': '+ElfQuery.FormatValue(x) for (n, x) in val.items()]) + '}'
+		if type(val) is list:
+			return '[' + ', '.join([ElfQuery.FormatValue(x) for x in val]) + ']'
+		if type(val) is int:
+			return hex(val)
+		if type(val) is bytes:
+			return val.hex()
+		return str(val)
+
+	# Convert a value from DwarfValueDecoder or ElfSectionTable.LoadArray into something that json can write
+	#
+	@staticmethod
+	def JsonValue(val):
+		if type(val) is dict:
+			return dict([(n, ElfQuery.JsonValue(x)) for (n, x) in val.items()])
+		if type(val) is list or type(val) is tuple:
+			return [ElfQuery.JsonValue(x) for x in val]
+		if type(val) is bytes:
+			return val.hex()
+		if val == None or type(val) in (str, int, float, bool):
+			return val
+		return int(val)			# numpy integers from LoadArray
+
+	# Build what the lookups otherwise build on first use: all the DWARF units, the symbol name and
+	# address indexes, the section index and the section contents. The type descriptors and layouts
+	# are still made on first use; they are only stored once complete, so threads can share them.
+	#
+	def Prepare(self):
+		with self.lock:
+			self.df.GetObjects()
+			if self.esym.byName is None:
+				self.esym.BuildNameIndex()
+			self.esym.GetAddressIndex()
+			if self.esect.allocated is None:
+				self.esect.BuildIndex()
+			for s in self.esect.sections:
+				if not s.loaded:
+					s.Read()
+
+	# Find the definition of a name in the DWARF information and the index of its ELF symbol
+	# Returns  object, index  with None and -1 for the parts that are not found
+	#
+	def Find(self, v):
+		with self.lock:
+			return (self.df.FindObjectDefinition(v), self.esym.FindByName(v))
+
+	# Return the type of a variable; from the specification if the variable doesn't have one
+	#
+	@staticmethod
+	def GetVariableType(v_obj):
+		t = v_obj.GetTypeTarget()
+		if t == None and v_obj.GetSpecref() != None:
+			t = v_obj.GetSpecref().GetTypeTarget()
+		return t
+
+	# Return the address of a variable from the DWARF information; None if it has none
+	#
+	@staticmethod
+	def GetVariableAddress(v_obj):
+		addr = v_obj.GetValue()
+		if addr == None and v_obj.GetSpecref() != None:
+			addr = v_obj.GetSpecref().GetValue()
+		return addr
+
+	# Read the value of a variable from the ELF file
+	# Composite types are decoded by DwarfValueDecoder; everything else is read as an array of n_array
+	# (or 1) items that fill the symbol's size.
+	# Returns  value, error  where error is a message if the value couldn't be read
+	#
+	def ReadValue(self, v_obj, addr, sz, is_struct, n_array):
+		if is_struct:
+			t = ElfQuery.GetVariableType(v_obj)
+			if t == None:
+				return (None, 'composite type')
+			val = self.dv.DecodeAt(t, addr)
+			if val == None:
+				return (None, 'not in a section with contents')
+			return (val, None)
+		if n_array < 0:
+			n_items = 1
+		else:
+			n_items = n_array
+		if n_items == 0:
+			return (None, 'array with 0 elements')
+		s = int(sz/n_items)
+		values = self.esect.LoadArray(addr, n_items, s)
+		if values is None:
+			return (None, 'not in a section with contents')
+		return (list(values), None)
+
+	# Return the type chain of an object as a list of words, ending at the base type
+	# Returns  words, final, t  where final is the name of a struct, union or enum that ends the chain
+	# (None if the chain ends some other way) and t is the last object in the chain.
+	#
+	@staticmethod
+	def GetTypeChain(v_obj, v_tag):
+		words = []
+		t = v_obj
+		while True:
+			nt = t.GetTypeInfo().target
+			if nt == None:
+				return (words, None, t)
+			t = nt
+			name = t.GetName()
+			tag = t.GetStrippedTag()
+			if tag == 'const_type':
+				words.append('const')
+			elif tag == 'pointer_type':
+				words.append('pointer to')
+			elif tag == 'volatile_type':
+				words.append('volatile')
+			elif tag == 'structure_type':
+				return (words, 'struct ' + str(name), t)		# structure_type is a base type
+			elif tag == 'union_type':
+				return (words, 'union ' + str(name), t)			# union_type is a base type
+			elif tag == 'enumeration_type':
+				return (words, 'enum ' + str(name), t)			# enumeration_type is a base type
+			elif tag == 'base_type':
+				words.append(': Base type ' + str(name))
+			elif tag == 'array_type':
+				words.append('array')
+				e = t.GetNElements()
+				if e == None:
+					words.append('[] of')
+				else:
+					words.append('['+str(e)+'] of')
+			elif tag == 'typedef':
+				words.append(str(name))
+				if v_tag == 'variable':
+					# Stop printing when the type of the variable is known
+					return (words, None, t)
+			else:
+				words.append(str(tag) + ' ' + str(name))
+
+	# Print the information about a name or type
+	#
+	def PrintStuff(self, v, out=None):
+		if out == None:
+			out = sys.stdout
+		print('Name: ', v, file=out)
+		(v_obj, s) = self.Find(v)
+		if v_obj == None and ElfQuery.IsPath(v):
+			(a, val, err) = self.EvaluatePath(v)
+			if a != None:
+				print('.. member or element at address', hex(a.address), 'size', a.size, file=out)
+			if err == None:
+				print('.. value =', ElfQuery.FormatValue(val), file=out)
+			else:
+				print('..', err, file=out)
+			return
+		if v_obj == None:
+			print('.. not found', file=out)
+			return
+
+		is_pointer = v_obj.IsPointer()
+		if is_pointer:
+			print('.. is a pointer type', file=out)
+
+		n_array = v_obj.GetArrayElements()
+		if n_array >= 0:
+			print('.. is an array with', n_array, 'elements', file=out)
+
+		is_struct = v_obj.IsComposite()
+		if is_struct:
+			print('.. is a composite type', file=out)
+
+		v_tag = v_obj.GetStrippedTag()
+		if v_tag == 'variable':
+			addr = ElfQuery.GetVariableAddress(v_obj)
+			if addr == None:
+				print('.. variable; no address in dwarf data', file=out)
+			else:
+				print('.. variable at address', hex(addr), file=out)
+			if s < 0:
+				print('.. no ELF information', file=out)
+			else:
+				sym = self.esym.GetSymbol(s)
+				addr = self.esym.GetSymbolAddress(sym)
+				sz = self.esym.GetSymbolSize(sym)
+				(val, err) = self.ReadValue(v_obj, addr, sz, is_struct, n_array)
+				if err != None:
+					val = err
+				elif is_struct:
+					val = ElfQuery.FormatValue(val)
+				else:
+					val = ', '.join([hex(x) for x in val])
+				print('.. ELF: address =', hex(addr), 'size =', hex(sz), 'value =', val, file=out)
+		else:
+			print('..', v_tag, file=out)
+		p = v_obj.GetParent()
+		if p == None:
+			print('.. no parent', file=out)
+			return
+		print('.. found in', p.GetBasename(), file=out)
+		print('..', end=' ', file=out)
+		(words, final, t) = ElfQuery.GetTypeChain(v_obj, v_tag)
+		for w in words:
+			print(w, end=' ', file=out)
+		if final == None:
+			print(file=out)
+			return
+		print(final, file=out)
+		if v_tag != 'variable' and t.GetStrippedTag() == 'enumeration_type':
+			for e in t.GetEnumerators():
+				print('..   ', e.name, '=', e.value, file=out)
+
+	# Return the information about a name as a dictionary of plain values, for JSON output
+	# A path to a member or element (see DwarfPathResolver) gives its address, size and value.
+	#
+	def Describe(self, v):
+		d = { 'name': v }
+		(v_obj, s) = self.Find(v)
+		if v_obj == None and ElfQuery.IsPath(v):
+			(a, val, err) = self.EvaluatePath(v)
+			d['found'] = (a != None)
+			if a != None:
+				d['kind'] = 'path'
+				d['address'] = a.address
+				d['size'] = a.size
+			if err == None:
+				d['value'] = ElfQuery.JsonValue(val)
+			else:
+				d['error'] = err
+			return d
+		if v_obj == None:
+			d['found'] = False
+			return d
+		d['found'] = True
+		v_tag = v_obj.GetStrippedTag()
+		d['kind'] = v_tag
+		if v_tag == 'variable':
+			d['address'] = ElfQuery.GetVariableAddress(v_obj)
+			if s >= 0:
+				sym = self.esym.GetSymbol(s)
+				addr = self.esym.GetSymbolAddress(sym)
+				sz = self.esym.GetSymbolSize(sym)
+				d['elf'] = { 'address': addr, 'size': sz }
+				is_struct = v_obj.IsComposite()
+				n_array = v_obj.GetArrayElements()
+				(val, err) = self.ReadValue(v_obj, addr, sz, is_struct, n_array)
+				if err == None:
+					if not is_struct and n_array < 0:
+						val = val[0]
+					d['value'] = ElfQuery.JsonValue(val)
+				else:
+					d['error'] = err
+		(words, final, t) = ElfQuery.GetTypeChain(v_obj, v_tag)
+		if final != None:
+			words.append(final)
+		d['type'] = words
+		p = v_obj.GetParent()
+		if p != None:
+			d['cu'] = p.GetBasename()
+		return d
+
+	# Decode the value of a variable with DwarfValueDecoder
+	# Returns a dictionary with the value, or an error message
+	#
+	def Decode(self, v):
+		(v_obj, s) = self.Find(v)
+		if v_obj == None and ElfQuery.IsPath(v):
+			(a, val, err) = self.EvaluatePath(v)
+			if err != None:
+				return { 'name': v, 'error': err }
+			return { 'name': v, 'address': a.address, 'size': a.size, 'value': ElfQuery.JsonValue(val) }
+		if v_obj == None or v_obj.GetStrippedTag() != 'variable':
+			return { 'name': v, 'error': 'no such variable' }
+		t = ElfQuery.GetVariableType(v_obj)
+		addr = ElfQuery.GetVariableAddress(v_obj)
+		if s >= 0:
+			addr = self.esym.GetSymbolAddress(self.esym.GetSymbol(s))
+		if t == None or addr == None:
+			return { 'name': v, 'error': 'no type or address' }
+		val = self.dv.DecodeAt(t, addr)
+		if val == None:
+			return { 'name': v, 'error': 'not in a section with contents' }
+		return { 'name': v, 'value': ElfQuery.JsonValue(val) }
+
+	# Returns True if a name is a path to a member or element (see DwarfPathResolver)
+	#
+	@staticmethod
+	def IsPath(v):
+		if '.' not in v and '[' not in v and '->' not in v:
+			return False
+		try:
+			DwarfPathResolver.Parse(v)
+		except DwarfError:
+			return False
+		return True
+
+	# Evaluate a path with the path resolver; the accessor is kept for the next time
+	# Returns  accessor, value, error  where error is a message if the value couldn't be read
+	#
+	def EvaluatePath(self, v):
+		try:
+			with self.lock:
+				a = self.paths.Compile(v)
+		except DwarfError as e:
+			return (None, None, str(e))
+		val = a.Read(self.esect)
+		if val == None:
+			return (a, None, 'not in a section with contents')
+		return (a, val, None)
+
+	# Return the line tables; they are read the first time
+	# Must be called with the lock held.
+	#
+	def GetLines(self):
+		if self.lines == None:
+			self.lines = DwarfLines()
+			self.lines.Read(self.model.elffilename)
+		return self.lines
+
+	# Return the symbol and offset for an address, the compile unit that contains it and the source
+	# file, line and column
+	#
+	def Symbolize(self, addr):
+		d = { 'address': addr }
+		i = self.esym.BestMatchIndex(addr, '')
+		if i >= 0:
+			d['symbol'] = self.esym.GetNameByIndex(i)
+			d['offset'] = addr - self.esym.values[i]
+		with self.lock:
+			cu = self.df.FindUnitByAddress(addr)
+			pos = self.GetLines().Lookup(addr)
+		if cu != None:
+			d['cu'] = cu.GetBasename()
+		if pos != None:
+			(d['file'], d['line'], d['column']) = pos
+		return d
+
+	# Return the size of an element of an array variable (of the first dimension); None if the name is
+	# not an array variable
+	#
+	def GetElementSize(self, v):
+		(v_obj, s) = self.Find(v)
+		if v_obj == None or v_obj.GetStrippedTag() != 'variable':
+			return None
+		t = ElfQuery.GetVariableType(v_obj)
+		if t == None:
+			return None
+		ti = t.GetTypeInfo()
+		if ti.kind != 'array' or not ti.count or ti.bytesize == None:
+			return None
+		return ti.bytesize // ti.count
+
+	# Return a symbolizer for streams of addresses that gives array indexes for the array variables
+	#
+	def GetSymbolizer(self):
+		return ElfSymbolizer(self.esym, elementsize=self.GetElementSize)
@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+
+# elfserver.py - keeps an ElfModel loaded and answers queries over a Unix-domain socket
+#
+# (c) David Haworth
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import io
+import json
+import socket
+import asyncio
+
+from elfmodel import ElfModel
+from elfquery import ElfQuery
+
+# The protocol is one JSON object per line in each direction. A request is
+#   { "op": OP, "names": [...] }  or  { "op": "symbolize", "addresses": [...] }
+# with an optional "elffile" that must name the file the server has loaded. OP is one of
+#   print       - the text that explore.py prints for each name
+#   lookup      - ElfQuery.Describe() for each name
+#   decode      - ElfQuery.Decode() for each name
+#   symbolize   - ElfQuery.Symbolize() for each address
+#   status      - the name of the file and the no. of times it has been loaded
+# The response is  { "ok": true, "result": [...] }  (one entry per name or address) or
+#   { "ok": false, "error": MESSAGE }
+
+# ==============================================================================
+#
+# ElfServer - the query server
+# The model is replaced when the size or modification time of the ELF file changes. The new model is
+# loaded in a thread while the old one goes on answering; each request uses the model that was current
+# when it arrived.
+#
+class ElfServer:
+	def __init__(self, elffilename, socketpath, poll=1.0, dumps=()):
+		self.elffilename = elffilename
+		self.dumps = dumps			# List of  filename, address  of memory dumps to lay over the sections
+		self.socketpath = socketpath
+		self.poll = poll			# Seconds between checks of the ELF file
+		self.query = None			# ElfQuery over the current model
+		self.key = None				# Size and modification time of the file when it was loaded
+		self.loads = 0
+
+	# Load the model; runs in a worker thread when reloading
+	#
+	def Load(self):
+		model = ElfModel()
+		model.Read(self.elffilename)
+		for (fn, addr) in self.dumps:
+			model.sections.AddDump(fn, addr)
+		return ElfQuery(model)
+
+	# Return the key that tells whether the ELF file has changed; None if it can't be read
+	#
+	def GetKey(self):
+		try:
+			st = os.stat(self.elffilename)
+		except OSError:
+			return None
+		return (st.st_size, st.st_mtime_ns)
+
+	# Load the model and serve until interrupted
+	#
+	def Run(self):
+		self.key = self.GetKey()
+		self.query = self.Load()
+		self.loads = 1
+		try:
+			asyncio.run(self.Serve())
+		except KeyboardInterrupt:
+			pass
+		finally:
+			try:
+				os.remove(self.socketpath)
+			except OSError:
+				pass
+
+	# Serve the socket and watch the ELF file
+	#
+	async def Serve(self):
+		try:
+			os.remove(self.socketpath)		# Left over from a server that didn't exit cleanly
+		except OSError:
+			pass
+		server = await asyncio.start_unix_server(self.HandleClient, path=self.socketpath)
+		watcher = asyncio.create_task(self.Watch())
+		async with server:
+			await server.serve_forever()
+		watcher.cancel()
+
+	# Reload the model whenever the ELF file changes
+	# A file that is still being written may fail to load; the old model stays in use and the load is
+	# tried again when the file changes again.
+	#
+	async def Watch(self):
+		loop = asyncio.get_running_loop()
+		while True:
+			await asyncio.sleep(self.poll)
+			key = self.GetKey()
+			if key == None or key == self.key:
+				continue
+			self.key = key
+			try:
+				query = await loop.run_in_executor(None, self.Load)
+			except Exception as e:
+				print('elfserver: reloading', self.elffilename, 'failed:', e, file=sys.stderr)
+				continue
+			if self.GetKey() == key:
+				self.query = query
+				self.loads = self.loads + 1
+
+	# Answer the requests from one client until it closes the connection
+	#
+	async def HandleClient(self, reader, writer):
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				try:
+					resp = { 'ok': True, 'result': await self.Handle(json.loads(line)) }
+				except Exception as e:
+					# Any failure of a request (ElfError, DwarfError, OSError, ...) is reported to the client,
+					# which can go on sending requests
+					resp = { 'ok': False, 'error': str(e) or type(e).__name__ }
+				writer.write((json.dumps(resp) + '\n').encode())
+				await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+	# Answer one request
+	# The lookups run in a worker thread, so the event loop goes on serving the other clients and
+	# watching the file meanwhile.
+	#
+	async def Handle(self, req):
+		query = self.query
+		ef = req.get('elffile')
+		if ef != None and os.path.realpath(ef) != os.path.realpath(self.elffilename):
+			raise ValueError('the server has loaded ' + self.elffilename + ', not ' + ef)
+		op = req['op']
+		if op == 'status':
+			return { 'elffile': self.elffilename, 'loads': self.loads }
+		if op == 'symbolize':
+			items = req['addresses']
+			fn = query.Symbolize
+		else:
+			items = req['names']
+			if op == 'print':
+				fn = lambda v: ElfServer.PrintToString(query, v)
+			elif op == 'lookup':
+				fn = query.Describe
+			elif op == 'decode':
+				fn = query.Decode
+			else:
+				raise ValueError('unknown op ' + str(op))
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(None, ElfServer.Answer, query, fn, items)
+
+	# Look up each item of a request; runs in a worker thread
+	# Each lookup holds the query's lock, so the requests of several clients take turns after each item.
+	#
+	@staticmethod
+	def Answer(query, fn, items):
+		result = []
+		for x in items:
+			with query.lock:
+				result.append(fn(x))
+		return result
+
+	# Return the text that explore.py prints for a name
+	#
+	@staticmethod
+	def PrintToString(query, v):
+		out = io.StringIO()
+		query.PrintStuff(v, out)
+		return out.getvalue()
+
+# ==============================================================================
+#
+# ElfClient - a blocking client for ElfServer
+#
+class ElfClient:
+	def __init__(self, socketpath):
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.connect(socketpath)
+		self.f = self.sock.makefile('rwb')
+
+	# Send a request and return the result
+	# Raises ValueError with the server's message if the request fails
+	#
+	def Request(self, req):
+		self.f.write((json.dumps(req) + '\n').encode())
+		self.f.flush()
+		line = self.f.readline()
+		if not line:
+			raise ConnectionError('the server closed the connection')
+		resp = json.loads(line)
+		if not resp['ok']:
+			raise ValueError(resp['error'])
+		return resp['result']
+
+	def Close(self):
+		self.f.close()
+		self.sock.close()
@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+
+# elfstats.py - timing and counters for the ELF/DWARF classes
+#
+# (c) David Haworth
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+
+# ==============================================================================
+#
+# ElfStatsPhase - times one run of a phase; used in a with statement
+# Phases can be nested; each one counts the time spent in the phases inside it as well.
+#
+class ElfStatsPhase:
+	__slots__ = ('stats', 'name', 'wall', 'cpu')
+
+	def __init__(self, stats, name):
+		self.stats = stats
+		self.name = name
+
+	def __enter__(self):
+		self.wall = time.perf_counter()
+		self.cpu = time.process_time()
+		return self
+
+	def __exit__(self, exctype, exc, tb):
+		self.stats.AddTime(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu)
+		return False
+
+# ElfStatsNoPhase - what Phase() returns when the statistics are off
+#
+class ElfStatsNoPhase:
+	__slots__ = ()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exctype, exc, tb):
+		return False
+
+noPhase = ElfStatsNoPhase()
+
+# ==============================================================================
+#
+# ElfStats - phase times and event counters
+# There is one instance, stats, that the classes report to. Nothing is recorded until Enable() is
+# called. Code that counts events in a loop tests stats.enabled first, so that the statistics cost
+# one attribute test when they are off:
+#     if stats.enabled:
+#         stats.Count('bytes loaded', n)
+#     with stats.Phase('DwarfFile.Read'):
+#         ...
+#
+class ElfStats:
+	def __init__(self):
+		self.enabled = False
+		self.phases = {}			# Name --> [calls, wall time, CPU time]
+		self.counters = {}			# Name --> count
+
+	# Start recording
+	#
+	def Enable(self):
+		self.enabled = True
+
+	# Stop recording; what has been recorded is kept
+	#
+	def Disable(self):
+		self.enabled = False
+
+	# Forget what has been recorded
+	#
+	def Reset(self):
+		self.phases = {}
+		self.counters = {}
+
+	# Return a context manager that times a phase
+	#
+	def Phase(self, name):
+		if self.enabled:
+			return ElfStatsPhase(self, name)
+		return noPhase
+
+	# Add the times of one run of a phase
+	#
+	def AddTime(self, name, wall, cpu):
+		try:
+			p = self.phases[name]
+		except KeyError:
+			p = [0, 0.0, 0.0]
+			self.phases[name] = p
+		p[0] = p[0] + 1
+		p[1] = p[1] + wall
+		p[2] = p[2] + cpu
+
+	# Add n to a counter
+	#
+	def Count(self, name, n=1):
+		if self.enabled:
+			self.counters[name] = self.counters.get(name, 0) + n
+
+	# Return what has been recorded as a dictionary of plain values
+	#
+	def GetReport(self):
+		phases = {}
+		for (name, (calls, wall, cpu)) in self.phases.items():
+			phases[name] = { 'calls': calls, 'wall': wall, 'cpu': cpu }
+		return { 'phases': phases, 'counters': dict(self.counters) }
+
+	# Print what has been recorded
+	#
+	def Print(self, out=None):
+		if out == None:
+			out = sys.stdout
+		print('Phase                                 calls     wall (s)      cpu (s)', file=out)
+		for (name, (calls, wall, cpu)) in sorted(self.phases.items()):
+			print('%-34s %8d %12.6f %12.6f' % (name, calls, wall, cpu), file=out)
+		print('Counter                                        count', file=out)
+		for (name, n) in sorted(self.counters.items()):
+			print('%-34s %18d' % (name, n), file=out)
+
+stats = ElfStats()
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+
+# elfsymbolize.py - symbolize long streams of addresses
+#
+# (c) David Haworth
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import bisect
+from array import array
+from itertools import islice
+
+from elfstats import stats
+
+# ==============================================================================
+#
+# ElfSymbolizer - the symbol, offset and array index of each address in a stream of addresses
+#
+# The answer of ElfSymbolTable.BestMatchIndex() only changes at the address of a symbol, the address
+# after it and the end of a symbol. The symbolizer works out the answer at each of those points once, so
+# the answer for any address is the one at the highest point not above it. The addresses are taken
+# in chunks; each chunk is sorted and walked along the points, then the results are put back in the
+# order of the addresses. Memory use depends on the chunk size, not on the length of the stream.
+#
+# Each result is a tuple  address, symbol, offset, index  as for BestMatch() and FindArrayRef():
+#   symbol  - the name of the symbol; 'NULL' for address 0; None if there is no symbol below the address
+#   offset  - the address minus the address of the symbol; None if there is no symbol
+#   index   - the array index, if elementsize gives an element size for the symbol and the address is
+#             inside the symbol; otherwise None
+# elementsize is a function that returns the element size for a symbol name, or None. It is only called
+# for symbols that some address maps to.
+#
+class ElfSymbolizer:
+	def __init__(self, esym, pattern='', elementsize=None, chunksize=65536):
+		self.esym = esym
+		self.pattern = pattern
+		self.elementsize = elementsize
+		self.chunksize = chunksize
+		with stats.Phase('ElfSymbolizer'):
+			self.BuildPoints()
+
+	# Work out the points and the symbol at each one
+	#
+	def BuildPoints(self):
+		ai = self.esym.GetAddressIndex()
+		points = set(ai.starts)
+		points.update([a + 1 for a in ai.starts])
+		points.update(ai.ends)
+		points.update((0, 1))
+		self.points = sorted(points)
+		self.syms = array('q', [self.esym.BestMatchIndex(p, self.pattern) for p in self.points])
+		self.entries = [None] * len(self.points)
+
+	# Return the entry for a point: a tuple  name, address, element size, size  of its symbol
+	#
+	def GetEntry(self, j):
+		e = self.entries[j]
+		if e != None:
+			return e
+		s = self.syms[j]
+		if self.points[j] == 0:
+			e = ('NULL', 0, None, 0)
+		elif s < 0:
+			e = (None, None, None, 0)
+		else:
+			name = self.esym.GetNameByIndex(s)
+			msize = None
+			if self.elementsize != None:
+				msize = self.elementsize(name)
+				if msize != None and msize <= 0:
+					msize = None
+			e = (name, self.esym.values[s], msize, self.esym.sizes[s])
+		self.entries[j] = e
+		return e
+
+	# Return the results for a list of addresses, in the same order
+	#
+	def SymbolizeChunk(self, addrs):
+		if stats.enabled:
+			stats.Count('addresses symbolized', len(addrs))
+		n = len(addrs)
+		result = [None] * n
+		points = self.points
+		entries = self.entries
+		npoints = len(points)
+		j = -1
+		nextpoint = points[0]
+		(name, base, msize, size) = (None, None, None, 0)
+		order = sorted(range(n), key=addrs.__getitem__)
+		for (k, a) in zip(order, map(addrs.__getitem__, order)):
+			if a >= nextpoint:
+				# Move along the points; they are sorted, so the search starts where the last one ended
+				j = bisect.bisect_right(points, a, j + 1) - 1
+				if j + 1 < npoints:
+					nextpoint = points[j + 1]
+				else:
+					nextpoint = 0x10000000000000000
+				e = entries[j]
+				if e == None:
+					e = self.GetEntry(j)
+				(name, base, msize, size) = e
+			if msize == None:
+				if base == None:
+					result[k] = (a, None, None, None)
+				else:
+					result[k] = (a, name, a - base, None)
+			elif a - base < size:
+				result[k] = (a, name, a - base, (a - base) // msize)
+			else:
+				result[k] = (a, name, a - base, None)
+		return result
+
+	# Return a generator of the results for a stream (any iterable) of addresses, in the same order
+	#
+	def Symbolize(self, addrs):
+		it = iter(addrs)
+		while True:
+			chunk = list(islice(it, self.chunksize))
+			if len(chunk) == 0:
+				return
+			yield from self.SymbolizeChunk(chunk)
+
+	# Return a generator of the addresses in a trace file
+	# The address is the first field of each line, in hexadecimal with or without 0x. Empty lines and
+	# lines that start with # are skipped. Lines whose first field is not a number are skipped too; their
+	# line numbers are appended to bad if it is given.
+	#
+	@staticmethod
+	def ReadAddresses(f, bad=None):
+		n = 0
+		for line in f:
+			n = n + 1
+			fields = line.split(None, 1)
+			if len(fields) == 0 or fields[0].startswith('#'):
+				continue
+			try:
+				a = int(fields[0], 16)
+			except ValueError:
+				if stats.enabled:
+					stats.Count('trace lines skipped')
+				if bad != None:
+					bad.append(n)
+				continue
+			yield a
+
+	# Format a result for printing:  address symbol+offset  or  address symbol[index]+offset
+	#
+	@staticmethod
+	def FormatResult(r):
+		(a, name, off, idx) = r
+		if name == None:
+			return '0x%x ?' % a
+		if idx == None:
+			return '0x%x %s+0x%x' % (a, name, off)
+		return '0x%x %s[%d]+0x%x' % (a, name, idx, off)
@@ -21,159 +21,161 @@
 # along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
 import os
 import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from elfmodel import ElfModel
+from elfquery import ElfQuery
+from elfsymbolize import ElfSymbolizer
+from elfserver import ElfServer, ElfClient
+from elfstats import stats
+
+# Write the information about a stream of names as JSON lines
+# describe is a function that returns a list of dictionaries for a list of names.
+# The names are handled in chunks so that the output starts straight away and a long input is never
+# held in memory all at once.
+#
+def WriteJsonLines(stream, describe, out):
+	chunk = []
+	for v in stream:
+		v = v.strip()
+		if v == '':
+			continue
+		chunk.append(v)
+		if len(chunk) >= chunksize:
+			WriteJsonChunk(chunk, describe, out)
+			chunk = []
+	WriteJsonChunk(chunk, describe, out)
+
+# Write the JSON lines for one chunk of names, in the order of the names
+#
+def WriteJsonChunk(chunk, describe, out):
+	for d in describe(chunk):
+		out.write(json.dumps(d) + '\n')
+	out.flush()
 
-from elf import ElfHeader, ElfSymbolTable, ElfSectionTable
-from dwarf import DwarfFile
-
-eh = None
-esym = None
-esect = None
-df = None
+# Send a request to the server and return the result; exit if the server can't answer
+#
+def Ask(client, op, ef, names):
+	try:
+		return client.Request({ 'op': op, 'elffile': ef, 'names': names })
+	except (ValueError, OSError) as e:
+		print('Server error:', e, file=sys.stderr)
+		exit(1)
+
+# Print the statistics if --stats was given, and exit
+#
+def Finish():
+	if args.stats:
+		sys.stdout.flush()
+		stats.Print(sys.stderr)
+	exit(0)
 
-# Print the information about a name or type
+# Print the symbol of each address in a trace file, in the order of the file
 #
-def PrintStuff(v):
-	print('Name: ', v)
-	v_obj = df.FindObjectDefinition(v)
-	if v_obj == None:
-		print('.. not found')
-		return
-
-	is_pointer = v_obj.IsPointer()
-	if is_pointer:
-		print('.. is a pointer type')
-
-	n_array = v_obj.GetArrayElements()
-	if n_array >= 0:
-		print('.. is an array with', n_array, 'elements')
-
-	is_struct = v_obj.IsComposite()
-	if is_struct:
-		print('.. is a composite type')
-
-	v_tag = v_obj.GetStrippedTag()
-	if v_tag == 'variable':
-		addr = v_obj.GetValue()
-		if addr == None:
-			spec = v_obj.GetSpecref()
-			if spec != None:
-				addr = spec.GetValue()
-		if addr == None:
-			print('.. variable; no address in dwarf data')
-		else:
-			print('.. variable at address', hex(addr))
-		s = esym.FindByName(v)
-		if s < 0:
-			print('.. no ELF information')
-		else:
-			sym = esym.GetSymbol(s)
-			addr = esym.GetSymbolAddress(sym)
-			sz = esym.GetSymbolSize(sym)
-
-			if is_struct:
-				val = 'composite type'
-			else:
-				if n_array < 0:
-					n_items = 1
-				else:
-					n_items = n_array
-				if n_items == 0:
-					val = 'array with 0 elements'
-				else:
-					s = int(sz/n_items)
-					val = ''
-					for b in range(addr, addr+sz, s):
-						val = val + hex(esect.Load(b, s)) + ', '
-					val = val[0:-2]
-			print('.. ELF: address =', hex(addr), 'size =', hex(sz), 'value =', val)
+def Symbolize(query, fn):
+	if fn == '-':
+		f = sys.stdin
 	else:
-		print('..', v_tag)
-	p = v_obj.GetParent()
-	if p == None:
-		print('.. no parent')
-		return
-	print('.. found in', p.GetBasename())
-	t = v_obj
-	print('..', end=' ')
-	while True:
-		r = t.GetAttr('DW_AT_type')
-		if r == None:
-			print()
-			return
-		t = p.GetChildByRef(r)
-		name = t.GetName()
-		tag = t.GetStrippedTag()
-		if tag == 'const_type':
-			print('const', end=' ')
-		elif tag == 'pointer_type':
-			print('pointer to', end=' ')
-		elif tag == 'volatile_type':
-			print('volatile', end=' ')
-		elif tag == 'structure_type':
-			print('struct', name)
-			if v_tag != 'variable':
-				pass	# TODO: print members
-			return		# structure_type is a base type
-		elif tag == 'union_type':
-			print('union', name)
-			if v_tag != 'variable':
-				pass	# TODO: print members
-			return		# union_type is a base type
-		elif tag == 'enumeration_type':
-			print('enum', name)
-			if v_tag != 'variable':
-				el = t.GetEnumerators()
-				for e in el:
-					print('..   ', e.name, '=', e.value)
-			return		# enumeration_type is a base type
-		elif tag == 'base_type':
-			print(': Base type', name, end=' ')
-		elif tag == 'array_type':
-			print('array', end=' ')
-			e = t.GetNElements()
-			if e == None:
-				print('[] of', end=' ')
-			else:
-				print('['+str(e)+'] of', end=' ')
-		elif tag == 'typedef':
-			print(name, end=' ')
-			if v_tag == 'variable':
-				# Stop printing when the type of the variable is known
-				print()
-				return
+		f = open(fn)
+	out = sys.stdout
+	bad = []
+	for r in query.GetSymbolizer().Symbolize(ElfSymbolizer.ReadAddresses(f, bad)):
+		if jsonmode:
+			out.write(json.dumps({ 'address': r[0], 'symbol': r[1], 'offset': r[2], 'index': r[3] }) + '\n')
 		else:
-			print(tag, name, end=' ')
+			out.write(ElfSymbolizer.FormatResult(r) + '\n')
+	if len(bad) > 0:
+		out.flush()
+		sys.stderr.write(fn + ': ' + str(len(bad)) + ' lines without an address skipped (first: line ' + str(bad[0]) + ')\n')
 
-# Get the filename; if none supplied, print usage message and exit
-try:
-	elffilename = sys.argv[1]
-except:
-	print('Usage: '+sys.argv[0]+' ELF-file [name] [...]')
-	exit(1)
+# Split a --dump argument into the file name and the address
+#
+def ParseDump(spec):
+	(fn, sep, addr) = spec.rpartition('@')
+	try:
+		return (fn, int(addr, 0))
+	except ValueError:
+		ap.error('--dump: expected FILE@ADDR, not ' + spec)
+
+ap = argparse.ArgumentParser(description='Print information about names in an ELF file.')
+ap.add_argument('elffile', help='the ELF file')
+ap.add_argument('names', nargs='*', help='names to look up; interactive mode if none are given')
+ap.add_argument('--json', action='store_true', help='print one JSON object per name')
+ap.add_argument('--batch', metavar='FILE', help='read names from FILE (- for stdin), one per line; implies --json')
+ap.add_argument('--jobs', type=int, default=1, help='no. of threads for --json (default: 1)')
+ap.add_argument('--dump', metavar='FILE@ADDR', action='append', default=[],
+				help='read the memory at ADDR from the raw dump FILE instead of the ELF file (repeatable)')
+ap.add_argument('--symbolize', metavar='FILE',
+				help='print the symbol, offset and array index of each address in FILE (- for stdin), one per line')
+ap.add_argument('--stats', action='store_true', help='print the time taken by each phase and the counters on stderr at the end')
+ap.add_argument('--serve', metavar='SOCKET', help='keep the file loaded and answer queries on a Unix-domain socket')
+ap.add_argument('--connect', metavar='SOCKET', help='ask the server on SOCKET instead of loading the file')
+args = ap.parse_intermixed_args()
+
+elffilename = args.elffile
+jsonmode = args.json or args.batch != None
+chunksize = 256
+dumps = [ParseDump(d) for d in args.dump]
+if args.stats:
+	stats.Enable()
+if args.symbolize != None and args.connect != None:
+	ap.error('--symbolize needs the file loaded; it can\'t be used with --connect')
+
+if args.serve != None:
+	print('Serving', elffilename, 'on', args.serve)
+	ElfServer(elffilename, args.serve, dumps=dumps).Run()
+	exit(0)
 
 interactive = False
 
 # If there's a list of names on the command line, print information about them and then exit.
-stream = sys.argv[2:]
-if len(stream) == 0:
-	# No list of names; enter interactive mode; read names from stdin
+if args.batch == '-':
 	stream = sys.stdin
-	interactive = True
-
-print('Reading the ELF/DWARF information; this might take some time')
-
-eh = ElfHeader()
-eh.Read(elffilename)
-
-esym = ElfSymbolTable()
-esym.Read(elffilename)
-
-esect = ElfSectionTable(eh.GetEndian() == 'little')
-esect.Read(elffilename)
-esym.SetSectionTable(esect)
+elif args.batch != None:
+	stream = open(args.batch)
+else:
+	stream = args.names
+	if len(stream) == 0:
+		# No list of names; enter interactive mode; read names from stdin
+		stream = sys.stdin
+		interactive = not jsonmode
+
+if not jsonmode and args.symbolize == None:
+	print('Reading the ELF/DWARF information; this might take some time')
+
+if args.connect != None:
+	# The server has the model; each function sends one request
+	try:
+		client = ElfClient(args.connect)
+	except OSError as e:
+		print('Cannot connect to', args.connect + ':', e, file=sys.stderr)
+		exit(1)
+	ef = os.path.abspath(elffilename)
+	describe = lambda names: Ask(client, 'lookup', ef, names)
+	printstuff = lambda v: print(Ask(client, 'print', ef, [v])[0], end='')
+else:
+	# The model is loaded from the cache if the file hasn't changed since the last time
+	model = ElfModel()
+	model.Read(elffilename)
+	for (fn, addr) in dumps:
+		model.sections.AddDump(fn, addr)
+	query = ElfQuery(model)
+	if args.symbolize != None:
+		Symbolize(query, args.symbolize)
+		Finish()
+	if args.jobs > 1:
+		query.Prepare()
+		pool = ThreadPoolExecutor(args.jobs)
+		describe = lambda names: pool.map(query.Describe, names)
+	else:
+		describe = lambda names: map(query.Describe, names)
+	printstuff = query.PrintStuff
 
-df = DwarfFile()
-df.Read(elffilename)
+if jsonmode:
+	WriteJsonLines(stream, describe, sys.stdout)
+	Finish()
 
 if interactive:
 	print('Interactive mode; CTRL-D to exit')
@@ -181,8 +183,8 @@ if interactive:
 
 for v in stream:
 	v = v.rstrip()
-	PrintStuff(v)
+	printstuff(v)
 	if interactive:
 		print('>', end=' ', flush=True)
 
-exit(0)
+Finish()
@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+
+# benchmark.py - time the Certhas loaders on a large generated ELF/DWARF file
+#
+# (c) David Haworth
+#
+# In the base directory, type e.g. 'testsuite/benchmark.py --units 1000 --output bench.json'
+# The C sources are generated from a fixed seed and compiled with gcc in the work directory; they are
+# only generated and compiled again if the parameters change. Each phase is timed (wall and CPU time)
+# and the peak RSS of the process is recorded after it. The results are written as JSON so that runs
+# can be compared.
+#
+# Prerequisites: same as Certhas, plus gcc
+
+# This file is part of Certhas.
+#
+# Certhas is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Certhas is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from elf import ElfHeader, ElfSymbolTable, ElfSectionTable
+from dwarf import DwarfFile
+from dwarfvalue import DwarfValueDecoder
+from elfmodel import ElfModel
+
+# ==============================================================================
+#
+# Generating the test program
+#
+
+# The parameters that change the program
+buildParams = ('units', 'globals', 'types', 'array', 'dwarf', 'seed')
+
+# Write the header with the enums and structs that all the units share
+#
+def WriteCommonHeader(f, p, rng):
+	f.write('#include <stdint.h>\n\n')
+	for i in range(p['types']):
+		n = rng.randint(4, 16)
+		f.write('enum e%d { %s };\n' % (i, ', '.join(['E%d_%d = %d' % (i, j, j * 3 - 5) for j in range(n)])))
+		f.write('struct s%d { int32_t a; char b[%d]; unsigned c:3; unsigned d:5; enum e%d e; '
+				'struct s%d *next; double f; };\n' % (i, rng.randint(1, 8), i, i))
+		f.write('typedef struct s%d s%d_t;\n' % (i, i))
+
+# Write one unit: initialized structs, a large initialized array and an array of enums per global
+#
+def WriteUnit(f, u, p, rng):
+	f.write('#include "common.h"\n\n')
+	for g in range(p['globals']):
+		t = rng.randrange(p['types'])
+		f.write('s%d_t var_%d_%d = { %d, "x", 1, 2, E%d_1, 0, 1.5 };\n' % (t, u, g, rng.randint(-1000, 1000), t))
+		vals = ', '.join([str(rng.randrange(65536)) for i in range(p['array'])])
+		f.write('const uint16_t tab_%d_%d[%d] = { %s };\n' % (u, g, p['array'], vals))
+		f.write('enum e%d state_%d_%d[8] = { E%d_0, E%d_1 };\n' % (t, u, g, t, t))
+	f.write('\nint func_%d(void)\n{\n\tint x = 0;\n' % u)
+	for g in range(p['globals']):
+		f.write('\tx += var_%d_%d.a + tab_%d_%d[%d];\n' % (u, g, u, g, g % p['array']))
+	f.write('\treturn x;\n}\n')
+
+# Generate and compile the program, unless the work directory already has it for these parameters
+# Returns the name of the ELF file.
+#
+def Build(p, workdir, jobs):
+	elffile = os.path.join(workdir, 'bench')
+	stamp = os.path.join(workdir, 'params.json')
+	bp = dict([(k, p[k]) for k in buildParams])
+	try:
+		with open(stamp) as f:
+			if json.load(f) == bp and os.path.exists(elffile):
+				return elffile
+	except (OSError, ValueError):
+		pass
+	if os.path.isdir(workdir):
+		shutil.rmtree(workdir)
+	os.makedirs(workdir)
+
+	rng = random.Random(p['seed'])
+	with open(os.path.join(workdir, 'common.h'), 'w') as f:
+		WriteCommonHeader(f, p, rng)
+	sources = []
+	for u in range(p['units']):
+		fn = os.path.join(workdir, 'f%d.c' % u)
+		with open(fn, 'w') as f:
+			WriteUnit(f, u, p, rng)
+		sources.append(fn)
+	fn = os.path.join(workdir, 'main.c')
+	with open(fn, 'w') as f:
+		for u in range(p['units']):
+			f.write('extern int func_%d(void);\n' % u)
+		f.write('\nint main(void)\n{\n\tint x = 0;\n')
+		for u in range(p['units']):
+			f.write('\tx += func_%d();\n' % u)
+		f.write('\treturn x;\n}\n')
+	sources.append(fn)
+
+	cflags = ['-g', '-gdwarf-' + str(p['dwarf']), '-O0']
+	def Compile(src):
+		subprocess.run(['gcc'] + cflags + ['-c', '-o', src[:-2] + '.o', src], check=True)
+	with ThreadPoolExecutor(jobs) as pool:
+		list(pool.map(Compile, sources))
+	subprocess.run(['gcc', '-o', elffile] + [s[:-2] + '.o' for s in sources], check=True)
+	with open(stamp, 'w') as f:
+		json.dump(bp, f)
+	return elffile
+
+# ==============================================================================
+#
+# Timing
+#
+
+# Run a phase and record its wall and CPU time, and the peak RSS of the process afterwards
+# Returns whatever fn returns.
+#
+def Phase(results, name, fn):
+	w = time.perf_counter()
+	c = time.process_time()
+	r = fn()
+	results.append({
+		'phase': name,
+		'wall': round(time.perf_counter() - w, 6),
+		'cpu': round(time.process_time() - c, 6),
+		'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	})
+	print('%-36s %10.3f s wall %10.3f s cpu %10d kB peak' %
+			(name, results[-1]['wall'], results[-1]['cpu'], results[-1]['maxrss_kb']), file=sys.stderr)
+	return r
+
+# Time all the phases on one ELF file
+#
+def RunPhases(elffile, p):
+	results = []
+	rng = random.Random(p['seed'])
+	names = ['var_%d_%d' % (rng.randrange(p['units']), rng.randrange(p['globals'])) for i in range(p['lookups'])]
+
+	eh = ElfHeader()
+	Phase(results, 'ElfHeader.Read', lambda: eh.Read(elffile))
+
+	esym = ElfSymbolTable()
+	Phase(results, 'ElfSymbolTable.Read', lambda: esym.Read(elffile))
+
+	esect = ElfSectionTable(eh.GetEndian() == 'little')
+	Phase(results, 'ElfSectionTable.Read', lambda: esect.Read(elffile))
+	esym.SetSectionTable(esect)
+
+	def LoadSections():
+		n = 0
+		for s in esect.sections:
+			if s.size > 0 and not s.nobits and esect.LoadBytes(s.baseaddr, s.size) is not None:
+				n = n + s.size
+		return n
+	Phase(results, 'ElfSectionTable.LoadBytes (sections)', LoadSections)
+
+	def LoadArrays():
+		for g in names:
+			i = esym.FindByName(g.replace('var_', 'tab_'))
+			esect.LoadArray(esym.values[i], p['array'], 2)
+	Phase(results, 'ElfSectionTable.LoadArray', LoadArrays)
+
+	df = DwarfFile()
+	Phase(results, 'DwarfFile.Read', lambda: df.Read(elffile))
+
+	lazy = DwarfFile()
+	Phase(results, 'DwarfFile.Read (lazy)', lambda: lazy.Read(elffile, lazy=True))
+	Phase(results, 'FindObjectDefinition (lazy)', lambda: [lazy.FindObjectDefinition(n) for n in names])
+
+	Phase(results, 'ElfSymbolTable.FindByName', lambda: [esym.FindByName(n) for n in names])
+	Phase(results, 'DwarfFile.FindObjectDefinition', lambda: [df.FindObjectDefinition(n) for n in names])
+	addrs = [esym.values[esym.FindByName(n)] + 4 for n in names]
+	Phase(results, 'ElfSymbolTable.BestMatch', lambda: [esym.BestMatch(a, '') for a in addrs])
+	dv = DwarfValueDecoder(esect, eh.GetBits() // 8)
+	Phase(results, 'DwarfValueDecoder.DecodeVariable',
+			lambda: [dv.DecodeVariable(df.FindObjectDefinition(n.replace('var_', s))) for n in names
+																	for s in ('var_', 'tab_', 'state_')])
+	Phase(results, 'DwarfFile.UnifyTypes', df.UnifyTypes)
+
+	cachedir = tempfile.mkdtemp()
+	saved = os.environ.get('CERTHAS_CACHE_DIR')
+	os.environ['CERTHAS_CACHE_DIR'] = cachedir
+	try:
+		Phase(results, 'ElfModel.Read (cache miss)', lambda: ElfModel().Read(elffile))
+		Phase(results, 'ElfModel.Read (cache hit)', lambda: ElfModel().Read(elffile))
+	finally:
+		shutil.rmtree(cachedir)
+		if saved == None:
+			del os.environ['CERTHAS_CACHE_DIR']
+		else:
+			os.environ['CERTHAS_CACHE_DIR'] = saved
+	return results
+
+# Return the version of gcc
+#
+def GetGccVersion():
+	try:
+		return subprocess.run(['gcc', '--version'], capture_output=True, text=True).stdout.splitlines()[0]
+	except (OSError, IndexError):
+		return None
+
+ap = argparse.ArgumentParser(description='Time the Certhas loaders on a generated ELF/DWARF file.')
+ap.add_argument('--units', type=int, default=1000, help='no. of compile units (default 1000)')
+ap.add_argument('--globals', type=int, default=4, help='no. of each kind of global per unit (default 4)')
+ap.add_argument('--types', type=int, default=200, help='no. of struct and enum types (default 200)')
+ap.add_argument('--array', type=int, default=256, help='no. of elements in each initialized array (default 256)')
+ap.add_argument('--dwarf', type=int, default=5, help='DWARF version (default 5)')
+ap.add_argument('--lookups', type=int, default=10000, help='no. of lookups in the lookup phases (default 10000)')
+ap.add_argument('--seed', type=int, default=1, help='seed for the generator (default 1)')
+ap.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'certhas-bench'),
+				help='directory for the generated program')
+ap.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='no. of parallel compilations')
+ap.add_argument('--output', default='benchmark.json', help='JSON file for the results (default benchmark.json)')
+args = ap.parse_args()
+
+params = {
+	'units': args.units, 'globals': args.globals, 'types': args.types, 'array': args.array,
+	'dwarf': args.dwarf, 'lookups': args.lookups, 'seed': args.seed
+}
+
+print('Building the program in', args.workdir, file=sys.stderr)
+elffile = Build(params, args.workdir, args.jobs)
+
+report = {
+	'params': params,
+	'elffile': { 'name': elffile, 'size': os.path.getsize(elffile) },
+	'python': platform.python_version(),
+	'platform': platform.platform(),
+	'gcc': GetGccVersion(),
+	'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+	'phases': RunPhases(elffile, params)
+}
+with open(args.output, 'w') as f:
+	json.dump(report, f, indent=1)
+	f.write('\n')
+print('Results written to', args.output, file=sys.stderr)
+exit(0)
@@ -20,8 +20,34 @@
 # along with Certhas.  If not, see <http://www.gnu.org/licenses/>.
 import os
 import sys
+import tempfile
+import zlib
 
-from elf import Elf, ElfError
+from elf import Elf, ElfError, ElfSymbolTable
+from elf import ElfHeader, ElfSectionTable
+from dwarf import ReadULEB128, ReadSLEB128, DwarfFile, DwarfObject, DwarfError
+from dwarfvalue import DwarfValueDecoder
+from dwarfconst import DW_ATE_signed, DW_ATE_unsigned
+from elfstats import ElfStats, stats
+from elfmodel import ElfModel
+from elfdiff import ElfDiff
+from elfquery import ElfQuery
+from dwarfline import DwarfLineTable, DwarfLines
+from elfsymbolize import ElfSymbolizer
+from dwarfpath import DwarfPathResolver
+
+failures = 0
+testprog = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testsuite', 'testprog')
+
+# Print a result with its label, followed by FAIL and the expected result if they differ
+#
+def Check(label, result, expected):
+	global failures
+	if result == expected:
+		print(label, '=', result)
+	else:
+		print(label, '=', result, 'FAIL expected', expected)
+		failures = failures + 1
 
 # Do the testing
 #
@@ -63,5 +89,515 @@ def DoTesting():
 		print('ConvertToSigned(18446744073709551616, 8) exception :', msg)
 	return
 
+# Make a symbol table by hand
+# outer (0x1000, 0x100) contains inner (0x1010, 0x10); label (0x1010, size 0); arr (0x2000, 0x40)
+#
+def MakeSymbolTable(syms=[ ('outer', 0x1000, 0x100, 1), ('inner', 0x1010, 0x10, 1),
+							('label', 0x1010, 0, 0), ('arr', 0x2000, 0x40, 1) ]):
+	st = ElfSymbolTable()
+	strings = bytearray(b'\0')
+	for (name, value, size, info) in syms:
+		st.nameoffs.append(len(strings))
+		strings.extend(name.encode() + b'\0')
+		st.values.append(value)
+		st.sizes.append(size)
+		st.infos.append(info)
+		st.others.append(0)
+		st.shndxs.append(1)
+	st.strings = bytes(strings)
+	return st
+
+# Make a compile unit by hand
+# dies is a list of  ident, tag, attributes  of the children of the unit; children is a list of
+#  parent ident, tag, attributes  of their children. Returns  unit, dictionary ident --> object
+#
+def MakeUnit(dies, children=[]):
+	cu = DwarfObject(None)
+	cu.tag = 'DW_TAG_compile_unit'
+	objs = {}
+	for (ident, tag, attrs) in dies:
+		c = DwarfObject(cu)
+		c.tag = tag
+		c.ident = ident
+		for (attr, value) in attrs:
+			c.AddDecodedAttr(attr, value)
+		cu.AddChild(c)
+		objs[ident] = c
+	for (parent, tag, attrs) in children:
+		p = objs[parent]
+		c = DwarfObject(p)
+		c.tag = tag
+		for (attr, value) in attrs:
+			c.AddDecodedAttr(attr, value)
+		p.AddChild(c)
+	return (cu, objs)
+
+# Test the address index with a hand-made symbol table
+#
+def TestAddressIndex():
+	st = MakeSymbolTable()
+	# Address: FindContaining, FindContaining(OBJECT), BestMatch, FindLowerSymbol
+	for (a, expected) in [ (0x0fff, (None, None, None, 0)),
+						   (0x1000, ('outer', 'outer', 'outer', 0x1000)),
+						   (0x1010, ('inner', 'inner', 'inner', 0x1010)),
+						   (0x1018, ('inner', 'inner', 'inner', 0x1010)),
+						   (0x1020, ('outer', 'outer', 'outer', 0x1010)),
+						   (0x10ff, ('outer', 'outer', 'outer', 0x1010)),
+						   (0x1100, (None, None, 'inner', 0x1010)),
+						   (0x2008, ('arr', 'arr', 'arr', 0x2000)) ]:
+		c = st.FindContaining(a)
+		o = st.FindContaining(a, ['OBJECT'])
+		Check('FindContaining, OBJECT, BestMatch, FindLowerSymbol (' + hex(a) + ')',
+				(st.GetNameByIndex(c) if c >= 0 else None, st.GetNameByIndex(o) if o >= 0 else None,
+				 st.BestMatch(a, ''), st.FindLowerSymbol(a)), expected)
+	Check('BestMatch(0x1010, \'l\')', st.BestMatch(0x1010, 'l'), 'label')
+	Check('FindArrayRef(0x2008, \'\', 4)', st.FindArrayRef(0x2008, '', 4), ('arr', 2, True))
+	return
+
+# A huge symbol in front of many small ones must not make every lookup go through all of them
+#
+def TestAddressIndexHugeSymbol():
+	syms = [ ('all', 0, 1 << 40, 1) ] + [ ('f' + str(n), 0x1000 + 0x10 * n, 0x10, 2) for n in range(2000) ]
+	st = MakeSymbolTable(syms)
+	ai = st.GetAddressIndex()
+	stats.Reset()
+	stats.Enable()
+	found = [ (a, [st.GetNameByIndex(s) for s in ai.FindAllContaining(a)]) for a in (0x0fff, 0x1000, 0x8008, 0x8cff, 0x8d00) ]
+	candidates = stats.GetReport()['counters'].get('containing symbol candidates', 0)
+	stats.Disable()
+	stats.Reset()
+	Check('FindAllContaining with a huge symbol', found,
+			[ (0x0fff, ['all']), (0x1000, ['f0', 'all']), (0x8008, ['f1792', 'all']),
+			  (0x8cff, ['f1999', 'all']), (0x8d00, ['all']) ])
+	Check('FindContaining with a huge symbol (0x8008)', st.GetNameByIndex(st.FindContaining(0x8008)), 'f1792')
+	Check('Candidates looked at for 5 lookups <= 20', candidates <= 20, True)
+	return
+
+# Test the streaming symbolizer against BestMatch(), with arr as an array of 4-byte elements
+#
+def TestSymbolizer():
+	st = MakeSymbolTable()
+	addrs = [ 0x2008, 0, 0x0fff, 0x1010, 0x10ff, 0x1018, 0x1100, 0x2040, 0x1000, 0x2008 ]
+	sz = ElfSymbolizer(st, elementsize=lambda name: 4 if name == 'arr' else None, chunksize=4)
+	results = list(sz.Symbolize(addrs))
+	Check('Symbolize()', [ElfSymbolizer.FormatResult(r) for r in results],
+			[ '0x2008 arr[2]+0x8', '0x0 NULL+0x0', '0xfff ?', '0x1010 inner+0x0', '0x10ff outer+0xff',
+			  '0x1018 inner+0x8', '0x1100 inner+0xf0', '0x2040 arr+0x40', '0x1000 outer+0x0', '0x2008 arr[2]+0x8' ])
+	Check('Symbolize() symbols same as BestMatch()', [r[1] for r in results], [st.BestMatch(a, '') for a in addrs])
+	bad = []
+	lines = [ 'address count\n', '0x1010 3\n', '\n', '# comment\n', '2008\n', 'zz\n' ]
+	Check('ReadAddresses() with bad lines', (list(ElfSymbolizer.ReadAddresses(lines, bad)), bad), ([0x1010, 0x2008], [1, 6]))
+	return
+
+# Test the LEB128 decoders with the examples from the DWARF standard
+#
+def TestLEB128():
+	for (b, expected) in [ (b'\x02', 2), (b'\x7f', 127), (b'\x80\x01', 128), (b'\x81\x01', 129),
+						   (b'\x82\x01', 130), (b'\xb9\x64', 12857) ]:
+		Check('ReadULEB128(' + b.hex() + ')', ReadULEB128(b, 0), (expected, len(b)))
+	for (b, expected) in [ (b'\x02', 2), (b'\x7e', -2), (b'\xff\x00', 127), (b'\x81\x7f', -127),
+						   (b'\x80\x01', 128), (b'\x80\x7f', -128) ]:
+		Check('ReadSLEB128(' + b.hex() + ')', ReadSLEB128(b, 0), (expected, len(b)))
+	return
+
+# Test the name index of DwarfFile with two hand-made compile units
+# Unit 1 declares x and has a separate definition DIE; unit 2 defines x and y directly.
+#
+def TestNameIndex():
+	df = DwarfFile()
+	for dies in [ [ (0x10, 'DW_TAG_variable', [('DW_AT_name', 'x'), ('DW_AT_declaration', True)]),
+					(0x20, 'DW_TAG_variable', [('DW_AT_specification', 0x10)]) ],
+				  [ (0x30, 'DW_TAG_variable', [('DW_AT_name', 'x'), ('DW_AT_location', 0x2000)]),
+					(0x40, 'DW_TAG_variable', [('DW_AT_name', 'y'), ('DW_AT_location', 0x2004)]) ] ]:
+		(cu, objs) = MakeUnit(dies)
+		cu.LinkSpecifications()
+		df.objects.append(cu)
+		df.IndexObject(cu)
+	# Name: FindObject, FindObjectDefinition, FindAll
+	for (n, expected) in [ ('x', (0x10, 0x10, [0x10, 0x30])), ('y', (0x40, 0x40, [0x40])), ('z', (None, None, [])) ]:
+		o = df.FindObject(n)
+		d = df.FindObjectDefinition(n)
+		Check('FindObject, FindObjectDefinition, FindAll (\'' + n + '\')',
+				(o.GetIdent() if o != None else None, d.GetIdent() if d != None else None,
+				 [c.GetIdent() for c in df.FindAll(n)]), expected)
+	return
+
+# Test the type descriptors with a hand-made compile unit:
+#   int; const int; int *; int[4][2]; typedef const int[4][2]; int *[3]
+#
+def TestTypeInfo():
+	(cu, objs) = MakeUnit([ (0x10, 'DW_TAG_base_type', [('DW_AT_name', 'int'), ('DW_AT_byte_size', 4)]),
+							(0x20, 'DW_TAG_const_type', [('DW_AT_type', 0x10)]),
+							(0x30, 'DW_TAG_pointer_type', [('DW_AT_byte_size', 8), ('DW_AT_type', 0x10)]),
+							(0x40, 'DW_TAG_array_type', [('DW_AT_type', 0x20)]),
+							(0x50, 'DW_TAG_typedef', [('DW_AT_name', 'arr_t'), ('DW_AT_type', 0x40)]),
+							(0x60, 'DW_TAG_array_type', [('DW_AT_type', 0x30)]),
+							(0x70, 'DW_TAG_typedef', [('DW_AT_name', 'loop_t'), ('DW_AT_type', 0x80)]),
+							(0x80, 'DW_TAG_volatile_type', [('DW_AT_type', 0x70)]) ],
+						  [ (0x40, 'DW_TAG_subrange_type', [('DW_AT_upper_bound', 3)]),
+							(0x40, 'DW_TAG_subrange_type', [('DW_AT_upper_bound', 1)]),
+							(0x60, 'DW_TAG_subrange_type', [('DW_AT_upper_bound', 2)]) ])
+	# kind, qualifiers, bytesize, count, IsPointer, GetArrayElements
+	expected = [ ('base', (), 4, None, False, -1),
+				 ('base', ('const',), 4, None, False, -1),
+				 ('pointer', (), 8, None, True, -1),
+				 ('array', (), 32, 4, False, 4),
+				 ('array', (), 32, 4, False, 4),
+				 ('array', (), 24, 3, True, 3),
+				 ('void', ('volatile',), None, None, False, -1),		# A broken chain that loops ends as void
+				 ('void', ('volatile',), None, None, False, -1) ]
+	for (c, e) in zip(cu.children, expected):
+		ti = c.GetTypeInfo()
+		Check(c.GetStrippedTag() + ' ' + hex(c.GetIdent()),
+				(ti.kind, ti.qualifiers, ti.bytesize, ti.count, c.IsPointer(), c.GetArrayElements()), e)
+	return
+
+# Test type unification with two hand-made compile units that both define int and a pointer to it
+# Unit 2 also has a different pointer type (8-byte long *), which must stay separate.
+#
+def TestUnifyTypes():
+	df = DwarfFile()
+	for (base, extra) in [ (0x10, []), (0x100, [(0x130, 'DW_TAG_base_type', [('DW_AT_name', 'long'), ('DW_AT_byte_size', 8)])]) ]:
+		(cu, objs) = MakeUnit([ (base, 'DW_TAG_base_type', [('DW_AT_name', 'int'), ('DW_AT_byte_size', 4)]),
+								(base+0x10, 'DW_TAG_pointer_type', [('DW_AT_byte_size', 8), ('DW_AT_type', base)]),
+								(base+0x20, 'DW_TAG_variable', [('DW_AT_name', 'v' + hex(base)), ('DW_AT_type', base+0x10)]) ] + extra)
+		df.objects.append(cu)
+		df.IndexObject(cu)
+	Check('UnifyTypes()', df.UnifyTypes(), 2)
+	for n in [ 'v0x10', 'v0x100' ]:
+		v = df.FindObject(n)
+		t = v.GetTypeTarget()
+		Check(n + ' type, target', (t.GetIdent(), t.GetTypeTarget().GetIdent()), (0x20, 0x10))
+	Check('FindAll(\'int\')', [o.GetIdent() for o in df.FindAll('int')], [0x10])
+	Check('FindAll(\'long\')', [o.GetIdent() for o in df.FindAll('long')], [0x130])
+	return
+
+# Test the value decoder with a hand-made little-endian struct:
+#   struct { short a; unsigned b:3; int c:5; enum { X = 1, Y = 2 } e; short arr[2][2]; }
+#
+def TestValueDecoder():
+	(cu, objs) = MakeUnit([ (0x10, 'DW_TAG_base_type', [('DW_AT_name', 'short'), ('DW_AT_byte_size', 2), ('DW_AT_encoding', DW_ATE_signed)]),
+							(0x20, 'DW_TAG_base_type', [('DW_AT_name', 'unsigned'), ('DW_AT_byte_size', 4), ('DW_AT_encoding', DW_ATE_unsigned)]),
+							(0x30, 'DW_TAG_base_type', [('DW_AT_name', 'int'), ('DW_AT_byte_size', 4), ('DW_AT_encoding', DW_ATE_signed)]),
+							(0x40, 'DW_TAG_enumeration_type', [('DW_AT_byte_size', 4), ('DW_AT_type', 0x20)]),
+							(0x50, 'DW_TAG_array_type', [('DW_AT_type', 0x10)]),
+							(0x60, 'DW_TAG_structure_type', [('DW_AT_byte_size', 20)]),
+							(0x70, 'DW_TAG_pointer_type', [('DW_AT_type', 0x30)]) ],
+						  [ (0x40, 'DW_TAG_enumerator', [('DW_AT_name', 'X'), ('DW_AT_const_value', 1)]),
+							(0x40, 'DW_TAG_enumerator', [('DW_AT_name', 'Y'), ('DW_AT_const_value', 2)]),
+							(0x50, 'DW_TAG_subrange_type', [('DW_AT_upper_bound', 1)]),
+							(0x50, 'DW_TAG_subrange_type', [('DW_AT_count', 2)]),
+							(0x60, 'DW_TAG_member', [('DW_AT_name', 'a'), ('DW_AT_type', 0x10), ('DW_AT_data_member_location', 0)]),
+							(0x60, 'DW_TAG_member', [('DW_AT_name', 'b'), ('DW_AT_type', 0x20), ('DW_AT_bit_size', 3), ('DW_AT_data_bit_offset', 16)]),
+							(0x60, 'DW_TAG_member', [('DW_AT_name', 'c'), ('DW_AT_type', 0x30), ('DW_AT_bit_size', 5), ('DW_AT_data_bit_offset', 19)]),
+							(0x60, 'DW_TAG_member', [('DW_AT_name', 'e'), ('DW_AT_type', 0x40), ('DW_AT_data_member_location', 4)]),
+							(0x60, 'DW_TAG_member', [('DW_AT_name', 'arr'), ('DW_AT_type', 0x50), ('DW_AT_data_member_location', 8)]) ])
+	dv = DwarfValueDecoder(ElfSectionTable(True))
+	layout = dv.GetLayout(objs[0x60])
+	data = bytes([0xfe, 0xff, 0xed, 0x00, 2, 0, 0, 0, 1, 0, 2, 0, 3, 0, 0xff, 0xff, 0, 0, 0, 0])
+	Check('Decode()', layout.Decode(data, 0), {'a': -2, 'b': 5, 'c': -3, 'e': 'Y', 'arr': [[1, 2], [3, -1]]})
+	e = objs[0x40]
+	Check('GetEnumeratorName(2)', e.GetEnumeratorName(2), 'Y')
+	Check('GetEnumeratorValue(\'X\')', e.GetEnumeratorValue('X'), 1)
+	Check('DecodeEnumArray([2, 1, 3])', e.DecodeEnumArray([2, 1, 3]), ['Y', 'X', None])
+	# A pointer without DW_AT_byte_size has the size of an address
+	Check('Pointer size (ELFCLASS64)', dv.GetLayout(objs[0x70]).size, 8)
+	dv32 = DwarfValueDecoder(ElfSectionTable(True), 4)
+	Check('Pointer size (ELFCLASS32)', dv32.GetLayout(objs[0x70]).size, 4)
+	Check('Decode() pointer (ELFCLASS32)', dv32.GetLayout(objs[0x70]).Decode(data, 4), 2)
+	return
+
+# Test memory dumps laid over an empty section table: two adjacent dumps and a gap
+#
+def TestMemoryDump():
+	est = ElfSectionTable(True)
+	d = tempfile.mkdtemp()
+	for (name, data, addr) in [ ('d1', b'abc\0\x01\x02', 0x1000), ('d2', b'\x03\x04xyz', 0x1006) ]:
+		fn = os.path.join(d, name)
+		f = open(fn, 'wb')
+		f.write(data)
+		f.close()
+		est.AddDump(fn, addr)
+		os.remove(fn)				# The mapping stays valid
+	os.rmdir(d)
+	Check('Load(0x1004, 4)', est.Load(0x1004, 4), 0x04030201)
+	Check('Load(0x100a, 4)', est.Load(0x100a, 4), None)
+	Check('LoadString(0x1000)', est.LoadString(0x1000, 10), 'abc')
+	Check('LoadString(0x1008)', est.LoadString(0x1008, 10), 'xyz')
+	Check('LoadArray(0x1004, 2, 2)', [int(x) for x in est.LoadArray(0x1004, 2, 2)], [0x0201, 0x0403])
+	try:
+		est.LoadArray(0x1004, 2, 2, dtype='d')
+		r = 'no error'
+	except ElfError:
+		r = 'ElfError'
+	Check('LoadArray(0x1004, 2, 2, dtype=\'d\')', r, 'ElfError')
+	return
+
+# Test the statistics: nothing is recorded until they are enabled
+#
+def TestStats():
+	st = ElfStats()
+	st.Count('x')
+	with st.Phase('p'):
+		pass
+	st.Enable()
+	st.Count('x')
+	st.Count('x', 2)
+	for i in range(2):
+		with st.Phase('p'):
+			pass
+	r = st.GetReport()
+	Check('counters', r['counters'], {'x': 3})
+	Check('phase p calls', r['phases']['p']['calls'], 2)
+	return
+
+# Return True if the test program has been built (testsuite/runtest.sh builds it); print a note if not
+#
+def HaveTestprog(test):
+	if os.path.exists(testprog):
+		return True
+	print(test + ': ' + testprog + ' not found; skipped')
+	return False
+
+# Test that the native readers and the readelf readers give the same header, sections and symbols
+#
+def TestNativeReaders():
+	if not HaveTestprog('TestNativeReaders'):
+		return
+	(native, scraped) = (ElfHeader(), ElfHeader())
+	native.Read(testprog)
+	scraped.Read(testprog, True)
+	Check('ElfHeader native == readelf', (native.GetClass(), native.GetEndian(), native.GetMachine(), native.GetBits()),
+			(scraped.GetClass(), scraped.GetEndian(), scraped.GetMachine(), scraped.GetBits()))
+	(native, scraped) = (ElfSectionTable(True), ElfSectionTable(True))
+	native.Read(testprog)
+	scraped.Read(testprog, True)
+	fields = lambda st: [(s.Nr, s.Name, s.Type, s.Addr, s.Offset, s.Size, s.ES, s.Flg, s.Lk, s.Inf, s.Al) for s in st.sections]
+	Check('ElfSectionTable native == readelf', fields(native) == fields(scraped), True)
+	contents = lambda st: [st.LoadBytes(s.baseaddr, s.size) for s in st.sections if s.baseaddr != 0 and s.size > 0]
+	Check('Section contents native == readelf', contents(native) == contents(scraped), True)
+	(native, scraped) = (ElfSymbolTable(), ElfSymbolTable())
+	native.Read(testprog)
+	scraped.Read(testprog, True)
+	symbols = lambda st: [(st.GetNameByIndex(i), st.values[i], st.sizes[i], st.infos[i], st.others[i], st.shndxs[i])
+							for i in range(st.GetSymbolCount())]
+	Check('ElfSymbolTable native == readelf', symbols(native) == symbols(scraped), True)
+	Check('ElfSymbolTable tablestarts native == readelf', native.tablestarts, scraped.tablestarts)
+	return
+
+# Test that lazy loading finds the same objects and builds the same trees as an eager read
+#
+def TestLazyRead():
+	if not HaveTestprog('TestLazyRead'):
+		return
+	(eager, lazy) = (DwarfFile(), DwarfFile())
+	eager.Read(testprog)
+	lazy.Read(testprog, lazy=True)
+	Check('Units parsed before a lookup', len(lazy.parsed), 0)
+	ident = lambda o: None if o == None else o.ident
+	different = [n for n in eager.names
+					if (ident(lazy.FindObject(n)), ident(lazy.FindObjectDefinition(n)), ident(lazy.FindDeclaration(n)))
+						!= (ident(eager.FindObject(n)), ident(eager.FindObjectDefinition(n)), ident(eager.FindDeclaration(n)))]
+	Check('Names found differently lazy vs eager', different, [])
+	Check('Lazy trees == eager trees', [o.Flatten() for o in lazy.GetObjects()] == [o.Flatten() for o in eager.GetObjects()], True)
+	return
+
+# Test that parsing the units in parallel gives the same trees and name indexes as a serial parse
+#
+def TestParallelRead():
+	if not HaveTestprog('TestParallelRead'):
+		return
+	(serial, parallel) = (DwarfFile(), DwarfFile())
+	serial.Read(testprog)
+	stats.Reset()
+	stats.Enable()
+	parallel.Read(testprog, workers=2)
+	phases = stats.GetReport()['phases']
+	stats.Disable()
+	stats.Reset()
+	Check('Units parsed by the pool, units parsed here', (len(parallel.parsed), phases.get('ReadUnit', {'calls': 0})['calls']),
+			(len(serial.units), 0))
+	Check('Parallel trees == serial trees', [o.Flatten() for o in parallel.objects] == [o.Flatten() for o in serial.objects], True)
+	for index in ('names', 'definitions', 'declarations'):
+		(a, b) = (getattr(serial, index), getattr(parallel, index))
+		Check('Parallel ' + index + ' == serial', sorted((n, [c.ident for c in l]) for (n, l) in b.items()) ==
+													sorted((n, [c.ident for c in l]) for (n, l) in a.items()), True)
+	return
+
+# Return what a model holds, as plain values that can be compared
+#
+def ModelContents(m):
+	h = m.header
+	esym = m.symbols
+	return ( (h.GetClass(), h.GetEndian(), h.GetMachine(), h.GetBits()),
+			 [(s.Nr, s.Name, s.Type, s.Addr, s.Offset, s.Size, s.ES, s.Flg, s.Lk, s.Inf, s.Al) for s in m.sections.sections],
+			 [m.sections.LoadBytes(s.baseaddr, s.size) for s in m.sections.sections if s.baseaddr != 0 and s.size > 0],
+			 [(esym.GetNameByIndex(i), esym.values[i], esym.sizes[i], esym.infos[i], esym.others[i], esym.shndxs[i])
+				for i in range(esym.GetSymbolCount())],
+			 [o.Flatten() for o in m.dwarf.GetObjects()],
+			 sorted((n, [c.ident for c in l]) for (n, l) in m.dwarf.names.items()) )
+
+# Test that a model loaded from the cache is the same as a freshly parsed one
+#
+def TestCache():
+	if not HaveTestprog('TestCache'):
+		return
+	saved = os.environ.get('CERTHAS_CACHE_DIR')
+	d = tempfile.mkdtemp()
+	os.environ['CERTHAS_CACHE_DIR'] = d
+	try:
+		fresh = ElfModel()
+		fresh.Read(testprog, usecache=False)
+		(miss, hit) = (ElfModel(), ElfModel())
+		miss.Read(testprog)
+		hit.Read(testprog)
+		Check('Cache files written', len(os.listdir(d)), 1)
+		Check('Loaded from the cache (miss, hit)', (miss.cached, hit.cached), (False, True))
+		Check('Cache hit == fresh parse', ModelContents(hit) == ModelContents(fresh), True)
+		Check('Cache miss == fresh parse', ModelContents(miss) == ModelContents(fresh), True)
+	finally:
+		for fn in os.listdir(d):
+			os.remove(os.path.join(d, fn))
+		os.rmdir(d)
+		if saved == None:
+			del os.environ['CERTHAS_CACHE_DIR']
+		else:
+			os.environ['CERTHAS_CACHE_DIR'] = saved
+	return
+
+# Test that elfdiff keeps local symbols of the same name in different files apart
+#
+def TestDiffSymbols():
+	models = []
+	for syms in [ [ ('a.c', 0, 0, 4), ('count', 0x1000, 4, 1), ('b.c', 0, 0, 4), ('count', 0x1010, 4, 1),
+					('glob', 0x2000, 8, 0x11) ],
+				  [ ('a.c', 0, 0, 4), ('count', 0x1000, 4, 1), ('b.c', 0, 0, 4), ('count', 0x1020, 8, 1),
+					('glob', 0x2000, 8, 0x11), ('glob2', 0x3000, 8, 0x11) ] ]:
+		m = ElfModel()
+		m.symbols = MakeSymbolTable(syms)
+		m.sections = ElfSectionTable(True)
+		models.append(m)
+	Check('GetSymbols() keys', sorted(ElfDiff.GetSymbols(models[0])), ['a.c:count', 'b.c:count', 'glob'])
+	Check('DiffSymbols()', ElfDiff(models[0], models[1]).DiffSymbols(),
+			{ 'added': ['glob2'], 'removed': [], 'moved': [['b.c:count', 0x1010, 0x1020]],
+			  'resized': [['b.c:count', 4, 8]], 'changed': [] })
+	if not HaveTestprog('TestDiffSymbols'):
+		return
+	m = ElfModel()
+	m.Read(testprog, usecache=False)
+	s = m.symbols.FindByName('completed.0')
+	Check('GetContentHash() of a .bss symbol', ElfDiff.GetContentHash(m, m.symbols.values[s], m.symbols.sizes[s]),
+			zlib.crc32(bytes(m.symbols.sizes[s])))
+	return
+
+# Test that the JSON lookups (explore.py --json) take paths to members as the text output does
+#
+def TestDescribePath():
+	if not HaveTestprog('TestDescribePath'):
+		return
+	m = ElfModel()
+	m.Read(testprog, usecache=False)
+	q = ElfQuery(m)
+	d = q.Describe('struct1a.ss_i')
+	Check('Describe(\'struct1a.ss_i\')', (d['found'], d['kind'], d['size'], d['value']), (True, 'path', 4, 99))
+	Check('Describe(\'struct1a.ss_i\') address == Decode()', d['address'], q.Decode('struct1a.ss_i')['address'])
+	Check('Describe(\'struct1a.nosuch\')', q.Describe('struct1a.nosuch'),
+			{ 'name': 'struct1a.nosuch', 'found': False, 'error': 'struct1a.nosuch: no member nosuch' })
+	return
+
+# Test the line table lookup: the sequences of two units, with a gap between them
+#
+def TestLineTable():
+	t1 = DwarfLineTable(0)
+	t1.filenames = [ '?', 'a.c' ]
+	t1.AddSequence([ (0x1000, 1, 10, 1), (0x1008, 1, 11, 5), (0x1010, 0, 0, 0) ])
+	t2 = DwarfLineTable(0x40)
+	t2.filenames = [ 'b.c' ]
+	t2.AddSequence([ (0x2000, 0, 7, 0), (0x2004, 0, 0, 0) ])
+	dl = DwarfLines()
+	dl.tables = [ t2, t1 ]
+	dl.BuildIndex()
+	Check('LookupAll()', dl.LookupAll([ 0xfff, 0x1000, 0x100f, 0x1010, 0x2002, 0x1004, 0x2004 ]),
+			[None, ('a.c', 10, 1), ('a.c', 11, 5), None, ('b.c', 7, 0), ('a.c', 10, 1), None])
+	# Overlapping sequences: two discarded functions left at 0 overlap each other and the code at 0x10;
+	# a short sequence inside a longer one that starts before it
+	t3 = DwarfLineTable(0x80)
+	t3.filenames = [ 'c.c' ]
+	t3.AddSequence([ (0x0, 0, 1, 0), (0x40, 0, 0, 0) ])
+	t3.AddSequence([ (0x0, 0, 2, 0), (0x8, 0, 0, 0) ])
+	t3.AddSequence([ (0x10, 0, 20, 0), (0x18, 0, 21, 0), (0x20, 0, 0, 0) ])
+	t3.AddSequence([ (0x3000, 0, 30, 0), (0x3100, 0, 0, 0) ])
+	t3.AddSequence([ (0x3010, 0, 40, 0), (0x3020, 0, 0, 0) ])
+	dl.tables = [ t2, t1, t3 ]
+	dl.BuildIndex()
+	Check('LookupAll() with overlaps', dl.LookupAll([ 0x4, 0x14, 0x18, 0x30, 0x3050, 0x3010 ]),
+			[None, ('c.c', 20, 0), ('c.c', 21, 0), None, ('c.c', 30, 0), ('c.c', 30, 0)])
+	return
+
+# Test member paths on a hand-made variable whose contents come from a memory dump:
+#   struct { int a; int m[2][3]; } cfg at 0x1000, with the ints 0 to 6 in the dump
+#
+def TestPaths():
+	df = DwarfFile()
+	(cu, objs) = MakeUnit([ (0x10, 'DW_TAG_base_type', [('DW_AT_name', 'int'), ('DW_AT_byte_size', 4), ('DW_AT_encoding', DW_ATE_signed)]),
+							(0x20, 'DW_TAG_array_type', [('DW_AT_type', 0x10)]),
+							(0x30, 'DW_TAG_structure_type', [('DW_AT_byte_size', 28)]),
+							(0x40, 'DW_TAG_variable', [('DW_AT_name', 'cfg'), ('DW_AT_type', 0x30)]) ],
+						  [ (0x20, 'DW_TAG_subrange_type', [('DW_AT_upper_bound', 1)]),
+							(0x20, 'DW_TAG_subrange_type', [('DW_AT_count', 3)]),
+							(0x30, 'DW_TAG_member', [('DW_AT_name', 'a'), ('DW_AT_type', 0x10), ('DW_AT_data_member_location', 0)]),
+							(0x30, 'DW_TAG_member', [('DW_AT_name', 'm'), ('DW_AT_type', 0x20), ('DW_AT_data_member_location', 4)]) ])
+	objs[0x40].value = 0x1000
+	df.objects.append(cu)
+	df.IndexObject(cu)
+	est = ElfSectionTable(True)
+	(fd, fn) = tempfile.mkstemp()
+	os.write(fd, b''.join([i.to_bytes(4, 'little') for i in range(7)]))
+	os.close(fd)
+	est.AddDump(fn, 0x1000)
+	os.remove(fn)
+	pr = DwarfPathResolver(df, DwarfValueDecoder(est))
+	Check('GetMembers()', [m.GetName() for m in objs[0x30].GetMembers()], ['a', 'm'])
+	# Path: address, size, value  or the exception message
+	for (path, expected) in [ ('cfg.a', (0x1000, 4, 0)),
+							  ('cfg.m[1][2]', (0x1018, 4, 6)),
+							  ('cfg.m[1]', (0x1010, 12, [4, 5, 6])),
+							  (' cfg . m [0x1] [0] ', (0x1010, 4, 4)),
+							  ('cfg.m[2]', 'cfg.m[2]: index 2 out of range 0..1'),
+							  ('cfg.b', 'cfg.b: no member b'),
+							  ('cfg->a', 'cfg->a: -> or [] of something that isn\'t a pointer'),
+							  ('cfg.m[1]x', 'cfg.m[1]x: unexpected name x'),
+							  ('cf g.a', 'cf g.a: unexpected name g'),
+							  ('cfg.m[1', 'cfg.m[1: syntax error at \'[1\'') ]:
+		try:
+			a = pr.Compile(path)
+			result = (a.address, a.size, pr.Evaluate(path))
+		except DwarfError as e:
+			result = str(e)
+		Check('Compile(\'' + path + '\')', result, expected)
+	Check('Compiled once', pr.Compile('cfg.m[1][0]') is pr.Compile('cfg.m [1][0]'), True)
+	return
+
 DoTesting()
+TestNativeReaders()
+TestLazyRead()
+TestParallelRead()
+TestCache()
+TestDiffSymbols()
+TestDescribePath()
+TestAddressIndex()
+TestAddressIndexHugeSymbol()
+TestSymbolizer()
+TestLEB128()
+TestNameIndex()
+TestTypeInfo()
+TestUnifyTypes()
+TestValueDecoder()
+TestMemoryDump()
+TestStats()
+TestLineTable()
+TestPaths()
+if failures > 0:
+	print(failures, 'checks FAILED')
+	exit(1)
 exit(0)